@@ -1,82 +1,211 @@
-import os
-import psutil
-import shutil
-import subprocess
-import hashlib
+import argparse
 from datetime import datetime
-import time
-import platform
 
-def check_disk_space(drive="C:/", threshold=20):
-    total, used, free = shutil.disk_usage(drive)
-    free_percentage = (free / total) * 100
-    print(f"Drive: {drive}, Free Space: {free_percentage:.2f}%")
+import it_support as core
+from it_support.hashing import ALGORITHMS, DEFAULT_ALGORITHM, DEFAULT_WORKERS, new_hasher
+from it_support.hash_cache import DEFAULT_CACHE_PATH
+from it_support.logs import CODECS, DEFAULT_CODEC
+from it_support.agent import DEFAULT_CPU_BUDGET, DEFAULT_HOST, DEFAULT_PORT
+from it_support.instrument import DEFAULT_PROFILE_DIR, PROFILE_MODES
+from it_support.dedupe import METHODS
+from it_support.jobs import DEFAULT_CPU_SAMPLE, DEFAULT_JOBS, DEFAULT_TOP_PROCESSES, FORMATS, to_json
+
+def check_disk_space(drive=None, threshold=20):
+    drive = drive or core.DEFAULT_DRIVE
+    status = core.check_disk_space(drive, threshold)
+    print(f"Drive: {drive}, Free Space: {status.free_percent:.2f}%")
     
-    if free_percentage < threshold:
+    if status.below_threshold:
         print(f"Warning: Free space on {drive} is below {threshold}%!")
     else:
         print(f"Disk space is sufficient on {drive}.")
+    return status
+
+def scan_mounts(threshold=20):
+    statuses = core.scan_mounts(threshold, threshold)
+    print(core.format_mount_table(statuses))
+    breached = [status for status in statuses if status.below_threshold or status.inodes_below_threshold]
+    failed = [status for status in statuses if status.error]
+    print(f"{len(statuses)} filesystems checked, {len(breached)} below {threshold}% free, {len(failed)} unreadable.")
+    return statuses
 
-def monitor_bandwidth(interval=5):
-    counters = psutil.net_io_counters()
-    print(f"Bytes Sent: {counters.bytes_sent / (1024 ** 2):.2f} MB, Bytes Received: {counters.bytes_recv / (1024 ** 2):.2f} MB")
-    time.sleep(interval)
+def monitor_bandwidth(interval=5, per_nic=False):
+    totals = core.read_network_totals()
+    print(f"Bytes Sent: {core.to_mb(totals.bytes_sent):.2f} MB, Bytes Received: {core.to_mb(totals.bytes_recv):.2f} MB")
+    print(f"Streaming rates every {interval}s, press Ctrl+C to stop.")
+    sampler = core.BandwidthSampler(interval)
+    try:
+        for sample in sampler.run():
+            rates = [sample.total]
+            if per_nic:
+                rates += sorted(sample.interfaces.values(), key=lambda r: r.nic)
+            stamp = datetime.now().strftime("%H:%M:%S")
+            for rate in rates:
+                print(f"{stamp} {rate.nic:<10} Down: {core.format_rate(rate.bytes_recv):>12} "
+                      f"Up: {core.format_rate(rate.bytes_sent):>12} "
+                      f"Packets: {rate.packets_recv:.0f}/{rate.packets_sent:.0f} per s")
+    except KeyboardInterrupt:
+        print("Stopped monitoring bandwidth.")
+
+def list_processes(top=None, sort_by="rss", columns=None, refresh=0):
+    # refresh > 0 keeps redrawing every refresh seconds until Ctrl+C
+    columns = tuple(columns or core.DEFAULT_PROCESS_COLUMNS)
+    if sort_by not in columns:
+        columns += (sort_by,)
+    snapshot = core.ProcessSnapshot(columns)
+    try:
+        for _, cost in snapshot.watch(refresh, count=None if refresh > 0 else 1):
+            print(" | ".join(core.COLUMN_TITLES[column] for column in columns))
+            for proc in snapshot.top(top, sort_by):
+                print(" | ".join(core.format_column(column, getattr(proc, column)) for column in columns))
+            print(core.format_cost(cost))
+    except KeyboardInterrupt:
+        print("Stopped refreshing processes.")
 
-def list_processes():
-    for proc in psutil.process_iter(attrs=["pid", "name", "memory_info"]):
-        print(f"PID: {proc.info['pid']}, Name: {proc.info['name']}, Memory: {proc.info['memory_info'].rss / (1024 ** 2):.2f} MB")
+def watch_leaks(interval=10):
+    detector = core.LeakDetector()
+    print(f"Sampling every process every {interval}s, press Ctrl+C to stop.")
+    try:
+        for suspects in detector.watch(interval):
+            print(f"\n{datetime.now().strftime('%H:%M:%S')} {core.format_leaks(detector, suspects)}")
+    except KeyboardInterrupt:
+        print("Stopped watching for leaks.")
 
 def create_task(task_name, script_path, time="12:00"):
     try:
-        command = f"schtasks /create /tn {task_name} /tr {script_path} /sc once /st {time}"
-        subprocess.run(command, shell=True, check=True)
+        core.create_scheduled_task(task_name, script_path, time)
         print(f"Scheduled task '{task_name}' created.")
     except Exception as e:
         print(f"Failed to create scheduled task: {e}")
 
 def collect_inventory():
+    inventory, changes = core.collect_inventory_changes()
     print("System Information:")
-    print(f"OS: {platform.system()} {platform.release()}")
-    print(f"Processor: {platform.processor()}")
-    print(f"RAM: {psutil.virtual_memory().total / (1024 ** 3):.2f} GB")
-    print(f"Disk Space: {psutil.disk_usage('/').total / (1024 ** 3):.2f} GB")
-
-def rotate_logs(log_dir):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    archive_path = f"{log_dir}/archive_{timestamp}.zip"
-    
-    shutil.make_archive(archive_path, 'zip', log_dir)
-    print(f"Logs archived to {archive_path}")
-    
-    for file in os.listdir(log_dir):
-        if file.endswith(".log"):
-            os.remove(os.path.join(log_dir, file))
-    print("Old logs deleted.")
-
-def find_duplicates(directory):
-    seen = {}
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_hash = hash_file(file_path)
-            if file_hash in seen:
-                print(f"Duplicate found: {file_path} and {seen[file_hash]}")
-            else:
-                seen[file_hash] = file_path
+    print(core.format_inventory(inventory))
+    if changes is not None:
+        print(core.format_changes(changes))
+    return inventory
+
+def rotate_logs(log_dir, codec=DEFAULT_CODEC, workers=DEFAULT_WORKERS):
+    rotation = core.rotate_logs(log_dir, codec, workers=workers)
+    print(core.format_rotation(rotation))
+    return rotation
+
+def tail_logs(sources, rules_path=None, from_start=False):
+    rules = core.read_rules(rules_path) if rules_path else None
+    with core.LogTailer(sources, rules, from_start=from_start) as tailer:
+        print(f"Following {', '.join(sources)} ({tailer.backend}), press Ctrl+C to stop.")
+        try:
+            for alerts in tailer.follow():
+                for alert in alerts:
+                    print(core.format_alert(alert))
+        except KeyboardInterrupt:
+            print("Stopped following logs.")
+        print(core.format_tail_status(tailer))
+
+def find_duplicates(directory, workers=DEFAULT_WORKERS, algorithm=DEFAULT_ALGORITHM, cache_path=None,
+                    dedupe=None, dry_run=False):
+    # dedupe ("hardlink" or "reflink") goes on to replace the duplicates: a
+    # verified dry run is shown first, then applied once confirmed
+    cache = core.HashCache(cache_path) if cache_path else None
+    report = core.DuplicateReport()
+    groups = []
+    try:
+        for group in core.iter_duplicate_groups(directory, algorithm, workers=workers, cache=cache, report=report):
+            print(f"Duplicate group ({len(group.paths)} files, {core.format_size(group.size)} each):")
+            for path in group.paths:
+                print(f"  {path}")
+            if dedupe:
+                groups.append(group)
+    finally:
+        if cache:
+            cache.close()
+    if not report.group_count:
+        print("No duplicates found.")
+    print(core.format_stage_summary(report))
+    print(f"Reclaimable space: {core.format_size(report.wasted_bytes)}")
+    if dedupe and groups:
+        plan = core.dedupe_groups(groups, dedupe, dry_run=True, workers=workers)
+        print(core.format_dedupe(plan))
+        if not dry_run and plan.linked and input("Apply these changes? (y/N): ").strip().lower() == "y":
+            print(core.format_dedupe(core.dedupe_groups(groups, dedupe, dry_run=False, workers=workers)))
+    return report
+
+def find_similar(directory, min_size_mb=1, threshold=50, workers=DEFAULT_WORKERS, cache_path=None):
+    cache = core.HashCache(cache_path) if cache_path else None
+    try:
+        report = core.find_similar_files(directory, int(min_size_mb * 1024 * 1024), threshold / 100, workers,
+                                         cache=cache)
+    finally:
+        if cache:
+            cache.close()
+    print(core.format_similarity(report))
+    return report
+
+def undo_dedupe(journal_path):
+    print(core.format_dedupe(core.undo_dedupe(journal_path)))
+
+def analyze_disk_usage(directory, top=20, workers=DEFAULT_WORKERS):
+    def progress(directories, files):
+        print(f"  scanned {directories} directories, {files} files...", end="\r")
+    usage = core.analyze_usage(directory, top, workers, progress=progress)
+    print()
+    print(core.format_usage(usage, top))
+    return usage
+
+def track_user_sessions(days=7):
+    # Also records this look at the sessions in the session history, then
+    # reports the last few days of it
+    with core.SessionStore() as store:
+        for session in core.SessionRecorder(store).poll():
+            print(f"User: {session.name}, Terminal: {session.terminal}, "
+                  f"Started: {datetime.fromtimestamp(session.started)}")
+    session_report(days)
+
+def session_report(days=7):
+    end = datetime.now().timestamp()
+    with core.SessionStore() as store:
+        print(core.format_session_report(store, end - days * 86400, end))
 
-def hash_file(file_path):
-    hasher = hashlib.md5()
-    with open(file_path, "rb") as f:
-        while chunk := f.read(8192):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+def record_sessions(interval=None):
+    # sessions imports psutil, so its default is only looked up here
+    from it_support.sessions import DEFAULT_POLL_INTERVAL
+    interval = interval or DEFAULT_POLL_INTERVAL
+    print(f"Recording logins and logouts every {interval:.0f}s, press Ctrl+C to stop.")
+    with core.SessionStore() as store:
+        known = None
+        try:
+            for sessions in core.SessionRecorder(store).run(interval):
+                if len(sessions) != known:
+                    print(f"{datetime.now().strftime('%H:%M:%S')} {len(sessions)} sessions open")
+                    known = len(sessions)
+        except KeyboardInterrupt:
+            print("Stopped recording sessions.")
 
-def track_user_sessions():
-    sessions = psutil.users()
-    for session in sessions:
-        print(f"User: {session.name}, Terminal: {session.terminal}, Started: {session.started}")
+def prune_hash_cache(cache_path):
+    with core.HashCache(cache_path) as cache:
+        removed = cache.prune()
+        cache.compact()
+        print(f"Removed {removed} stale paths from {cache_path}, {cache.count()} digests kept.")
 
-def main():
+def timed(instrument, operation, func, *args, **kwargs):
+    # Runs one menu operation under the instrumentation layer and prints its
+    # timing summary afterwards, even when it failed. There is none when
+    # measure() itself failed, e.g. the profile directory can't be created.
+    stats = None
+    try:
+        with instrument.measure(operation) as stats:
+            return func(*args, **kwargs)
+    finally:
+        if stats is not None:
+            print(instrument.summary(stats))
+
+def show_timings(instrument):
+    print(core.format_history(instrument.history()))
+
+def main(workers=DEFAULT_WORKERS, algorithm=DEFAULT_ALGORITHM, cache_path=None, log_codec=DEFAULT_CODEC,
+         instrument=None, dedupe=None, dry_run=False):
+    instrument = instrument or core.Instrument()
     print("\n--- IT Support Tool Suite ---")
     while True:
         print("\nSelect an option:")
@@ -88,38 +217,286 @@ def main():
         print("6. Rotate Logs")
         print("7. Find Duplicate Files")
         print("8. Track User Sessions")
-        print("9. Exit")
+        print("9. Analyze Disk Usage")
+        print("10. Find Similar Files")
+        print("11. Tail Logs")
+        print("12. Watch for Memory Leaks")
+        print("13. Exit")
 
         choice = input("Enter your choice: ")
         if choice == "1":
-            drive = input("Enter drive letter (e.g., C:/): ")
+            drive = input(f"Enter drive letter (e.g., {core.DEFAULT_DRIVE}), or 'all' for every mounted filesystem: ")
             threshold = int(input("Enter space threshold percentage: "))
-            check_disk_space(drive, threshold)
+            if drive.strip().lower() == "all":
+                timed(instrument, "Scan Mounts", scan_mounts, threshold)
+            else:
+                timed(instrument, "Check Disk Space", check_disk_space, drive, threshold)
         elif choice == "2":
-            interval = int(input("Enter monitoring interval (seconds): "))
-            monitor_bandwidth(interval)
+            interval = float(input("Enter monitoring interval (seconds): "))
+            per_nic = input("Show each network interface? (y/N): ").strip().lower() == "y"
+            timed(instrument, "Monitor Bandwidth", monitor_bandwidth, interval, per_nic)
         elif choice == "3":
-            list_processes()
+            sort_by = input(f"Sort by ({', '.join(core.PROCESS_COLUMNS)}) [rss]: ").strip() or "rss"
+            top = input("Show how many processes (blank for all): ").strip()
+            refresh = input("Refresh every N seconds (blank for once): ").strip()
+            timed(instrument, "List Processes", list_processes, int(top) if top else None, sort_by,
+                  refresh=float(refresh) if refresh else 0)
         elif choice == "4":
             task_name = input("Enter task name: ")
             script_path = input("Enter script path: ")
             time = input("Enter time (HH:MM): ")
-            create_task(task_name, script_path, time)
+            timed(instrument, "Create Task", create_task, task_name, script_path, time)
         elif choice == "5":
-            collect_inventory()
+            timed(instrument, "System Inventory", collect_inventory)
         elif choice == "6":
             log_dir = input("Enter log directory path: ")
-            rotate_logs(log_dir)
+            timed(instrument, "Rotate Logs", rotate_logs, log_dir, log_codec, workers)
         elif choice == "7":
             directory = input("Enter directory to check for duplicates: ")
-            find_duplicates(directory)
+            timed(instrument, "Find Duplicates", find_duplicates, directory, workers, algorithm, cache_path,
+                  dedupe, dry_run)
         elif choice == "8":
-            track_user_sessions()
+            timed(instrument, "User Sessions", track_user_sessions)
         elif choice == "9":
+            directory = input("Enter directory to analyze: ")
+            top = input("Show how many of the largest directories and files [20]: ").strip()
+            timed(instrument, "Disk Usage", analyze_disk_usage, directory, int(top) if top else 20, workers)
+        elif choice == "10":
+            directory = input("Enter directory to check for similar files: ")
+            min_size = input("Only compare files of at least N MB [1]: ").strip()
+            threshold = input("Report pairs overlapping by at least N% [50]: ").strip()
+            timed(instrument, "Find Similar", find_similar, directory, float(min_size) if min_size else 1,
+                  float(threshold) if threshold else 50, workers, cache_path)
+        elif choice == "11":
+            source = input("Enter log file or directory to follow: ")
+            timed(instrument, "Tail Logs", tail_logs, [source])
+        elif choice == "12":
+            interval = input("Sample every N seconds [10]: ").strip()
+            timed(instrument, "Leak Watch", watch_leaks, float(interval) if interval else 10)
+        elif choice == "13":
             print("Exiting the tool suite. Goodbye!")
             break
         else:
             print("Invalid choice. Please try again.")
 
+def run_agent(host=DEFAULT_HOST, port=DEFAULT_PORT, cpu_budget=DEFAULT_CPU_BUDGET, rules_path=None):
+    # Threshold alerts are printed as they fire and resolve, from the
+    # default rules unless a rules file is given
+    rules = core.read_threshold_rules(rules_path) if rules_path else None
+    alerts = core.AlertEngine(rules, notify=lambda alert: print(core.format_threshold_alert(alert), flush=True))
+
+    def ready(agent):
+        bound_host, bound_port = agent.address
+        if ":" in bound_host:
+            bound_host = f"[{bound_host}]"
+        print(f"Agent serving http://{bound_host}:{bound_port}/metrics (and /metrics.json), "
+              f"CPU budget {cpu_budget:.1%} of one core, {len(alerts.rules)} alert rules. Press Ctrl+C to stop.")
+    core.run_agent(host, port, cpu_budget, ready=ready, alerts=alerts)
+    print("Agent stopped.")
+
+def fleet_inventory(hosts_path, user=None, port=None, concurrency=64, timeout=30.0, local=False):
+    import sys
+    from it_support import fleet
+    hosts = fleet.read_hosts(hosts_path)
+    transport = fleet.LocalTransport() if local else fleet.SSHTransport(user=user, port=port)
+    started = datetime.now()
+    succeeded, failed = fleet.run_fleet_inventory(hosts, sys.stdout, transport, concurrency, timeout)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Inventoried {succeeded} of {len(hosts)} hosts in {elapsed:.1f}s, {failed} failed.", file=sys.stderr)
+    return succeeded, failed
+
+def job_options(name, args):
+    # Options of one job from the parsed subcommand; dupes and rotate also
+    # take the global --workers, --hash, --cache and --log-codec
+    if name == "disk":
+        return {"threshold": args.threshold, "drive": args.drive}
+    if name == "procs":
+        return {"top": args.top, "sort_by": args.sort, "columns": args.columns, "cpu_sample": args.cpu_sample}
+    if name == "dupes":
+        return {"directory": args.directory, "algorithm": args.algorithm, "workers": args.workers,
+                "cache_path": args.cache_path}
+    if name == "rotate":
+        return {"log_dir": args.log_dir, "codec": args.log_codec, "workers": args.workers}
+    if name == "sessions":
+        return {"record": not args.no_record, "days": args.days}
+    return {}
+
+def run_batch(args):
+    # Runs a subcommand without the menu and prints its result as JSON, or
+    # one JSON line per job as it finishes with --format ndjson. Returns the
+    # exit status: 1 if any job failed.
+    if args.command == "run-all":
+        names = list(DEFAULT_JOBS) + (["dupes"] if args.directory else []) + (["rotate"] if args.log_dir else [])
+    else:
+        names = [args.command]
+    ndjson = args.format == "ndjson"
+
+    def emit(result):
+        print(result.to_json(), flush=True)
+
+    results, seconds = core.run_jobs([(name, job_options(name, args)) for name in names],
+                                     on_result=emit if ndjson else None)
+    summary = core.run_summary(results, seconds)
+    if args.command != "run-all":
+        if not ndjson:
+            print(results[0].to_json(indent=2))
+    elif ndjson:
+        print(to_json(summary), flush=True)
+    else:
+        summary["jobs"] = [result.to_dict() for result in results]
+        print(to_json(summary, indent=2))
+    return 0 if summary["ok"] else 1
+
+def add_subcommands(parser):
+    # Each subcommand runs one job (run-all several at once) and exits, for
+    # cron and scripts; without one, the interactive menu is shown
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--format", default="json", choices=FORMATS,
+                        help="one JSON document, or one JSON line per job as it finishes (default: json)")
+    disk = argparse.ArgumentParser(add_help=False)
+    disk.add_argument("--threshold", type=float, default=20, help="free space percentage to flag (default: 20)")
+    procs = argparse.ArgumentParser(add_help=False)
+    procs.add_argument("--top", type=int, default=DEFAULT_TOP_PROCESSES,
+                       help=f"processes to list (default: {DEFAULT_TOP_PROCESSES})")
+    # Not choices=core.PROCESS_COLUMNS: that would load processes, and psutil
+    # with it, on every start. The procs job reports an unknown column.
+    procs.add_argument("--sort", default="rss", help="column to sort by (default: rss)")
+    procs.add_argument("--columns", type=lambda value: tuple(value.split(",")),
+                       help="comma-separated process columns to report")
+    procs.add_argument("--cpu-sample", type=float, default=DEFAULT_CPU_SAMPLE, metavar="SECONDS",
+                       help=f"time CPU use is measured over; 0 skips it (default: {DEFAULT_CPU_SAMPLE})")
+    sessions = argparse.ArgumentParser(add_help=False)
+    sessions.add_argument("--days", type=float, help="also summarize this many days of the session history")
+    sessions.add_argument("--no-record", action="store_true",
+                          help="do not record the current sessions in the session history")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    command = subparsers.add_parser("disk", parents=[output, disk], help="free space of every filesystem")
+    command.add_argument("--drive", help="check only this drive or mount point")
+    subparsers.add_parser("procs", parents=[output, procs], help="the largest processes")
+    command = subparsers.add_parser("dupes", parents=[output], help="duplicate files under a directory")
+    command.add_argument("directory")
+    command = subparsers.add_parser("rotate", parents=[output], help="archive and remove the logs in a directory")
+    command.add_argument("log_dir")
+    subparsers.add_parser("inventory", parents=[output], help="hardware and software inventory")
+    subparsers.add_parser("sessions", parents=[output, sessions], help="logged-in user sessions")
+    command = subparsers.add_parser("run-all", parents=[output, disk, procs, sessions],
+                                    help=f"run {', '.join(DEFAULT_JOBS)} at the same time and report the total "
+                                         "wall time")
+    command.set_defaults(drive=None)
+    command.add_argument("--dupes", dest="directory", metavar="DIR", help="also find duplicate files under DIR")
+    command.add_argument("--rotate", dest="log_dir", metavar="LOG_DIR", help="also rotate the logs in LOG_DIR")
+
+def listen_address(value):
+    # HOST:PORT for --listen; an IPv6 host goes in brackets, as in a URL:
+    # [::1]:9717
+    from urllib.parse import urlsplit
+    try:
+        address = urlsplit("//" + value)
+        port = address.port
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid address '{value}': {e}") from None
+    if port is None:
+        raise argparse.ArgumentTypeError(f"invalid address '{value}': expected HOST:PORT")
+    return address.hostname or DEFAULT_HOST, port
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="IT Support Tool Suite")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"worker threads for duplicate search and log rotation (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--hash", dest="algorithm", default=DEFAULT_ALGORITHM, choices=ALGORITHMS,
+                        help="digest used to compare files (default: md5)")
+    parser.add_argument("--cache", dest="cache_path", nargs="?", const=DEFAULT_CACHE_PATH,
+                        help=f"reuse digests from an on-disk hash cache (default path: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--log-codec", default=DEFAULT_CODEC, choices=CODECS,
+                        help="compression for rotated logs; zstd needs the zstandard package (default: gzip)")
+    parser.add_argument("--dedupe", choices=METHODS,
+                        help="after finding duplicates, replace them with hard links or reflinks: every file is "
+                             "compared byte for byte first and a dry run is shown before asking to go ahead")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="with --dedupe, only report what would be replaced and reclaimed")
+    parser.add_argument("--undo-dedupe", metavar="JOURNAL",
+                        help="give every file replaced by a dedupe run its own copy back, from its undo journal")
+    parser.add_argument("--tail", nargs="+", metavar="PATH",
+                        help="follow log files, or the *.log files in directories, and print rule alerts")
+    parser.add_argument("--rules", metavar="FILE",
+                        help="with --tail, alert rules to use, one 'name[:severity] = regex' per line")
+    parser.add_argument("--from-start", action="store_true",
+                        help="with --tail, read the files from the start rather than only new lines")
+    parser.add_argument("--record-sessions", action="store_true",
+                        help="record user logins and logouts to the session history until Ctrl+C")
+    parser.add_argument("--session-report", type=float, metavar="DAYS",
+                        help="print logins per user, the longest sessions and concurrent sessions per hour "
+                             "over the last DAYS days of the session history and exit")
+    parser.add_argument("--prune-cache", action="store_true",
+                        help="drop cache entries for deleted or changed files and compact the cache")
+    parser.add_argument("--agent", action="store_true",
+                        help="run unattended: collect on a schedule and serve the results over HTTP")
+    parser.add_argument("--alert-rules", metavar="FILE",
+                        help="threshold alert rules for the agent, one "
+                             "'name[:severity] = metric op value [clear value] [for time] [repeat time]' per line")
+    parser.add_argument("--listen", type=listen_address, default=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        metavar="HOST:PORT",
+                        help="address the agent serves metrics on, IPv6 hosts in brackets as in [::1]:9717 "
+                             f"(default: {DEFAULT_HOST}:{DEFAULT_PORT})")
+    parser.add_argument("--fleet", metavar="HOSTS_FILE",
+                        help="collect the inventory of every host in HOSTS_FILE (one per line, - for stdin) "
+                             "over SSH and print one JSON line per host")
+    parser.add_argument("--ssh-user", help="log in to fleet hosts as this user")
+    parser.add_argument("--ssh-port", type=int, help="SSH port of the fleet hosts")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="fleet hosts queried at the same time (default: 64)")
+    parser.add_argument("--host-timeout", type=float, default=30.0,
+                        help="seconds before a fleet host is reported as timed out (default: 30)")
+    parser.add_argument("--local-transport", action="store_true",
+                        help="run fleet commands on this machine instead of over SSH, for trying the fleet mode out")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="also write a cProfile or tracemalloc capture of every operation run from the menu")
+    parser.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR,
+                        help=f"directory profile captures are written to (default: {DEFAULT_PROFILE_DIR})")
+    parser.add_argument("--timings", action="store_true",
+                        help="print the recorded timings of every operation and exit")
+    parser.add_argument("--cpu-budget", type=float, default=DEFAULT_CPU_BUDGET, metavar="FRACTION",
+                        help=f"share of one core the agent may spend collecting (default: {DEFAULT_CPU_BUDGET})")
+    add_subcommands(parser)
+    args = parser.parse_args(argv)
+    # The xxh* choices need the optional xxhash package; without it the
+    # search would only fail once the menu is running
+    try:
+        new_hasher(args.algorithm)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.command:
+        raise SystemExit(run_batch(args))
+    if args.prune_cache:
+        prune_hash_cache(args.cache_path or DEFAULT_CACHE_PATH)
+        raise SystemExit
+    if args.fleet:
+        fleet_inventory(args.fleet, args.ssh_user, args.ssh_port, args.concurrency, args.host_timeout,
+                        args.local_transport)
+        raise SystemExit
+    if args.agent:
+        host, port = args.listen
+        run_agent(host, port, args.cpu_budget, args.alert_rules)
+        raise SystemExit
+    instrument = core.Instrument(profile=args.profile, profile_dir=args.profile_dir)
+    if args.timings:
+        show_timings(instrument)
+        raise SystemExit
+    if args.undo_dedupe:
+        undo_dedupe(args.undo_dedupe)
+        raise SystemExit
+    if args.tail:
+        timed(instrument, "Tail Logs", tail_logs, args.tail, args.rules, args.from_start)
+        raise SystemExit
+    if args.record_sessions:
+        record_sessions()
+        raise SystemExit
+    if args.session_report:
+        timed(instrument, "Session Report", session_report, args.session_report)
+        raise SystemExit
+    main(args.workers, args.algorithm, args.cache_path, args.log_codec, instrument, args.dedupe, args.dry_run)
@@ -1,19 +1,48 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import os
-import psutil
-import shutil
-import subprocess
-import hashlib
+import time
 from datetime import datetime
-import platform
 from ttkthemes import ThemedTk
 
+from it_support import (DEFAULT_DRIVE, PROFILE_MODES, BandwidthSampler, DuplicateReport, Instrument,
+                        LeakDetector, LogTailer, ProcessSnapshot, ResultSet, ResultsTable, SessionRecorder,
+                        SessionStore, SimilarityReport, TaskRunner, UsageTree, analyze_usage,
+                        check_disk_space, collect_inventory_changes, create_scheduled_task, duplicate_columns,
+                        duplicate_rows, find_similar_files, format_alert, format_changes, format_cost,
+                        format_history, format_inventory, format_leaks, format_mount_table, format_progress,
+                        format_rate, format_rotation, format_rule_counts, format_session_report,
+                        format_similarity_summary, format_size, format_stage_summary, format_usage,
+                        iter_batches, iter_duplicate_groups, process_columns, process_rows,
+                        read_network_totals, rotate_logs, scan_mounts, similarity_columns, similarity_rows,
+                        sparkline, to_mb)
+
+# Streamed lines are handed to the output area in batches of up to
+# STREAM_BATCH lines, or sooner once STREAM_FLUSH_SECONDS have passed
+STREAM_BATCH = 200
+STREAM_FLUSH_SECONDS = 0.1
+# Table rows are handed over in batches of up to TABLE_BATCH rows
+TABLE_BATCH = 5000
+# Seconds between live bandwidth updates and the width of the history graph
+BANDWIDTH_INTERVAL = 1.0
+BANDWIDTH_GRAPH_WIDTH = 40
+# Seconds between samples of the leak watch
+LEAK_INTERVAL = 10.0
+# Days of session history reported under the current sessions
+SESSION_REPORT_DAYS = 7
+
 class ITSupportGUI:
-    def __init__(self, root):
+    def __init__(self, root, instrument=None):
         self.root = root
+        self.instrument = instrument or Instrument()
         self.root.title("🛠️ IT Support Tool Suite")
         self.root.geometry("900x700")
+        self._stream_id = 0
+        self._stream_task = None
+        self._table_shown = False
+        self.process_snapshot = ProcessSnapshot()
+        self.runner = TaskRunner(root, on_change=self.update_task_indicator,
+                                 instrument=self.instrument, on_stats=self.show_timing)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Set custom colors
         self.colors = {
@@ -61,9 +90,15 @@ class ITSupportGUI:
         self.output_text.grid(row=1, column=0, columnspan=2, pady=10)
         
         # Create scrollbar with custom colors
-        scrollbar = ttk.Scrollbar(main_frame, orient='vertical', command=self.output_text.yview)
-        scrollbar.grid(row=1, column=2, sticky='ns')
-        self.output_text['yscrollcommand'] = scrollbar.set
+        self.output_scrollbar = ttk.Scrollbar(main_frame, orient='vertical', command=self.output_text.yview)
+        self.output_scrollbar.grid(row=1, column=2, sticky='ns')
+        self.output_text['yscrollcommand'] = self.output_scrollbar.set
+
+        # Results that can run to many thousands of rows are shown in a
+        # virtualized table that takes the text area's place
+        self.results_table = ResultsTable(main_frame, height=18)
+        self.results_table.frame.grid(row=1, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.results_table.frame.grid_remove()
         
         # Create buttons frame
         button_frame = ttk.Frame(main_frame, style='Custom.TFrame')
@@ -74,11 +109,16 @@ class ITSupportGUI:
             ("💾 Check Disk Space", self.check_disk_dialog),
             ("📊 Monitor Bandwidth", self.monitor_bandwidth),
             ("📝 List Processes", self.list_processes),
+            ("🩺 Leak Watch", self.watch_leaks),
             ("⏰ Create Task", self.create_task_dialog),
             ("🖥️ System Inventory", self.collect_inventory),
             ("📁 Rotate Logs", self.rotate_logs_dialog),
+            ("📜 Tail Logs", self.tail_logs_dialog),
             ("🔍 Find Duplicates", self.find_duplicates_dialog),
-            ("👥 User Sessions", self.track_user_sessions)
+            ("🧩 Similar Files", self.find_similar_dialog),
+            ("👥 User Sessions", self.track_user_sessions),
+            ("📦 Disk Usage", self.disk_usage_dialog),
+            ("⏱ Timings", self.show_timings)
         ]
         
         # Create animated buttons with hover effect
@@ -99,24 +139,148 @@ class ITSupportGUI:
             btn.bind('<Enter>', lambda e, b=btn: self.on_hover(b))
             btn.bind('<Leave>', lambda e, b=btn: self.on_leave(b))
 
+        # Running-task indicator with a cancel button
+        status_frame = ttk.Frame(main_frame, style='Custom.TFrame')
+        status_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        self.status_label = tk.Label(status_frame,
+                                     text="✅ Ready",
+                                     bg=self.colors['bg'],
+                                     fg=self.colors['fg'],
+                                     font=('Helvetica', 10),
+                                     anchor='w')
+        self.status_label.pack(side='left', fill='x', expand=True)
+        self.cancel_button = tk.Button(status_frame,
+                                       text="✖ Cancel",
+                                       command=self.runner.cancel_all,
+                                       state='disabled',
+                                       bg=self.colors['button_bg'],
+                                       fg=self.colors['fg'])
+        self.cancel_button.pack(side='right')
+
     def on_hover(self, button):
         button.configure(bg=self.colors['button_hover'])
 
     def on_leave(self, button):
         button.configure(bg=self.colors['button_bg'])
 
+    def on_close(self):
+        self.runner.shutdown()
+        self.root.destroy()
+
+    def update_task_indicator(self, tasks):
+        if tasks:
+            running = ", ".join(f"{t.name} ({t.status})" if t.status else t.name for t in tasks)
+            self.status_label.configure(text=f"⏳ Running: {running}")
+            self.cancel_button.configure(state='normal')
+        else:
+            self.status_label.configure(text="✅ Ready")
+            self.cancel_button.configure(state='disabled')
+
+    def show_timing(self, task, stats):
+        # Every finished task gets its timing summary under its output;
+        # cancelled runs are only recorded in the history
+        if stats.error == "Cancelled":
+            return
+        if self._table_shown:
+            self.results_table.append_summary(self.instrument.summary(stats))
+        else:
+            self.output_text.insert(tk.END, f"\n\n{self.instrument.summary(stats)}")
+
+    def show_timings(self):
+        self.write_output(f"Timings of recent runs:\n\n{format_history(self.instrument.history())}")
+
+    def show_table(self, shown):
+        # Swaps the text area for the results table or back
+        if shown == self._table_shown:
+            return
+        self._table_shown = shown
+        if shown:
+            self.output_text.grid_remove()
+            self.output_scrollbar.grid_remove()
+            self.results_table.frame.grid()
+        else:
+            self.results_table.frame.grid_remove()
+            self.output_text.grid()
+            self.output_scrollbar.grid()
+
     def write_output(self, text):
+        self._stream_id += 1
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+            self._stream_task = None
+        self.show_table(False)
         self.output_text.delete(1.0, tk.END)
         self.output_text.insert(tk.END, f"✨ {text}")
 
+    def run_task(self, name, func, *args, error_message=None):
+        # Runs func(task, *args) on the worker pool and shows the text it
+        # returns once it finishes
+        def failed(error):
+            self.write_output(f"{error_message or 'Error in ' + name}: {error}")
+        return self.runner.submit(name, func, *args, on_done=self.write_output, on_error=failed)
+
+    def stream_output(self, name, make_chunks, header="", footer=None, batch_size=STREAM_BATCH):
+        # make_chunks(task) returns a generator of text chunks that is run on
+        # the worker pool; its output is appended in batches as it arrives.
+        # footer is called on the worker once the generator is exhausted.
+        # Starting another output cancels a stream that is still running.
+        self.write_output(header)
+        stream_id = self._stream_id
+
+        def work(task):
+            for text in iter_batches(make_chunks(task), batch_size, STREAM_FLUSH_SECONDS, task.check):
+                task.emit(text)
+            return footer() if footer else ""
+
+        def append(text):
+            if stream_id == self._stream_id:
+                self.output_text.insert(tk.END, text)
+
+        def failed(error):
+            append(f"\nError in {name}: {error}")
+
+        self._stream_task = self.runner.submit(name, work, on_item=append, on_done=append, on_error=failed)
+
+    def show_results(self, name, columns, make_rows, footer=None, sort=None):
+        # Like stream_output for results that can run to millions of rows:
+        # make_rows(task) returns an iterable of row tuples that is consumed
+        # on the worker pool, and the rows are shown in the results table as
+        # they arrive. sort is an optional (column, descending) pair.
+        self.write_output("")
+        stream_id = self._stream_id
+        results = ResultSet(columns)
+        if sort:
+            results.sort(*sort)
+        self.show_table(True)
+        self.results_table.show(results)
+
+        def work(task):
+            for rows in iter_batches(make_rows(task), TABLE_BATCH, STREAM_FLUSH_SECONDS, task.check, join=list):
+                task.emit(rows)
+            return footer() if footer else ""
+
+        def add(rows):
+            if stream_id == self._stream_id:
+                results.extend(rows)
+                self.results_table.refresh()
+
+        def finish(text):
+            if stream_id == self._stream_id:
+                self.results_table.set_summary(text)
+
+        def failed(error):
+            finish(f"Error in {name}: {error}")
+
+        self._stream_task = self.runner.submit(name, work, on_item=add, on_done=finish, on_error=failed)
+
     def check_disk_dialog(self):
         dialog = tk.Toplevel(self.root)
         dialog.title("Check Disk Space")
-        dialog.geometry("300x150")
+        dialog.geometry("320x150")
         
         ttk.Label(dialog, text="Drive:").grid(row=0, column=0, padx=5, pady=5)
         drive_entry = ttk.Entry(dialog)
-        drive_entry.insert(0, "C:/")
+        drive_entry.insert(0, DEFAULT_DRIVE)
         drive_entry.grid(row=0, column=1, padx=5, pady=5)
         
         ttk.Label(dialog, text="Threshold (%):").grid(row=1, column=0, padx=5, pady=5)
@@ -124,33 +288,98 @@ class ITSupportGUI:
         threshold_entry.insert(0, "20")
         threshold_entry.grid(row=1, column=1, padx=5, pady=5)
         
-        def check():
-            drive = drive_entry.get()
-            threshold = int(threshold_entry.get())
-            total, used, free = shutil.disk_usage(drive)
-            free_percentage = (free / total) * 100
-            result = f"Drive: {drive}\nFree Space: {free_percentage:.2f}%\n"
-            if free_percentage < threshold:
+        def work(task, drive, threshold):
+            status = check_disk_space(drive, threshold)
+            result = f"Drive: {drive}\nFree Space: {status.free_percent:.2f}%\n"
+            if status.below_threshold:
                 result += f"Warning: Free space on {drive} is below {threshold}%!"
             else:
                 result += f"Disk space is sufficient on {drive}."
-            self.write_output(result)
+            return result
+
+        def check():
+            drive = drive_entry.get()
+            threshold = int(threshold_entry.get())
+            self.run_task("Check Disk Space", work, drive, threshold)
             dialog.destroy()
         
-        ttk.Button(dialog, text="Check", command=check).grid(row=2, column=0, columnspan=2, pady=10)
+        def scan_all(task, threshold):
+            return format_mount_table(scan_mounts(threshold, threshold))
+
+        def check_all():
+            threshold = int(threshold_entry.get())
+            self.write_output("Scanning all mounted filesystems...")
+            self.run_task("Scan Mounts", scan_all, threshold, error_message="Error scanning mounts")
+            dialog.destroy()
+
+        ttk.Button(dialog, text="Check", command=check).grid(row=2, column=0, pady=10)
+        ttk.Button(dialog, text="Scan All Mounts", command=check_all).grid(row=2, column=1, pady=10)
 
     def monitor_bandwidth(self):
-        counters = psutil.net_io_counters()
-        result = f"Bytes Sent: {counters.bytes_sent / (1024 ** 2):.2f} MB\n"
-        result += f"Bytes Received: {counters.bytes_recv / (1024 ** 2):.2f} MB"
-        self.write_output(result)
+        # Live view that refreshes every BANDWIDTH_INTERVAL seconds; clicking
+        # the button again (or Cancel) stops it
+        if self._stream_task is not None and self._stream_task.name == "Monitor Bandwidth":
+            self._stream_task.cancel()
+            self._stream_task = None
+            return
+        self.write_output("Sampling network counters...")
+        stream_id = self._stream_id
+
+        def work(task):
+            sampler = BandwidthSampler(interval=BANDWIDTH_INTERVAL)
+            for sample in sampler.run(wait=task.wait):
+                task.emit(self.format_bandwidth(sampler, sample))
+
+        def show(text):
+            if stream_id == self._stream_id:
+                self.output_text.delete(1.0, tk.END)
+                self.output_text.insert(tk.END, f"✨ {text}")
+
+        self._stream_task = self.runner.submit("Monitor Bandwidth", work, on_item=show)
+
+    def format_bandwidth(self, sampler, sample):
+        totals = read_network_totals()
+        result = f"Bytes Sent: {to_mb(totals.bytes_sent):.2f} MB\n"
+        result += f"Bytes Received: {to_mb(totals.bytes_recv):.2f} MB\n\n"
+        recv, sent = sampler.history["total"]
+        result += f"Receive {sparkline(recv, BANDWIDTH_GRAPH_WIDTH)}\n"
+        result += f"Send    {sparkline(sent, BANDWIDTH_GRAPH_WIDTH)}\n\n"
+        for rate in [sample.total] + sorted(sample.interfaces.values(), key=lambda r: r.nic):
+            result += (f"{rate.nic:<12} down {format_rate(rate.bytes_recv):>14}  up {format_rate(rate.bytes_sent):>14}  "
+                       f"packets {rate.packets_recv:.0f}/{rate.packets_sent:.0f} per s\n")
+        return result
+
+    def watch_leaks(self):
+        # Live view of the processes whose memory keeps growing, refreshed
+        # every LEAK_INTERVAL seconds; clicking the button again (or Cancel)
+        # stops it
+        if self._stream_task is not None and self._stream_task.name == "Leak Watch":
+            self._stream_task.cancel()
+            self._stream_task = None
+            return
+        self.write_output("Sampling processes...")
+        stream_id = self._stream_id
+
+        def work(task):
+            detector = LeakDetector()
+            for suspects in detector.watch(LEAK_INTERVAL, wait=task.wait):
+                task.emit(format_leaks(detector, suspects))
+
+        def show(text):
+            if stream_id == self._stream_id:
+                self.output_text.delete(1.0, tk.END)
+                self.output_text.insert(tk.END, f"✨ Watching for memory leaks (live, click again to stop):\n\n{text}")
+
+        self._stream_task = self.runner.submit("Leak Watch", work, on_item=show)
 
     def list_processes(self):
-        result = ""
-        for proc in psutil.process_iter(attrs=["pid", "name", "memory_info"]):
-            result += f"PID: {proc.info['pid']}, Name: {proc.info['name']}, "
-            result += f"Memory: {proc.info['memory_info'].rss / (1024 ** 2):.2f} MB\n"
-        self.write_output(result)
+        # The snapshot is kept between clicks so CPU % is measured since the
+        # previous listing
+        def rows(task):
+            self.process_snapshot.refresh()
+            return process_rows(self.process_snapshot.rows)
+        self.show_results("List Processes", process_columns(), rows, sort=("rss", True),
+                          footer=lambda: format_cost(self.process_snapshot.last_cost))
 
     def create_task_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -169,75 +398,135 @@ class ITSupportGUI:
         time_entry = ttk.Entry(dialog)
         time_entry.grid(row=2, column=1, padx=5, pady=5)
         
+        def work(task, name, path, start_time):
+            create_scheduled_task(name, path, start_time)
+            return f"Scheduled task '{name}' created."
+
         def create():
-            try:
-                command = f"schtasks /create /tn {name_entry.get()} /tr {path_entry.get()} /sc once /st {time_entry.get()}"
-                subprocess.run(command, shell=True, check=True)
-                self.write_output(f"Scheduled task '{name_entry.get()}' created.")
-            except Exception as e:
-                self.write_output(f"Failed to create scheduled task: {e}")
+            self.run_task("Create Task", work, name_entry.get(), path_entry.get(), time_entry.get(),
+                          error_message="Failed to create scheduled task")
             dialog.destroy()
         
         ttk.Button(dialog, text="Create", command=create).grid(row=3, column=0, columnspan=2, pady=10)
 
     def collect_inventory(self):
-        result = "System Information:\n"
-        result += f"OS: {platform.system()} {platform.release()}\n"
-        result += f"Processor: {platform.processor()}\n"
-        result += f"RAM: {psutil.virtual_memory().total / (1024 ** 3):.2f} GB\n"
-        result += f"Disk Space: {psutil.disk_usage('/').total / (1024 ** 3):.2f} GB"
-        self.write_output(result)
+        def work(task):
+            inventory, changes = collect_inventory_changes()
+            result = "System Information:\n" + format_inventory(inventory)
+            if changes is not None:
+                result += "\n\n" + format_changes(changes)
+            return result
+        self.run_task("System Inventory", work)
 
     def rotate_logs_dialog(self):
         log_dir = filedialog.askdirectory(title="Select Log Directory")
         if log_dir:
-            try:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                archive_path = f"{log_dir}/archive_{timestamp}"
-                shutil.make_archive(archive_path, 'zip', log_dir)
-                
-                for file in os.listdir(log_dir):
-                    if file.endswith(".log"):
-                        os.remove(os.path.join(log_dir, file))
-                
-                self.write_output(f"Logs archived to {archive_path}.zip\nOld logs deleted.")
-            except Exception as e:
-                self.write_output(f"Error rotating logs: {e}")
+            def work(task):
+                rotation = rotate_logs(log_dir, check_cancelled=task.check)
+                return format_rotation(rotation)
+            self.write_output(f"Rotating logs in {log_dir}...")
+            self.run_task("Rotate Logs", work, error_message="Error rotating logs")
+
+    def tail_logs_dialog(self):
+        # Streams alerts from the logs until the button is clicked again (or
+        # Cancel); the per-rule counters are shown in the running-task line
+        if self._stream_task is not None and self._stream_task.name == "Tail Logs":
+            self._stream_task.cancel()
+            self._stream_task = None
+            return
+        log_dir = filedialog.askdirectory(title="Select Log Directory to Follow")
+        if log_dir:
+            def lines(task):
+                with LogTailer([log_dir]) as tailer:
+                    reported = time.monotonic()
+                    for alerts in tailer.follow(wait=task.wait):
+                        for alert in alerts:
+                            yield format_alert(alert) + "\n"
+                        # Lets a quiet spell flush the alerts still batched
+                        yield ""
+                        if time.monotonic() - reported >= 1:
+                            reported = time.monotonic()
+                            task.progress(f"{tailer.rules.lines:,} lines, {format_rule_counts(tailer.rules)}")
+
+            self.stream_output("Tail Logs", lines, header=f"Following the logs in {log_dir}...\n\n")
 
     def find_duplicates_dialog(self):
         directory = filedialog.askdirectory(title="Select Directory to Check for Duplicates")
         if directory:
-            result = ""
-            seen = {}
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    file_hash = self.hash_file(file_path)
-                    if file_hash in seen:
-                        result += f"Duplicate found:\n{file_path}\nand\n{seen[file_hash]}\n\n"
-                    else:
-                        seen[file_hash] = file_path
-            self.write_output(result if result else "No duplicates found.")
-
-    def hash_file(self, file_path):
-        hasher = hashlib.md5()
-        with open(file_path, "rb") as f:
-            while chunk := f.read(8192):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+            report = DuplicateReport()
+
+            def rows(task):
+                def progress(stage, done, total):
+                    task.progress(format_progress(stage, done, total))
+                groups = iter_duplicate_groups(directory, report=report, progress=progress)
+                for number, group in enumerate(groups, 1):
+                    yield from duplicate_rows(number, group)
+
+            def summary():
+                result = "" if report.group_count else "No duplicates found.\n"
+                result += format_stage_summary(report)
+                return result + f"\nReclaimable space: {format_size(report.wasted_bytes)}"
+
+            self.show_results("Find Duplicates", duplicate_columns(), rows, footer=summary)
+
+    def find_similar_dialog(self):
+        directory = filedialog.askdirectory(title="Select Directory to Check for Similar Files")
+        if directory:
+            report = SimilarityReport()
+
+            def rows(task):
+                def progress(stage, done, total):
+                    task.progress(format_progress(stage, done, total))
+                find_similar_files(directory, progress=progress, check_cancelled=task.check, report=report)
+                return similarity_rows(report.pairs)
+
+            def summary():
+                result = "" if report.pairs else "No similar files found.\n"
+                return result + format_similarity_summary(report)
+
+            self.show_results("Find Similar", similarity_columns(), rows, footer=summary, sort=("shared", True))
+
+    def disk_usage_dialog(self):
+        directory = filedialog.askdirectory(title="Select Directory to Analyze")
+        if directory:
+            def work(task):
+                def progress(directories, files):
+                    task.progress(f"scanned {directories} directories, {files} files")
+                return analyze_usage(directory, progress=progress, check_cancelled=task.check)
+
+            def show(usage):
+                self.write_output(format_usage(usage))
+                window = tk.Toplevel(self.root)
+                window.title(f"Disk Usage - {usage.root}")
+                window.geometry("760x520")
+                UsageTree(window, usage).frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+            def failed(error):
+                self.write_output(f"Error analyzing disk usage: {error}")
+
+            self.write_output(f"Analyzing disk usage in {directory}...")
+            self.runner.submit("Disk Usage", work, on_done=show, on_error=failed)
 
     def track_user_sessions(self):
-        result = ""
-        sessions = psutil.users()
-        for session in sessions:
-            result += f"User: {session.name}\nTerminal: {session.terminal}\n"
-            result += f"Started: {datetime.fromtimestamp(session.started)}\n\n"
-        self.write_output(result)
-
-def main():
+        # Each look at the sessions is also recorded in the session history,
+        # and the last week of that history is reported after them
+        def lines(task):
+            with SessionStore() as store:
+                for session in SessionRecorder(store).poll():
+                    yield (f"User: {session.name}\nTerminal: {session.terminal}\n"
+                           f"Started: {datetime.fromtimestamp(session.started)}\n\n")
+                end = time.time()
+                yield format_session_report(store, end - SESSION_REPORT_DAYS * 86400, end) + "\n"
+        self.stream_output("User Sessions", lines)
+
+def main(profile=None):
     root = ThemedTk(theme="equilux")  # Using themed Tk for better looking widgets
-    app = ITSupportGUI(root)
+    app = ITSupportGUI(root, Instrument(profile=profile))
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="IT Support Tool Suite")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="also write a cProfile or tracemalloc capture of every operation")
+    main(parser.parse_args().profile)
@@ -1,21 +1,50 @@
 import customtkinter as ctk
-from tkinter import messagebox, filedialog
-import os
-import psutil
-import shutil
-import subprocess
-import hashlib
+from tkinter import messagebox, filedialog, ttk
+import time
 from datetime import datetime
-import platform
+
+from it_support import (DEFAULT_DRIVE, PROFILE_MODES, BandwidthSampler, DuplicateReport, Instrument,
+                        LeakDetector, LogTailer, ProcessSnapshot, ResultSet, ResultsTable, SessionRecorder,
+                        SessionStore, SimilarityReport, TaskRunner, UsageTree, analyze_usage,
+                        check_disk_space, collect_inventory_changes, create_scheduled_task, duplicate_columns,
+                        duplicate_rows, find_similar_files, format_alert, format_changes, format_cost,
+                        format_history, format_inventory, format_leaks, format_mount_table, format_progress,
+                        format_rate, format_rotation, format_rule_counts, format_session_report,
+                        format_similarity_summary, format_size, format_stage_summary, format_usage,
+                        iter_batches, iter_duplicate_groups, process_columns, process_rows,
+                        read_network_totals, rotate_logs, scan_mounts, similarity_columns, similarity_rows,
+                        sparkline, to_mb)
+
+# Streamed lines are handed to the output area in batches of up to
+# STREAM_BATCH lines, or sooner once STREAM_FLUSH_SECONDS have passed
+STREAM_BATCH = 200
+STREAM_FLUSH_SECONDS = 0.1
+# Table rows are handed over in batches of up to TABLE_BATCH rows
+TABLE_BATCH = 5000
+# Seconds between live bandwidth updates and the width of the history graph
+BANDWIDTH_INTERVAL = 1.0
+BANDWIDTH_GRAPH_WIDTH = 50
+# Seconds between samples of the leak watch
+LEAK_INTERVAL = 10.0
+# Days of session history reported under the current sessions
+SESSION_REPORT_DAYS = 7
 
 class ModernITSupportGUI:
-    def __init__(self):
+    def __init__(self, instrument=None):
+        self.instrument = instrument or Instrument()
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
         
         self.root = ctk.CTk()
         self.root.title("IT Support Tool Suite")
         self.root.geometry("1000x800")
+        self._stream_id = 0
+        self._stream_task = None
+        self._table_shown = False
+        self.process_snapshot = ProcessSnapshot()
+        self.runner = TaskRunner(self.root, on_change=self.update_task_indicator,
+                                 instrument=self.instrument, on_stats=self.show_timing)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Create main container
         self.main_frame = ctk.CTkFrame(self.root)
@@ -36,6 +65,19 @@ class ModernITSupportGUI:
             font=ctk.CTkFont(size=12)
         )
         self.output_text.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # Results that can run to many thousands of rows are shown in a
+        # virtualized table that takes the text area's place. It is a ttk
+        # widget, so it is styled to match the dark theme here.
+        style = ttk.Style(self.root)
+        style.theme_use("clam")
+        style.configure("Treeview", background="#2B2B2B", fieldbackground="#2B2B2B", foreground="#DCE4EE",
+                        rowheight=24, borderwidth=0)
+        style.configure("Treeview.Heading", background="#1F6AA5", foreground="#DCE4EE", relief="flat")
+        style.map("Treeview", background=[("selected", "#144870")])
+        style.configure("TFrame", background="#2B2B2B")
+        style.configure("TLabel", background="#2B2B2B", foreground="#DCE4EE")
+        self.results_table = ResultsTable(self.main_frame, height=16)
         
         # Create scrollable button frame
         self.button_frame = ctk.CTkScrollableFrame(
@@ -43,6 +85,20 @@ class ModernITSupportGUI:
             height=200
         )
         self.button_frame.pack(fill="x", padx=20, pady=20)
+
+        # Running-task indicator with a cancel button
+        self.status_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        self.status_frame.pack(fill="x", padx=20, pady=(0, 10))
+        self.status_label = ctk.CTkLabel(self.status_frame, text="✅ Ready", anchor="w")
+        self.status_label.pack(side="left", fill="x", expand=True)
+        self.cancel_button = ctk.CTkButton(
+            self.status_frame,
+            text="✖ Cancel",
+            command=self.runner.cancel_all,
+            width=100,
+            state="disabled"
+        )
+        self.cancel_button.pack(side="right")
         
         # Create modern button grid
         self.create_buttons()
@@ -52,11 +108,16 @@ class ModernITSupportGUI:
             ("💾 Check Disk Space", self.check_disk_dialog),
             ("📊 Monitor Bandwidth", self.monitor_bandwidth),
             ("📝 List Processes", self.list_processes),
+            ("🩺 Leak Watch", self.watch_leaks),
             ("⏰ Create Task", self.create_task_dialog),
             ("🖥️ System Inventory", self.collect_inventory),
             ("📁 Rotate Logs", self.rotate_logs_dialog),
+            ("📜 Tail Logs", self.tail_logs_dialog),
             ("🔍 Find Duplicates", self.find_duplicates_dialog),
-            ("👥 User Sessions", self.track_user_sessions)
+            ("🧩 Similar Files", self.find_similar_dialog),
+            ("👥 User Sessions", self.track_user_sessions),
+            ("📦 Disk Usage", self.disk_usage_dialog),
+            ("⏱ Timings", self.show_timings)
         ]
         
         for i, (text, command) in enumerate(buttons):
@@ -74,21 +135,125 @@ class ModernITSupportGUI:
             )
             btn.grid(row=row, column=col, padx=10, pady=10)
 
+    def on_close(self):
+        self.runner.shutdown()
+        self.root.destroy()
+
+    def update_task_indicator(self, tasks):
+        if tasks:
+            running = ", ".join(f"{t.name} ({t.status})" if t.status else t.name for t in tasks)
+            self.status_label.configure(text=f"⏳ Running: {running}")
+            self.cancel_button.configure(state="normal")
+        else:
+            self.status_label.configure(text="✅ Ready")
+            self.cancel_button.configure(state="disabled")
+
+    def show_timing(self, task, stats):
+        # Every finished task gets its timing summary under its output;
+        # cancelled runs are only recorded in the history
+        if stats.error == "Cancelled":
+            return
+        if self._table_shown:
+            self.results_table.append_summary(self.instrument.summary(stats))
+        else:
+            self.output_text.insert("end", f"\n\n{self.instrument.summary(stats)}")
+
+    def show_timings(self):
+        self.write_output(f"Timings of recent runs:\n\n{format_history(self.instrument.history())}")
+
+    def show_table(self, shown):
+        # Swaps the text area for the results table or back
+        if shown == self._table_shown:
+            return
+        self._table_shown = shown
+        if shown:
+            self.output_text.pack_forget()
+            self.results_table.frame.pack(fill="both", expand=True, padx=20, pady=20, before=self.button_frame)
+        else:
+            self.results_table.frame.pack_forget()
+            self.output_text.pack(fill="both", expand=True, padx=20, pady=20, before=self.button_frame)
+
     def write_output(self, text):
+        self._stream_id += 1
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+            self._stream_task = None
+        self.show_table(False)
         self.output_text.delete("0.0", "end")
         self.output_text.insert("0.0", f"✨ {text}")
 
+    def run_task(self, name, func, *args, error_message="❌ Error"):
+        # Runs func(task, *args) on the worker pool and shows the text it
+        # returns once it finishes
+        def failed(error):
+            self.write_output(f"{error_message}: {error}")
+        return self.runner.submit(name, func, *args, on_done=self.write_output, on_error=failed)
+
+    def stream_output(self, name, make_chunks, header="", footer=None, batch_size=STREAM_BATCH):
+        # make_chunks(task) returns a generator of text chunks that is run on
+        # the worker pool; its output is appended in batches as it arrives.
+        # footer is called on the worker once the generator is exhausted.
+        # Starting another output cancels a stream that is still running.
+        self.write_output(header)
+        stream_id = self._stream_id
+
+        def work(task):
+            for text in iter_batches(make_chunks(task), batch_size, STREAM_FLUSH_SECONDS, task.check):
+                task.emit(text)
+            return footer() if footer else ""
+
+        def append(text):
+            if stream_id == self._stream_id:
+                self.output_text.insert("end", text)
+
+        def failed(error):
+            append(f"\n❌ Error: {error}")
+
+        self._stream_task = self.runner.submit(name, work, on_item=append, on_done=append, on_error=failed)
+
+    def show_results(self, name, columns, make_rows, footer=None, sort=None):
+        # Like stream_output for results that can run to millions of rows:
+        # make_rows(task) returns an iterable of row tuples that is consumed
+        # on the worker pool, and the rows are shown in the results table as
+        # they arrive. sort is an optional (column, descending) pair.
+        self.write_output("")
+        stream_id = self._stream_id
+        results = ResultSet(columns)
+        if sort:
+            results.sort(*sort)
+        self.show_table(True)
+        self.results_table.show(results)
+
+        def work(task):
+            for rows in iter_batches(make_rows(task), TABLE_BATCH, STREAM_FLUSH_SECONDS, task.check, join=list):
+                task.emit(rows)
+            return footer() if footer else ""
+
+        def add(rows):
+            if stream_id == self._stream_id:
+                results.extend(rows)
+                self.results_table.refresh()
+
+        def finish(text):
+            if stream_id == self._stream_id:
+                self.results_table.set_summary(text)
+
+        def failed(error):
+            finish(f"❌ Error: {error}")
+
+        self._stream_task = self.runner.submit(name, work, on_item=add, on_done=finish, on_error=failed)
+
     def check_disk_dialog(self):
         dialog = ctk.CTkToplevel(self.root)
         dialog.title("Check Disk Space")
-        dialog.geometry("400x250")
+        dialog.geometry("400x290")
         
         frame = ctk.CTkFrame(dialog)
         frame.pack(fill="both", expand=True, padx=20, pady=20)
         
         ctk.CTkLabel(frame, text="Drive:").pack(pady=5)
         drive_entry = ctk.CTkEntry(frame)
-        drive_entry.insert(0, "C:/")
+        drive_entry.insert(0, DEFAULT_DRIVE)
         drive_entry.pack(pady=5)
         
         ctk.CTkLabel(frame, text="Threshold (%):").pack(pady=5)
@@ -96,40 +261,107 @@ class ModernITSupportGUI:
         threshold_entry.insert(0, "20")
         threshold_entry.pack(pady=5)
         
-        def check():
-            drive = drive_entry.get()
-            threshold = int(threshold_entry.get())
-            total, used, free = shutil.disk_usage(drive)
-            free_percentage = (free / total) * 100
-            result = f"Drive: {drive}\nFree Space: {free_percentage:.2f}%\n"
-            if free_percentage < threshold:
+        def work(task, drive, threshold):
+            status = check_disk_space(drive, threshold)
+            result = f"Drive: {drive}\nFree Space: {status.free_percent:.2f}%\n"
+            if status.below_threshold:
                 result += f"⚠️ Warning: Free space on {drive} is below {threshold}%!"
             else:
                 result += f"✅ Disk space is sufficient on {drive}."
-            self.write_output(result)
+            return result
+
+        def check():
+            drive = drive_entry.get()
+            threshold = int(threshold_entry.get())
+            self.run_task("Check Disk Space", work, drive, threshold)
             dialog.destroy()
         
+        def scan_all(task, threshold):
+            return format_mount_table(scan_mounts(threshold, threshold))
+
+        def check_all():
+            threshold = int(threshold_entry.get())
+            self.write_output("🗄️ Scanning all mounted filesystems...")
+            self.run_task("Scan Mounts", scan_all, threshold)
+            dialog.destroy()
+
         ctk.CTkButton(
             frame,
             text="Check Space",
             command=check
-        ).pack(pady=20)
+        ).pack(pady=(20, 5))
+        ctk.CTkButton(
+            frame,
+            text="Scan All Mounts",
+            command=check_all
+        ).pack(pady=5)
 
     def monitor_bandwidth(self):
-        counters = psutil.net_io_counters()
-        result = f"📡 Network Statistics:\n\n"
-        result += f"↑ Bytes Sent: {counters.bytes_sent / (1024 ** 2):.2f} MB\n"
-        result += f"↓ Bytes Received: {counters.bytes_recv / (1024 ** 2):.2f} MB"
-        self.write_output(result)
+        # Live view that refreshes every BANDWIDTH_INTERVAL seconds; clicking
+        # the button again (or Cancel) stops it
+        if self._stream_task is not None and self._stream_task.name == "Monitor Bandwidth":
+            self._stream_task.cancel()
+            self._stream_task = None
+            return
+        self.write_output("📡 Sampling network counters...")
+        stream_id = self._stream_id
+
+        def work(task):
+            sampler = BandwidthSampler(interval=BANDWIDTH_INTERVAL)
+            for sample in sampler.run(wait=task.wait):
+                task.emit(self.format_bandwidth(sampler, sample))
+
+        def show(text):
+            if stream_id == self._stream_id:
+                self.output_text.delete("0.0", "end")
+                self.output_text.insert("0.0", f"✨ {text}")
+
+        self._stream_task = self.runner.submit("Monitor Bandwidth", work, on_item=show)
+
+    def format_bandwidth(self, sampler, sample):
+        totals = read_network_totals()
+        result = f"📡 Network Statistics (live, click again to stop):\n\n"
+        result += f"↑ Bytes Sent: {to_mb(totals.bytes_sent):.2f} MB\n"
+        result += f"↓ Bytes Received: {to_mb(totals.bytes_recv):.2f} MB\n\n"
+        recv, sent = sampler.history["total"]
+        result += f"↓ {sparkline(recv, BANDWIDTH_GRAPH_WIDTH)}\n"
+        result += f"↑ {sparkline(sent, BANDWIDTH_GRAPH_WIDTH)}\n\n"
+        for rate in [sample.total] + sorted(sample.interfaces.values(), key=lambda r: r.nic):
+            result += f"{rate.nic}: ↓ {format_rate(rate.bytes_recv)}  ↑ {format_rate(rate.bytes_sent)}  "
+            result += f"📦 ↓ {rate.packets_recv:.0f}/s ↑ {rate.packets_sent:.0f}/s\n"
+        return result
+
+    def watch_leaks(self):
+        # Live view of the processes whose memory keeps growing, refreshed
+        # every LEAK_INTERVAL seconds; clicking the button again (or Cancel)
+        # stops it
+        if self._stream_task is not None and self._stream_task.name == "Leak Watch":
+            self._stream_task.cancel()
+            self._stream_task = None
+            return
+        self.write_output("Sampling processes...")
+        stream_id = self._stream_id
+
+        def work(task):
+            detector = LeakDetector()
+            for suspects in detector.watch(LEAK_INTERVAL, wait=task.wait):
+                task.emit(format_leaks(detector, suspects))
+
+        def show(text):
+            if stream_id == self._stream_id:
+                self.output_text.delete("0.0", "end")
+                self.output_text.insert("0.0", f"✨ 🩺 Watching for memory leaks (live, click again to stop):\n\n{text}")
+
+        self._stream_task = self.runner.submit("Leak Watch", work, on_item=show)
 
     def list_processes(self):
-        result = "🔄 Running Processes:\n\n"
-        for proc in psutil.process_iter(attrs=["pid", "name", "memory_info"]):
-            result += f"PID: {proc.info['pid']}\n"
-            result += f"Name: {proc.info['name']}\n"
-            result += f"Memory: {proc.info['memory_info'].rss / (1024 ** 2):.2f} MB\n"
-            result += "------------------------\n"
-        self.write_output(result)
+        # The snapshot is kept between clicks so CPU % is measured since the
+        # previous listing
+        def rows(task):
+            self.process_snapshot.refresh()
+            return process_rows(self.process_snapshot.rows)
+        self.show_results("List Processes", process_columns(), rows, sort=("rss", True),
+                          footer=lambda: "⏱️ " + format_cost(self.process_snapshot.last_cost))
 
     def create_task_dialog(self):
         dialog = ctk.CTkToplevel(self.root)
@@ -152,15 +384,13 @@ class ModernITSupportGUI:
             entry.pack(pady=5)
             entries[key] = entry
         
+        def work(task, values):
+            create_scheduled_task(values['task_name'], values['script_path'], values['time'])
+            return f"✅ Task '{values['task_name']}' created successfully!"
+
         def create():
-            try:
-                command = f"schtasks /create /tn {entries['task_name'].get()} "
-                command += f"/tr {entries['script_path'].get()} "
-                command += f"/sc once /st {entries['time'].get()}"
-                subprocess.run(command, shell=True, check=True)
-                self.write_output(f"✅ Task '{entries['task_name'].get()}' created successfully!")
-            except Exception as e:
-                self.write_output(f"❌ Failed to create task: {e}")
+            values = {key: entry.get() for key, entry in entries.items()}
+            self.run_task("Create Task", work, values, error_message="❌ Failed to create task")
             dialog.destroy()
         
         ctk.CTkButton(
@@ -170,63 +400,124 @@ class ModernITSupportGUI:
         ).pack(pady=20)
 
     def collect_inventory(self):
-        result = "🖥️ System Information:\n\n"
-        result += f"OS: {platform.system()} {platform.release()}\n"
-        result += f"CPU: {platform.processor()}\n"
-        result += f"RAM: {psutil.virtual_memory().total / (1024 ** 3):.2f} GB\n"
-        result += f"Storage: {psutil.disk_usage('/').total / (1024 ** 3):.2f} GB"
-        self.write_output(result)
+        def work(task):
+            inventory, changes = collect_inventory_changes()
+            result = "🖥️ System Information:\n\n" + format_inventory(inventory)
+            if changes is not None:
+                result += "\n\n" + format_changes(changes)
+            return result
+        self.run_task("System Inventory", work)
 
     def rotate_logs_dialog(self):
         log_dir = filedialog.askdirectory(title="Select Log Directory")
         if log_dir:
-            try:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                archive_path = f"{log_dir}/archive_{timestamp}"
-                shutil.make_archive(archive_path, 'zip', log_dir)
-                
-                for file in os.listdir(log_dir):
-                    if file.endswith(".log"):
-                        os.remove(os.path.join(log_dir, file))
-                
-                self.write_output(f"✅ Logs archived to {archive_path}.zip\n📤 Old logs removed")
-            except Exception as e:
-                self.write_output(f"❌ Error: {e}")
+            def work(task):
+                rotation = rotate_logs(log_dir, check_cancelled=task.check)
+                return format_rotation(rotation)
+            self.write_output(f"📁 Rotating logs in {log_dir}...")
+            self.run_task("Rotate Logs", work)
+
+    def tail_logs_dialog(self):
+        # Streams alerts from the logs until the button is clicked again (or
+        # Cancel); the per-rule counters are shown in the running-task line
+        if self._stream_task is not None and self._stream_task.name == "Tail Logs":
+            self._stream_task.cancel()
+            self._stream_task = None
+            return
+        log_dir = filedialog.askdirectory(title="Select Log Directory")
+        if log_dir:
+            def lines(task):
+                with LogTailer([log_dir]) as tailer:
+                    reported = time.monotonic()
+                    for alerts in tailer.follow(wait=task.wait):
+                        for alert in alerts:
+                            yield format_alert(alert) + "\n"
+                        # Lets a quiet spell flush the alerts still batched
+                        yield ""
+                        if time.monotonic() - reported >= 1:
+                            reported = time.monotonic()
+                            task.progress(f"{tailer.rules.lines:,} lines, {format_rule_counts(tailer.rules)}")
+
+            self.stream_output("Tail Logs", lines, header=f"Following the logs in {log_dir}...\n\n")
 
     def find_duplicates_dialog(self):
         directory = filedialog.askdirectory(title="Select Directory")
         if directory:
-            result = "🔍 Duplicate Files:\n\n"
-            seen = {}
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    file_hash = self.hash_file(file_path)
-                    if file_hash in seen:
-                        result += f"Found duplicate:\n{file_path}\n↔️\n{seen[file_hash]}\n\n"
-                    else:
-                        seen[file_hash] = file_path
-            self.write_output(result if len(result) > 25 else "✅ No duplicates found!")
-
-    def hash_file(self, file_path):
-        hasher = hashlib.md5()
-        with open(file_path, "rb") as f:
-            while chunk := f.read(8192):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+            report = DuplicateReport()
+
+            def rows(task):
+                def progress(stage, done, total):
+                    task.progress(format_progress(stage, done, total))
+                groups = iter_duplicate_groups(directory, report=report, progress=progress)
+                for number, group in enumerate(groups, 1):
+                    yield from duplicate_rows(number, group)
+
+            def summary():
+                result = "" if report.group_count else "✅ No duplicates found!\n"
+                result += format_stage_summary(report)
+                return result + f"\n💾 Reclaimable space: {format_size(report.wasted_bytes)}"
+
+            self.show_results("Find Duplicates", duplicate_columns(), rows, footer=summary)
+
+    def find_similar_dialog(self):
+        directory = filedialog.askdirectory(title="Select Directory")
+        if directory:
+            report = SimilarityReport()
+
+            def rows(task):
+                def progress(stage, done, total):
+                    task.progress(format_progress(stage, done, total))
+                find_similar_files(directory, progress=progress, check_cancelled=task.check, report=report)
+                return similarity_rows(report.pairs)
+
+            def summary():
+                result = "" if report.pairs else "✅ No similar files found!\n"
+                return result + format_similarity_summary(report)
+
+            self.show_results("Find Similar", similarity_columns(), rows, footer=summary, sort=("shared", True))
+
+    def disk_usage_dialog(self):
+        directory = filedialog.askdirectory(title="Select Directory to Analyze")
+        if directory:
+            def work(task):
+                def progress(directories, files):
+                    task.progress(f"scanned {directories} directories, {files} files")
+                return analyze_usage(directory, progress=progress, check_cancelled=task.check)
+
+            def show(usage):
+                self.write_output(format_usage(usage))
+                window = ctk.CTkToplevel(self.root)
+                window.title(f"Disk Usage - {usage.root}")
+                window.geometry("760x520")
+                UsageTree(window, usage).frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+            def failed(error):
+                self.write_output(f"❌ Error analyzing disk usage: {error}")
+
+            self.write_output(f"📦 Analyzing disk usage in {directory}...")
+            self.runner.submit("Disk Usage", work, on_done=show, on_error=failed)
 
     def track_user_sessions(self):
-        result = "👥 Active User Sessions:\n\n"
-        for session in psutil.users():
-            result += f"User: {session.name}\n"
-            result += f"Terminal: {session.terminal}\n"
-            result += f"Started: {datetime.fromtimestamp(session.started)}\n"
-            result += "------------------------\n"
-        self.write_output(result)
-
-def main():
-    app = ModernITSupportGUI()
+        # Each look at the sessions is also recorded in the session history,
+        # and the last week of that history is reported after them
+        def lines(task):
+            with SessionStore() as store:
+                for session in SessionRecorder(store).poll():
+                    yield (f"User: {session.name}\n"
+                           f"Terminal: {session.terminal}\n"
+                           f"Started: {datetime.fromtimestamp(session.started)}\n"
+                           "------------------------\n")
+                end = time.time()
+                yield "\n📅 " + format_session_report(store, end - SESSION_REPORT_DAYS * 86400, end) + "\n"
+        self.stream_output("User Sessions", lines, header="👥 Active User Sessions:\n\n")
+
+def main(profile=None):
+    app = ModernITSupportGUI(Instrument(profile=profile))
     app.root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="IT Support Tool Suite")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="also write a cProfile or tracemalloc capture of every operation")
+    main(parser.parse_args().profile)
@@ -0,0 +1,90 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from it_support import hashing
+
+
+def legacy_hash_file(file_path):
+    # The original serial hash_file: MD5 in 8 KB reads on the calling thread
+    hasher = hashlib.md5()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(8192):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def make_fixture(directory, files, size):
+    paths = []
+    block = os.urandom(1024 * 1024)
+    for i in range(files):
+        path = os.path.join(directory, f"file_{i:05d}.bin")
+        with open(path, "wb") as f:
+            remaining = size
+            while remaining > 0:
+                f.write(block[:min(remaining, len(block))])
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+
+def run(label, func, total_bytes, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    rate = total_bytes / (1024 ** 2) / best
+    print(f"{label:<34} {best:8.3f} s  {rate:9.1f} MB/s")
+    return rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare duplicate-scan hashing throughput")
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--workers", type=int, default=hashing.DEFAULT_WORKERS)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--algorithms", nargs="+", default=["md5", "blake2b", "xxh3_64"])
+    parser.add_argument("--dir", help="directory on the storage to test (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="hashbench_", dir=args.dir)
+    try:
+        size = int(args.size_mb * 1024 * 1024)
+        paths = make_fixture(workdir, args.files, size)
+        total = size * len(paths)
+        print(f"{len(paths)} files x {args.size_mb} MB in {workdir}, best of {args.rounds}\n")
+
+        baseline = run("legacy hash_file (md5, 8 KB)", lambda: [legacy_hash_file(p) for p in paths],
+                       total, args.rounds)
+        for algorithm in args.algorithms:
+            try:
+                hashing.new_hasher(algorithm)
+            except ValueError as e:
+                print(f"{algorithm:<34} skipped: {e}")
+                continue
+            jobs = [(p, algorithm) for p in paths]
+            rate = run(f"{algorithm} serial", lambda: [hashing.hash_full(*job) for job in jobs],
+                       total, args.rounds)
+            for kind in ("thread", "process"):
+                def pooled():
+                    with hashing.HashPool(args.workers, kind) as pool:
+                        for _ in pool.imap_unordered(hashing.hash_full, jobs):
+                            pass
+                pooled_rate = run(f"{algorithm} {kind} pool x{args.workers}", pooled, total, args.rounds)
+                rate = max(rate, pooled_rate)
+            print(f"{'':<34} best {algorithm}: {rate / baseline:.2f}x legacy\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(ROOT, "It support tools.py")
+HEAVY_MODULES = ("psutil", "sqlite3", "multiprocessing", "concurrent.futures", "logging", "tkinter", "customtkinter")
+
+LOAD_CLI = (
+    "import importlib.util, sys\n"
+    f"sys.path.insert(0, {ROOT!r})\n"
+    f"spec = importlib.util.spec_from_file_location('cli', {CLI_PATH!r})\n"
+    "module = importlib.util.module_from_spec(spec)\n"
+    "spec.loader.exec_module(module)\n"
+)
+REPORT_MODULES = f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+
+CASES = {
+    "interpreter only": "import sys\n",
+    # What the CLI imported at the top before it used the core package
+    "original CLI imports": (
+        "import sys, os, psutil, shutil, subprocess, hashlib, time, platform\n"
+        "from datetime import datetime\n"
+    ),
+    "CLI module load": LOAD_CLI,
+    # Building every subcommand parser must not load the modules behind them
+    "CLI subcommand parse": LOAD_CLI + "module.parse_args(['run-all', '--format', 'ndjson'])\n",
+}
+
+
+def time_case(code, runs):
+    samples = []
+    loaded = ""
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code + REPORT_MODULES],
+                                check=True, capture_output=True, text=True).stdout
+        samples.append((time.perf_counter() - started) * 1000)
+        loaded = output.strip()
+    return samples, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure CLI start-up import cost")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<24} {'median':>9} {'min':>9}  heavy modules loaded")
+    for name, code in CASES.items():
+        samples, loaded = time_case(code, args.runs)
+        print(f"{name:<24} {statistics.median(samples):7.1f}ms {min(samples):7.1f}ms  {loaded or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+
+from it_support.processes import DEFAULT_PROCESS_COLUMNS, PROCESS_COLUMNS, ProcessSnapshot
+
+
+def legacy_listing():
+    # The original list_processes loop, minus the printing
+    return [
+        (proc.info["pid"], proc.info["name"], proc.info["memory_info"])
+        for proc in psutil.process_iter(attrs=["pid", "name", "memory_info"])
+    ]
+
+
+def measure(label, func, ticks):
+    samples = []
+    for _ in range(ticks):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<32} median {statistics.median(samples):7.2f} ms  max {max(samples):7.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cost of one process listing tick")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{len(psutil.pids())} processes, {args.ticks} ticks\n")
+    measure("legacy process_iter listing", legacy_listing, args.ticks)
+    for label, columns in (("snapshot, default columns", DEFAULT_PROCESS_COLUMNS),
+                           ("snapshot, all columns", PROCESS_COLUMNS)):
+        snapshot = ProcessSnapshot(columns)
+        snapshot.refresh()
+        measure(label, snapshot.refresh, args.ticks)
+        measure(f"  top {args.top} by rss", lambda: snapshot.top(args.top, "rss"), args.ticks)
+        print(f"  last tick: {snapshot.last_cost}")
+
+
+if __name__ == "__main__":
+    main()
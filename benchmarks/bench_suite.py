@@ -0,0 +1,225 @@
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+import harness
+from it_support import duplicates, hashing, logs, processes, runner, tail, usage
+from it_support.hash_cache import HashCache
+from it_support.results import ResultSet
+
+CASES = ("hashing", "duplicates", "rotation", "tail", "processes", "gui_output", "usage")
+
+
+class FakeRoot:
+    # Enough of a Tk root for TaskRunner: after() callbacks are queued and
+    # run by pump() instead of a mainloop, so the GUI output path can be
+    # timed without a display
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback):
+        self.pending.append(callback)
+
+    def pump(self):
+        callbacks, self.pending = self.pending, []
+        for callback in callbacks:
+            callback()
+
+
+def bench_hashing(args, workdir, tree):
+    paths = [os.path.join(d, name) for d, _, names in os.walk(tree.root) for name in names]
+    next_path = itertools.cycle(paths).__next__
+    results = [harness.measure("hash_file latency per file", lambda path: hashing.hash_file(path),
+                               runs=min(len(paths), 500), setup=next_path, memory=False,
+                               params={"files": len(paths)})]
+    for algorithm in ("md5", "blake2b"):
+        results.append(harness.measure(
+            f"hash_file whole tree ({algorithm})", lambda: [hashing.hash_file(p, algorithm) for p in paths],
+            runs=args.runs, units=tree.bytes, unit="bytes", params={"files": len(paths), "algorithm": algorithm}))
+    return results
+
+
+def bench_duplicates(args, workdir, tree):
+    def scan(cache=None):
+        return sum(1 for _ in duplicates.iter_duplicate_groups(tree.root, workers=args.workers, cache=cache))
+
+    params = {"files": tree.files, "duplicates": tree.duplicates, "workers": args.workers}
+    results = [harness.measure("find_duplicates cold", scan, runs=args.runs, units=tree.files, unit="files",
+                               params=params)]
+    with HashCache(os.path.join(workdir, "cache.sqlite")) as cache:
+        scan(cache)
+        results.append(harness.measure("find_duplicates warm cache", lambda: scan(cache), runs=args.runs,
+                                       units=tree.files, unit="files", params=params))
+    return results
+
+
+def bench_rotation(args, workdir, tree):
+    template = os.path.join(workdir, "logs_template")
+    size = fixtures.make_log_dir(template, files=args.log_files, size=args.log_size_mb * 1024 * 1024,
+                                 seed=args.seed)
+    counter = itertools.count()
+
+    def fresh_copy():
+        # Rotation deletes its input, so every run gets its own copy
+        target = os.path.join(workdir, f"logs_{next(counter)}")
+        shutil.copytree(template, target)
+        return target
+
+    results = []
+    for codec in ("gzip", "xz", "zip"):
+        results.append(harness.measure(
+            f"rotate_logs {codec}", lambda log_dir: logs.rotate_logs(log_dir, codec, workers=args.workers),
+            runs=args.runs, setup=fresh_copy, units=size, unit="bytes",
+            params={"files": args.log_files, "codec": codec, "workers": args.workers}))
+    return results
+
+
+def bench_tail(args, workdir, tree):
+    log_dir = os.path.join(workdir, "logs_tail")
+    size = fixtures.make_log_dir(log_dir, files=args.log_files, size=args.log_size_mb * 1024 * 1024,
+                                 seed=args.seed)
+
+    def follow_all():
+        # Reads every log from the start against the default rules and stops
+        # once caught up, which is the first time the tailer asks to sleep
+        with tail.LogTailer([log_dir], from_start=True, backend="poll") as tailer:
+            for _ in tailer.follow(wait=lambda seconds: seconds > 0):
+                pass
+        return tailer.rules.lines
+
+    return [harness.measure("tail logs from start", follow_all, runs=args.runs, units=size, unit="bytes",
+                            params={"files": args.log_files, "rules": len(tail.DEFAULT_RULES)})]
+
+
+def bench_processes(args, workdir, tree):
+    snapshot = processes.ProcessSnapshot()
+    snapshot.refresh()
+    results = [harness.measure("process snapshot refresh", snapshot.refresh, runs=args.runs * 4,
+                               units=len(snapshot.rows), unit="processes")]
+    fake = processes.ProcessSnapshot()
+    fake.rows = fixtures.fake_process_rows(args.processes, args.seed)
+    params = {"processes": args.processes}
+    results.append(harness.measure("process top 20 by rss", lambda: fake.top(20, "rss"), runs=args.runs * 4,
+                                   units=args.processes, unit="processes", params=params))
+    results.append(harness.measure("process sort all by cpu", lambda: fake.top(None, "cpu_percent"),
+                                   runs=args.runs, units=args.processes, unit="processes", params=params))
+
+    def format_table():
+        return [" ".join(processes.format_column(c, getattr(row, c)) for c in processes.DEFAULT_PROCESS_COLUMNS)
+                for row in fake.rows]
+
+    results.append(harness.measure("process table formatting", format_table, runs=args.runs,
+                                   units=args.processes, unit="rows", params=params))
+    return results
+
+
+def bench_gui_output(args, workdir, tree):
+    # The streaming path both GUIs use: text chunks are batched on a worker,
+    # handed through the TaskRunner queue and appended on the "Tk" thread
+    lines = [f"Duplicate group (3 files, 1.00 MB each):\n/srv/share/{i}/a.bin\n/srv/share/{i}/b.bin\n\n"
+             for i in range(args.gui_lines)]
+
+    def stream():
+        root = FakeRoot()
+        task_runner = runner.TaskRunner(root, workers=1)
+        received = []
+        finished = []
+
+        def work(task):
+            for text in runner.iter_batches(iter(lines), 200, 0.1, task.check):
+                task.emit(text)
+
+        task_runner.submit("stream", work, on_item=received.append, on_done=finished.append)
+        while not finished:
+            root.pump()
+            time.sleep(0)
+        task_runner.shutdown()
+        return received
+
+    results = [harness.measure("gui stream output", stream, runs=args.runs, units=args.gui_lines, unit="lines",
+                               params={"lines": args.gui_lines})]
+
+    # The results table: rows stream into a ResultSet sorted by memory, and
+    # only the visible window is formatted, as the table view does
+    rows = processes.process_rows(fixtures.fake_process_rows(args.processes, args.seed))
+    columns = processes.process_columns()
+
+    def table():
+        result_set = ResultSet(columns)
+        result_set.sort("rss", descending=True)
+        for start in range(0, len(rows), 5000):
+            result_set.extend(rows[start:start + 5000])
+        return [result_set.format_row(row) for _, row in result_set.window(0, 20)]
+
+    params = {"processes": args.processes}
+    results.append(harness.measure("results table load sorted", table, runs=args.runs, units=args.processes,
+                                   unit="rows", params=params))
+    loaded = ResultSet(columns, rows)
+
+    def refilter():
+        loaded.filter("java")
+        loaded.filter("")
+
+    loaded.filter("warm")
+    results.append(harness.measure("results table filter", refilter, runs=args.runs, units=args.processes,
+                                   unit="rows", params=params))
+    return results
+
+
+def bench_usage(args, workdir, tree):
+    return [harness.measure("analyze_usage", lambda: usage.analyze_usage(tree.root, workers=args.workers),
+                            runs=args.runs, units=tree.files, unit="files",
+                            params={"files": tree.files, "workers": args.workers})]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every tool in the suite on synthetic fixtures")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--quick", action="store_true", help="small fixtures and few runs, for a smoke test")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--files", type=int, default=2000, help="files in the generated tree")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--distribution", choices=fixtures.DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--mean-kb", type=int, default=64, help="mean file size in the generated tree")
+    parser.add_argument("--log-files", type=int, default=8)
+    parser.add_argument("--log-size-mb", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=50000, help="rows in the fake process list")
+    parser.add_argument("--gui-lines", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=hashing.DEFAULT_WORKERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help="directory on the storage to test (default: a temp dir)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against an earlier --output file")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.runs, args.files, args.log_files, args.log_size_mb = 2, 300, 2, 1
+        args.processes, args.gui_lines = 5000, 2000
+
+    workdir = tempfile.mkdtemp(prefix="itbench_", dir=args.dir)
+    try:
+        tree = fixtures.make_tree(os.path.join(workdir, "tree"), args.files, args.duplicate_ratio,
+                                  args.distribution, args.mean_kb * 1024, seed=args.seed)
+        print(f"Fixture: {tree.files} files ({tree.bytes / (1024 ** 2):.1f} MB, {tree.duplicates} duplicates) "
+              f"in {workdir}, {args.runs} runs per case\n")
+        results = []
+        for case in args.cases:
+            results += globals()[f"bench_{case}"](args, workdir, tree)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        harness.save(results, args.output, args.seed)
+        print(f"\nResults written to {args.output}")
+    if args.compare and harness.compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
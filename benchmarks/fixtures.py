@@ -0,0 +1,101 @@
+import os
+import random
+from dataclasses import dataclass
+
+# Size distributions make_tree understands
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+LOG_LINE = "{stamp} {level:<5} [{worker:02d}] request {request:08x} served in {ms} ms for {client}\n"
+LEVELS = ("INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR")
+
+
+@dataclass
+class TreeFixture:
+    root: str
+    files: int
+    bytes: int
+    duplicates: int
+
+
+def draw_size(rng, distribution, mean_size):
+    if distribution == "fixed":
+        return mean_size
+    if distribution == "uniform":
+        return rng.randint(0, 2 * mean_size)
+    if distribution == "lognormal":
+        # Mostly small files with a long tail of big ones, like a real share;
+        # sigma 1.0 puts the median at about 60% of the mean
+        return min(int(rng.lognormvariate(0, 1.0) * mean_size / 1.65), 64 * mean_size)
+    raise ValueError(f"Unknown size distribution '{distribution}', choose from: {', '.join(DISTRIBUTIONS)}")
+
+
+def make_tree(root, files=1000, duplicate_ratio=0.2, distribution="lognormal", mean_size=64 * 1024,
+              fanout=8, depth=3, seed=0):
+    # Writes files spread over a fanout**depth directory tree. duplicate_ratio
+    # of them are byte-for-byte copies of an earlier file; the rest hold
+    # unique random bytes. The same seed always produces the same tree.
+    rng = random.Random(seed)
+    directories = [root]
+    for _ in range(depth):
+        directories = [os.path.join(d, f"d{i}") for d in directories for i in range(fanout)]
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    originals = []
+    total = duplicates = 0
+    for i in range(files):
+        path = os.path.join(directories[rng.randrange(len(directories))], f"f{i:07d}.bin")
+        if originals and rng.random() < duplicate_ratio:
+            data = originals[rng.randrange(len(originals))]
+            duplicates += 1
+        else:
+            data = rng.randbytes(draw_size(rng, distribution, mean_size))
+            # Only a bounded sample is kept as copy sources, so big fixtures
+            # do not hold every file in memory
+            if len(originals) < 256:
+                originals.append(data)
+            else:
+                originals[rng.randrange(256)] = data
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+    return TreeFixture(root, files, total, duplicates)
+
+
+def make_log_dir(root, files=8, size=4 * 1024 * 1024, archives=2, seed=0):
+    # Fake log directory: files *.log of about size bytes of realistic,
+    # compressible log lines, plus earlier archives and files rotation must
+    # leave alone. Returns the bytes of log data written.
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    total = 0
+    for i in range(files):
+        lines = []
+        written = 0
+        while written < size:
+            line = LOG_LINE.format(stamp=f"2024-01-01T{rng.randrange(24):02d}:{rng.randrange(60):02d}:"
+                                          f"{rng.randrange(60):02d}", level=rng.choice(LEVELS),
+                                   worker=rng.randrange(32), request=rng.getrandbits(32), ms=rng.randrange(2000),
+                                   client=f"10.0.{rng.randrange(256)}.{rng.randrange(256)}")
+            lines.append(line)
+            written += len(line)
+        with open(os.path.join(root, f"service{i}.log"), "w") as f:
+            f.writelines(lines)
+        total += written
+    for i in range(archives):
+        with open(os.path.join(root, f"archive_2023010{i}_000000.zip"), "wb") as f:
+            f.write(rng.randbytes(64 * 1024))
+    with open(os.path.join(root, "README.txt"), "w") as f:
+        f.write("not a log\n")
+    return total
+
+
+def fake_process_rows(count=50000, seed=0):
+    # ProcessInfo rows for a host far busier than the one running the
+    # benchmark, for exercising sorting, top-N and formatting
+    from it_support.processes import ProcessInfo
+    rng = random.Random(seed)
+    names = ("python", "java", "nginx", "postgres", "chrome", "node", "sshd", "bash")
+    return [
+        ProcessInfo(pid=pid, name=rng.choice(names), rss=int(rng.lognormvariate(17, 1.5)),
+                    cpu_percent=round(rng.expovariate(0.5), 1), num_threads=rng.randint(1, 200))
+        for pid in range(1, count + 1)
+    ]
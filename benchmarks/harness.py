@@ -0,0 +1,123 @@
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A case whose median gets this much slower than in the baseline file is
+# reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+@dataclass
+class Result:
+    name: str
+    runs: int
+    p50: float
+    p90: float
+    p99: float
+    min: float
+    max: float
+    # Work done per run (bytes, files, lines, ...) and the resulting rate
+    # at the median
+    units: float = None
+    unit: str = None
+    throughput: float = None
+    # Peak Python heap of one extra run under tracemalloc
+    peak_memory: int = None
+    params: dict = field(default_factory=dict)
+
+
+def percentile(samples, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = min(len(samples) - 1, max(0, round(fraction * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def measure(name, func, runs=5, warmup=1, setup=None, units=None, unit=None, memory=True, params=None):
+    # Times func over runs runs after warmup untimed ones. setup(), if
+    # given, runs before every call, outside the timing, and its return
+    # value is passed to func; use it to rebuild fixtures a run consumes.
+    def once():
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        func(argument) if setup else func()
+        return time.perf_counter() - started
+
+    for _ in range(warmup):
+        once()
+    samples = sorted(once() for _ in range(runs))
+    peak = None
+    if memory:
+        argument = setup() if setup else None
+        tracemalloc.start()
+        try:
+            func(argument) if setup else func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    p50 = percentile(samples, 0.5)
+    result = Result(name, runs, p50, percentile(samples, 0.9), percentile(samples, 0.99), samples[0], samples[-1],
+                    units, unit, units / p50 if units and p50 else None, peak, params or {})
+    print(format_result(result), flush=True)
+    return result
+
+
+def format_result(result):
+    line = (f"{result.name:<38} p50 {result.p50 * 1000:9.2f} ms  p90 {result.p90 * 1000:9.2f} ms  "
+            f"p99 {result.p99 * 1000:9.2f} ms")
+    if result.throughput is not None:
+        rate, unit = result.throughput, result.unit
+        if unit == "bytes":
+            rate, unit = rate / (1024 ** 2), "MB"
+        line += f"  {rate:10.1f} {unit}/s"
+    if result.peak_memory is not None:
+        line += f"  peak {result.peak_memory / (1024 ** 2):7.2f} MB"
+    return line
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save(results, path, seed=None):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "seed": seed, "results": [asdict(r) for r in results]}, f,
+                  indent=2)
+        f.write("\n")
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    # Prints the median change of every case also in the baseline file.
+    # Returns the names of the cases that regressed.
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(result.name)
+        if before is None or not before["p50"]:
+            continue
+        change = result.p50 / before["p50"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(result.name)
+        print(f"  {result.name:<38} {before['p50'] * 1000:9.2f} -> {result.p50 * 1000:9.2f} ms  {change:+7.1%}{flag}")
+    return regressions
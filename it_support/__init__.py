@@ -0,0 +1,140 @@
+# Shared building blocks for the IT support tool suite.
+#
+# Names are re-exported lazily: a submodule (and whatever it imports, such as
+# psutil or sqlite3) is only loaded the first time one of its names is used.
+import importlib
+
+_EXPORTS = {
+    "DEFAULT_DRIVE": "disk",
+    "DiskStatus": "disk",
+    "check_disk_space": "disk",
+    "format_mount_table": "disk",
+    "list_mounts": "disk",
+    "scan_mounts": "disk",
+    "BandwidthSampler": "network",
+    "InterfaceRate": "network",
+    "NetworkTotals": "network",
+    "RateSample": "network",
+    "read_network_totals": "network",
+    "COLUMN_TITLES": "processes",
+    "DEFAULT_PROCESS_COLUMNS": "processes",
+    "PROCESS_COLUMNS": "processes",
+    "ProcessInfo": "processes",
+    "ProcessSnapshot": "processes",
+    "RefreshCost": "processes",
+    "format_column": "processes",
+    "format_cost": "processes",
+    "iter_processes": "processes",
+    "process_columns": "processes",
+    "process_rows": "processes",
+    "LeakDetector": "leaks",
+    "LeakSuspect": "leaks",
+    "StreamingRegression": "leaks",
+    "format_leaks": "leaks",
+    "create_scheduled_task": "scheduler",
+    "Inventory": "inventory",
+    "InventoryCollector": "inventory",
+    "collect_inventory": "inventory",
+    "collect_inventory_changes": "inventory",
+    "diff_inventory": "inventory",
+    "format_changes": "inventory",
+    "format_inventory": "inventory",
+    "HostInventory": "fleet",
+    "LocalTransport": "fleet",
+    "SSHTransport": "fleet",
+    "iter_fleet_inventory": "fleet",
+    "read_hosts": "fleet",
+    "run_fleet_inventory": "fleet",
+    "LogRotation": "logs",
+    "format_rotation": "logs",
+    "iter_log_files": "logs",
+    "rotate_logs": "logs",
+    "Alert": "tail",
+    "LogTailer": "tail",
+    "Rule": "tail",
+    "RuleSet": "tail",
+    "format_alert": "tail",
+    "format_rule_counts": "tail",
+    "format_tail_status": "tail",
+    "read_rules": "tail",
+    "DuplicateGroup": "duplicates",
+    "DuplicateReport": "duplicates",
+    "find_duplicate_groups": "duplicates",
+    "iter_duplicate_groups": "duplicates",
+    "format_progress": "duplicates",
+    "format_stage_summary": "duplicates",
+    "duplicate_columns": "duplicates",
+    "duplicate_rows": "duplicates",
+    "DedupeResult": "dedupe",
+    "dedupe_groups": "dedupe",
+    "format_dedupe": "dedupe",
+    "undo_dedupe": "dedupe",
+    "SimilarPair": "similarity",
+    "SimilarityReport": "similarity",
+    "find_similar_files": "similarity",
+    "format_similarity": "similarity",
+    "format_similarity_summary": "similarity",
+    "similarity_columns": "similarity",
+    "similarity_rows": "similarity",
+    "hash_file": "hashing",
+    "HashCache": "hash_cache",
+    "SessionInfo": "sessions",
+    "iter_sessions": "sessions",
+    "HourActivity": "sessions",
+    "SessionRecord": "sessions",
+    "SessionRecorder": "sessions",
+    "SessionStore": "sessions",
+    "UserActivity": "sessions",
+    "format_session_report": "sessions",
+    "DEFAULT_PROFILE_DIR": "instrument",
+    "PROFILE_MODES": "instrument",
+    "Instrument": "instrument",
+    "RunStats": "instrument",
+    "format_history": "instrument",
+    "format_stats": "instrument",
+    "TaskRunner": "runner",
+    "iter_batches": "runner",
+    "DiskUsage": "usage",
+    "analyze_usage": "usage",
+    "format_usage": "usage",
+    "UsageTree": "usage_view",
+    "Column": "results",
+    "ResultSet": "results",
+    "ResultsTable": "results_view",
+    "RingBuffer": "ringbuffer",
+    "JobResult": "jobs",
+    "run_job": "jobs",
+    "run_jobs": "jobs",
+    "run_summary": "jobs",
+    "AlertEngine": "thresholds",
+    "DEFAULT_THRESHOLD_RULES": "thresholds",
+    "ThresholdAlert": "thresholds",
+    "ThresholdRule": "thresholds",
+    "format_threshold_alert": "thresholds",
+    "parse_threshold_rules": "thresholds",
+    "read_threshold_rules": "thresholds",
+    "Agent": "agent",
+    "Collector": "agent",
+    "run_agent": "agent",
+    "format_duration": "formatting",
+    "format_rate": "formatting",
+    "format_size": "formatting",
+    "sparkline": "formatting",
+    "to_gb": "formatting",
+    "to_mb": "formatting",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
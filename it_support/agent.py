@@ -0,0 +1,361 @@
+import json
+import time
+from dataclasses import asdict, dataclass, is_dataclass
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9717
+# Share of one CPU core that collection may use on average (0.02 = 2%).
+# When collectors cost more than that, every schedule is stretched by the
+# same factor until they fit again.
+DEFAULT_CPU_BUDGET = 0.02
+# Weight of the newest run in each collector's moving average cost
+COST_SMOOTHING = 0.3
+# Collection runs on this many threads so it cannot spread over every core
+COLLECTOR_THREADS = 2
+TOP_PROCESSES = 10
+MAX_REQUEST_BYTES = 8192
+REQUEST_TIMEOUT = 5.0
+
+METRIC_HELP = {
+    "it_support_disk_size_bytes": ("gauge", "Filesystem size"),
+    "it_support_disk_free_bytes": ("gauge", "Free space available to unprivileged users"),
+    "it_support_disk_free_percent": ("gauge", "Free space as a percentage of the size"),
+    "it_support_disk_inodes_free": ("gauge", "Free inodes"),
+    "it_support_disk_below_threshold": ("gauge", "1 when free space or inodes are below the threshold"),
+    "it_support_disk_error": ("gauge", "1 when the mount could not be read or timed out"),
+    "it_support_network_receive_bytes_per_second": ("gauge", "Receive rate over the last interval"),
+    "it_support_network_transmit_bytes_per_second": ("gauge", "Transmit rate over the last interval"),
+    "it_support_processes": ("gauge", "Number of processes"),
+    "it_support_process_rss_bytes": ("gauge", "Resident memory of the largest processes"),
+    "it_support_process_cpu_percent": ("gauge", "CPU use of the largest processes"),
+    "it_support_sessions": ("gauge", "Logged in sessions per user"),
+    "it_support_sessions_open": ("gauge", "Logged in sessions"),
+    "it_support_inventory_info": ("gauge", "Host description; the value is always 1"),
+    "it_support_memory_total_bytes": ("gauge", "Installed memory"),
+    "it_support_collector_runs_total": ("counter", "Collections run"),
+    "it_support_collector_errors_total": ("counter", "Collections that raised"),
+    "it_support_collector_cpu_seconds_total": ("counter", "CPU time spent collecting"),
+    "it_support_collector_last_success_timestamp_seconds": ("gauge", "Unix time of the latest value"),
+    "it_support_collector_interval_seconds": ("gauge", "Current interval, after any budget stretching"),
+    "it_support_agent_cpu_budget": ("gauge", "Allowed share of one core for collection"),
+    "it_support_agent_schedule_scale": ("gauge", "Factor every interval is stretched by to fit the budget"),
+    "it_support_alert_firing": ("gauge", "1 for each threshold alert firing, with its series' labels"),
+}
+
+
+@dataclass
+class Collector:
+    name: str
+    interval: float
+    # Blocking callable returning the latest value; runs on a worker thread
+    collect: object
+    # value -> [(metric name, labels dict, number)]
+    to_samples: object
+    value: object = None
+    updated: float = None
+    runs: int = 0
+    errors: int = 0
+    last_error: str = None
+    cpu_seconds: float = 0.0
+    # Moving average of the CPU seconds one run costs
+    cost: float = None
+
+
+def _disk_samples(statuses):
+    samples = []
+    for status in statuses:
+        labels = {"mount": status.drive, "fstype": status.fstype or ""}
+        samples.append(("it_support_disk_error", labels, int(bool(status.error))))
+        if status.error:
+            continue
+        samples += [
+            ("it_support_disk_size_bytes", labels, status.total),
+            ("it_support_disk_free_bytes", labels, status.free),
+            ("it_support_disk_free_percent", labels, round(status.free_percent, 2)),
+            ("it_support_disk_below_threshold", labels,
+             int(status.below_threshold or status.inodes_below_threshold)),
+        ]
+        if status.inodes_total:
+            samples.append(("it_support_disk_inodes_free", labels, status.inodes_free))
+    return samples
+
+
+def _network_samples(sample):
+    if sample is None:
+        return []
+    samples = []
+    for rate in [sample.total] + sorted(sample.interfaces.values(), key=lambda rate: rate.nic):
+        labels = {"nic": rate.nic}
+        samples.append(("it_support_network_receive_bytes_per_second", labels, round(rate.bytes_recv, 1)))
+        samples.append(("it_support_network_transmit_bytes_per_second", labels, round(rate.bytes_sent, 1)))
+    return samples
+
+
+def _process_samples(value):
+    count, rows = value
+    samples = [("it_support_processes", {}, count)]
+    for row in rows:
+        labels = {"pid": str(row.pid), "name": row.name or ""}
+        samples.append(("it_support_process_rss_bytes", labels, row.rss))
+        if row.cpu_percent is not None:
+            samples.append(("it_support_process_cpu_percent", labels, row.cpu_percent))
+    return samples
+
+
+def _session_samples(sessions):
+    users = {}
+    for session in sessions:
+        users[session.name] = users.get(session.name, 0) + 1
+    return [("it_support_sessions_open", {}, len(sessions))] + [
+        ("it_support_sessions", {"user": user}, count) for user, count in sorted(users.items())]
+
+
+def _inventory_samples(inventory):
+    labels = {"os": inventory.os_name, "release": inventory.os_release, "processor": inventory.processor}
+    return [
+        ("it_support_inventory_info", labels, 1),
+        ("it_support_memory_total_bytes", {}, inventory.ram_total),
+    ]
+
+
+def default_collectors(disk_interval=60.0, bandwidth_interval=10.0, process_interval=15.0,
+                       session_interval=60.0, inventory_interval=3600.0, session_store_path=None):
+    # Imported here so that importing the agent module stays cheap
+    from .disk import scan_mounts
+    from .inventory import collect_inventory
+    from .network import BandwidthSampler
+    from .processes import ProcessSnapshot
+    from .sessions import DEFAULT_STORE_PATH, SessionRecorder, SessionStore
+
+    # Kept across runs: the sampler needs the previous counters for a rate,
+    # and the snapshot its Process objects for cpu_percent
+    sampler = BandwidthSampler(bandwidth_interval)
+    snapshot = ProcessSnapshot(("pid", "name", "cpu_percent", "rss"))
+    # Every sessions poll also records logins and logouts to the session
+    # history, for the session reports
+    recorder = SessionRecorder(SessionStore(session_store_path or DEFAULT_STORE_PATH))
+
+    def collect_processes():
+        rows = snapshot.refresh()
+        return len(rows), snapshot.top(TOP_PROCESSES, "rss")
+
+    return [
+        Collector("disk", disk_interval, scan_mounts, _disk_samples),
+        Collector("bandwidth", bandwidth_interval, sampler.sample, _network_samples),
+        Collector("processes", process_interval, collect_processes, _process_samples),
+        Collector("sessions", session_interval, recorder.poll, _session_samples),
+        Collector("inventory", inventory_interval, collect_inventory, _inventory_samples),
+    ]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _json_default(value):
+    if is_dataclass(value):
+        return asdict(value)
+    return str(value)
+
+
+class Agent:
+    # Runs each collector on its own schedule, keeps the latest value of
+    # each, and serves them over HTTP: /metrics in the Prometheus text
+    # format, /metrics.json as JSON. Collectors run on a small thread pool so
+    # a slow one never delays the others or the server. alerts is an
+    # optional thresholds.AlertEngine, fed each collector's samples as they
+    # arrive.
+    def __init__(self, collectors=None, host=DEFAULT_HOST, port=DEFAULT_PORT, cpu_budget=DEFAULT_CPU_BUDGET,
+                 alerts=None):
+        self.collectors = collectors if collectors is not None else default_collectors()
+        self.alerts = alerts
+        self.host = host
+        self.port = port
+        self.cpu_budget = cpu_budget
+        self.scale = 1.0
+        self.started = None
+        self._executor = None
+        self._server = None
+
+    def interval(self, collector):
+        return collector.interval * self.scale
+
+    def _rescale(self):
+        # Average CPU share of all collectors at their configured intervals;
+        # stretching every interval by load / budget brings it under
+        load = sum(c.cost / c.interval for c in self.collectors if c.cost is not None)
+        self.scale = max(1.0, load / self.cpu_budget) if self.cpu_budget > 0 else 1.0
+
+    def collect_once(self, collector):
+        # Runs on a worker thread; thread_time only counts this thread
+        cpu_started = time.thread_time()
+        try:
+            value = collector.collect()
+        except Exception as e:
+            collector.errors += 1
+            collector.last_error = f"{type(e).__name__}: {e}"
+        else:
+            collector.value = value
+            collector.updated = time.time()
+            collector.last_error = None
+        finally:
+            cost = time.thread_time() - cpu_started
+            collector.runs += 1
+            collector.cpu_seconds += cost
+            collector.cost = cost if collector.cost is None else (
+                COST_SMOOTHING * cost + (1 - COST_SMOOTHING) * collector.cost)
+
+    async def _schedule(self, collector):
+        # Absolute deadlines, so collection time does not add drift; a run
+        # that overruns its slot skips the missed ticks
+        import asyncio
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            updated = collector.updated
+            await loop.run_in_executor(self._executor, self.collect_once, collector)
+            if self.alerts is not None and collector.updated != updated:
+                self.evaluate_alerts(collector)
+            self._rescale()
+            interval = self.interval(collector)
+            deadline += interval
+            now = loop.time()
+            if deadline < now:
+                deadline += ((now - deadline) // interval + 1) * interval
+            await asyncio.sleep(deadline - now)
+
+    async def run(self, ready=None):
+        # Serves and collects until cancelled. ready() is called once the
+        # port is bound. asyncio and concurrent.futures are imported here
+        # rather than at the top, since the CLI imports this module at
+        # start-up just for its defaults.
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        self.started = time.time()
+        self._executor = ThreadPoolExecutor(max_workers=COLLECTOR_THREADS, thread_name_prefix="it-support-agent")
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            if ready:
+                ready()
+            async with self._server:
+                await asyncio.gather(*(self._schedule(c) for c in self.collectors))
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def evaluate_alerts(self, collector):
+        # Runs on the event loop, like the HTTP handlers that read the
+        # engine, so the engine needs no lock
+        try:
+            samples = collector.to_samples(collector.value)
+        except Exception as e:
+            collector.last_error = f"{type(e).__name__}: {e}"
+            return []
+        return self.alerts.evaluate(samples, collector.updated)
+
+    @property
+    def address(self):
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def _handle(self, reader, writer):
+        import asyncio
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        try:
+            method, target = request[:MAX_REQUEST_BYTES].split(b"\r\n", 1)[0].decode("latin-1").split(" ")[:2]
+        except ValueError:
+            method, target = "", ""
+        path, _, query = target.partition("?")
+        if method != "GET":
+            status, content_type, body = "405 Method Not Allowed", "text/plain", "Only GET is supported\n"
+        elif path == "/metrics.json" or (path == "/metrics" and "format=json" in query):
+            status, content_type, body = "200 OK", "application/json", self.render_json()
+        elif path == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.render_prometheus()
+        elif path == "/healthz":
+            status, content_type, body = "200 OK", "text/plain", "ok\n"
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", "Try /metrics or /metrics.json\n"
+        payload = body.encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + payload)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def samples(self):
+        samples = []
+        for collector in self.collectors:
+            if collector.updated is not None:
+                try:
+                    samples += collector.to_samples(collector.value)
+                except Exception as e:
+                    collector.last_error = f"{type(e).__name__}: {e}"
+            labels = {"collector": collector.name}
+            samples += [
+                ("it_support_collector_runs_total", labels, collector.runs),
+                ("it_support_collector_errors_total", labels, collector.errors),
+                ("it_support_collector_cpu_seconds_total", labels, round(collector.cpu_seconds, 6)),
+                ("it_support_collector_interval_seconds", labels, round(self.interval(collector), 3)),
+            ]
+            if collector.updated is not None:
+                samples.append(("it_support_collector_last_success_timestamp_seconds", labels,
+                                round(collector.updated, 3)))
+        samples.append(("it_support_agent_cpu_budget", {}, self.cpu_budget))
+        samples.append(("it_support_agent_schedule_scale", {}, round(self.scale, 3)))
+        if self.alerts is not None:
+            for alert in self.alerts.firing():
+                samples.append(("it_support_alert_firing",
+                                {**alert.labels, "alert": alert.rule, "severity": alert.severity}, 1))
+        return samples
+
+    def render_prometheus(self):
+        by_name = {}
+        for name, labels, value in self.samples():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, values in by_name.items():
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def render_json(self):
+        return json.dumps({
+            "started": self.started,
+            "cpu_budget": self.cpu_budget,
+            "schedule_scale": self.scale,
+            "collectors": {
+                collector.name: {
+                    "updated": collector.updated,
+                    "interval": self.interval(collector),
+                    "runs": collector.runs,
+                    "errors": collector.errors,
+                    "last_error": collector.last_error,
+                    "cpu_seconds": collector.cpu_seconds,
+                    "value": collector.value,
+                }
+                for collector in self.collectors
+            },
+            "alerts": self.alerts.firing() if self.alerts is not None else [],
+        }, default=_json_default, indent=2) + "\n"
+
+
+def run_agent(host=DEFAULT_HOST, port=DEFAULT_PORT, cpu_budget=DEFAULT_CPU_BUDGET, ready=None, alerts=None):
+    # Blocking entry point for the CLI; returns on Ctrl+C
+    import asyncio
+    agent = Agent(host=host, port=port, cpu_budget=cpu_budget, alerts=alerts)
+    try:
+        asyncio.run(agent.run(ready=lambda: ready(agent) if ready else None))
+    except KeyboardInterrupt:
+        pass
+    return agent
@@ -0,0 +1,358 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .formatting import format_size
+from .hashing import DEFAULT_WORKERS, HashPool, read_size_for
+
+METHODS = ("hardlink", "reflink")
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".it_support", "dedupe")
+# ioctl that makes one file share another's extents (Linux: btrfs, XFS,
+# bcachefs, OCFS2, ...)
+FICLONE = 0x40049409
+
+
+@dataclass
+class DedupeResult:
+    method: str
+    dry_run: bool
+    groups: int = 0
+    # Files replaced (or, in a dry run, that would be) by a link to or a
+    # clone of the group's kept copy
+    linked: int = 0
+    bytes_reclaimed: int = 0
+    # Linked files whose inode still has other names, so their blocks stay
+    # in use until those go too
+    still_linked: int = 0
+    skipped: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    journal_path: str = None
+    seconds: float = 0.0
+
+
+def _identity(st):
+    # Anything that changes when a file is written, replaced or relinked
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns
+
+
+def _content_identity(st):
+    # The kept copy gains links as its group is processed, which changes its
+    # ctime, so only a changed inode, size or mtime counts for it
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _allocated(st):
+    # Blocks actually allocated, which is what relinking gives back; sparse
+    # files take less than their size
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def same_content(path_a, path_b, size):
+    # Byte-for-byte comparison; a matching digest is not proof enough to
+    # throw a file away
+    read_size = read_size_for(size)
+    with open(path_a, "rb", buffering=0) as a, open(path_b, "rb", buffering=0) as b:
+        while True:
+            chunk = a.read(read_size)
+            if chunk != b.read(read_size):
+                return False
+            if not chunk:
+                return True
+
+
+def _check_method(method):
+    if method not in METHODS:
+        raise ValueError(f"Unknown dedupe method '{method}', choose from: {', '.join(METHODS)}")
+    if method == "reflink" and not sys.platform.startswith("linux"):
+        raise ValueError("reflinks are only supported on Linux")
+
+
+def _temp_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.dedupe-{os.getpid()}-{threading.get_ident()}")
+
+
+def _discard(temp):
+    try:
+        os.unlink(temp)
+    except FileNotFoundError:
+        pass
+
+
+def _stage_link(keeper, path, st):
+    # Hard link to keeper next to path, ready to be renamed over it
+    temp = _temp_path(path)
+    os.link(keeper, temp)
+    return temp
+
+
+def _stage_reflink(keeper, path, st):
+    # Clone of keeper's extents next to path, with path's own permissions,
+    # owner and times
+    import errno
+    import fcntl
+    temp = _temp_path(path)
+    try:
+        with open(keeper, "rb") as source, open(temp, "xb") as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            except OSError as e:
+                if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV):
+                    raise OSError(e.errno, "the filesystem does not support reflinks") from None
+                raise
+        _restore_metadata(temp, st.st_mode, st.st_uid, st.st_gid, st.st_atime_ns, st.st_mtime_ns)
+    except OSError:
+        _discard(temp)
+        raise
+    return temp
+
+
+def _restore_metadata(path, mode, uid, gid, atime_ns, mtime_ns):
+    try:
+        os.chown(path, uid, gid)
+    except (PermissionError, AttributeError):
+        # Only root may give a file away; it keeps our ownership then
+        pass
+    os.chmod(path, stat.S_IMODE(mode))
+    os.utime(path, ns=(atime_ns, mtime_ns))
+
+
+class Journal:
+    # Append-only JSON-lines record of every replacement, written and synced
+    # before the replacement happens so undo_dedupe can reverse a run that
+    # was interrupted part-way.
+    def __init__(self, path, method):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "x")
+        self._write({"journal": "dedupe", "method": method, "started": time.time()})
+
+    def record(self, path, keeper, st):
+        self._write({"path": path, "keeper": keeper, "mode": st.st_mode, "uid": st.st_uid, "gid": st.st_gid,
+                     "atime_ns": st.st_atime_ns, "mtime_ns": st.st_mtime_ns, "size": st.st_size})
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def _plan(groups, method, result):
+    # Splits every group by device, since links cannot cross filesystems,
+    # and for hard links also by owner and permissions, which all names of
+    # an inode share: linking must not make a private file readable or take
+    # a shared one away from its users. Then picks the kept copy of each
+    # part: the one with the most links already, so the fewest inodes stay
+    # behind. Returns [(keeper, keeper stat, [(path, stat)])].
+    units = []
+    for group in groups:
+        parts = {}
+        for path in group.paths:
+            try:
+                st = os.lstat(path)
+            except OSError as e:
+                result.errors.append((path, str(e)))
+                continue
+            if not stat.S_ISREG(st.st_mode) or st.st_size != group.size:
+                result.skipped.append((path, "changed since the scan"))
+                continue
+            key = (st.st_dev,)
+            if method == "hardlink":
+                key += (st.st_uid, st.st_gid, stat.S_IMODE(st.st_mode))
+            parts.setdefault(key, []).append((path, st))
+        for members in parts.values():
+            members.sort(key=lambda member: (-member[1].st_nlink, member[0]))
+            keeper, keeper_st = members[0]
+            others = [(path, st) for path, st in members[1:] if st.st_ino != keeper_st.st_ino]
+            if others:
+                units.append((keeper, keeper_st, others))
+    return units
+
+
+def _partition(units):
+    # Groups units that touch a common inode into one job, so no two
+    # workers ever link to, replace or read the same inode at once.
+    # Duplicate groups from one scan never share an inode, but groups
+    # from separate scans of overlapping trees can.
+    parent = list(range(len(units)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for index, (_, keeper_st, others) in enumerate(units):
+        for st in [keeper_st] + [st for _, st in others]:
+            inode = (st.st_dev, st.st_ino)
+            if inode in owner:
+                parent[find(index)] = find(owner[inode])
+            else:
+                owner[inode] = index
+    jobs = {}
+    for index, unit in enumerate(units):
+        jobs.setdefault(find(index), []).append(unit)
+    return list(jobs.values())
+
+
+def _dedupe_job(units, method, dry_run, journal):
+    # Runs on a pool worker. Returns [(path, outcome, detail)] where outcome
+    # is "linked", "skipped" or "error".
+    stage = _stage_link if method == "hardlink" else _stage_reflink
+    outcomes = []
+    for keeper, keeper_st, others in units:
+        for path, st in others:
+            try:
+                if (_content_identity(os.lstat(keeper)) != _content_identity(keeper_st)
+                        or _identity(os.lstat(path)) != _identity(st)):
+                    outcomes.append((path, "skipped", "changed since the scan"))
+                    continue
+                if not same_content(keeper, path, st.st_size):
+                    outcomes.append((path, "skipped", f"content differs from {keeper}"))
+                    continue
+                # A write while the two were compared changes ctime
+                if _identity(os.lstat(path)) != _identity(st):
+                    outcomes.append((path, "skipped", "changed while verifying"))
+                    continue
+                if not dry_run:
+                    # The rename is atomic, so path is never missing even if
+                    # the process dies half-way, and it is only journaled
+                    # once nothing but the rename is left to fail
+                    temp = stage(keeper, path, st)
+                    try:
+                        journal.record(path, keeper, st)
+                        os.replace(temp, path)
+                    except OSError:
+                        _discard(temp)
+                        raise
+            except OSError as e:
+                outcomes.append((path, "error", str(e)))
+                continue
+            outcomes.append((path, "linked", st))
+    return outcomes
+
+
+def dedupe_groups(groups, method="hardlink", dry_run=True, workers=DEFAULT_WORKERS, journal_path=None):
+    # Replaces every verified duplicate in groups (DuplicateGroups from
+    # iter_duplicate_groups) with a hard link to, or a reflink clone of, one
+    # kept copy per group and filesystem. Every file is compared byte for
+    # byte with the kept copy first, and skipped if either changed since
+    # the scan. A dry run verifies and reports what would be reclaimed
+    # without touching anything. Otherwise every replacement is journaled
+    # to journal_path (by default a new file in DEFAULT_JOURNAL_DIR) for
+    # undo_dedupe.
+    _check_method(method)
+    started = time.perf_counter()
+    groups = list(groups)
+    result = DedupeResult(method, dry_run, groups=len(groups))
+    units = _plan(groups, method, result)
+    journal = None
+    if not dry_run and units:
+        journal_path = journal_path or os.path.join(
+            DEFAULT_JOURNAL_DIR, f"journal_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.jsonl")
+        journal = Journal(journal_path, method)
+        result.journal_path = journal_path
+    try:
+        jobs = ((job, method, dry_run, journal) for job in _partition(units))
+        with HashPool(workers) as pool:
+            for _, outcomes, error in pool.imap_unordered(_dedupe_job, jobs):
+                if error is not None:
+                    result.errors.append(("", str(error)))
+                    continue
+                for path, outcome, detail in outcomes:
+                    if outcome == "linked":
+                        result.linked += 1
+                        if detail.st_nlink > 1:
+                            result.still_linked += 1
+                        else:
+                            result.bytes_reclaimed += _allocated(detail)
+                    elif outcome == "skipped":
+                        result.skipped.append((path, detail))
+                    else:
+                        result.errors.append((path, detail))
+    finally:
+        if journal is not None:
+            journal.close()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def undo_dedupe(journal_path):
+    # Gives every file replaced by a dedupe run its own copy of the data
+    # back, with its original permissions, owner and times. Files changed
+    # since, or no longer sharing data with their kept copy, are skipped.
+    started = time.perf_counter()
+    with open(journal_path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    header = lines[0] if lines and lines[0].get("journal") == "dedupe" else {}
+    method = header.get("method", "hardlink")
+    result = DedupeResult("undo", False, journal_path=journal_path)
+    for entry in reversed(lines[1:] if header else lines):
+        path, keeper = entry["path"], entry["keeper"]
+        try:
+            current = os.lstat(path)
+            if method == "hardlink" and not os.path.samestat(current, os.stat(keeper)):
+                result.skipped.append((path, "no longer linked to the kept copy"))
+                continue
+            # A clone is a file of its own: writing to it, or to the kept
+            # copy, keeps the size but changes the mtime the clone was
+            # given back, or the bytes the two share
+            changed = current.st_size != entry["size"]
+            if method == "reflink":
+                changed = changed or current.st_mtime_ns != entry["mtime_ns"]
+            if changed:
+                result.skipped.append((path, "changed since the dedupe"))
+                continue
+            if method == "reflink" and not same_content(keeper, path, entry["size"]):
+                result.skipped.append((path, f"content differs from {keeper}"))
+                continue
+            temp = _temp_path(path)
+            try:
+                shutil.copyfile(keeper, temp)
+                _restore_metadata(temp, entry["mode"], entry["uid"], entry["gid"], entry["atime_ns"],
+                                  entry["mtime_ns"])
+                os.replace(temp, path)
+            except OSError:
+                _discard(temp)
+                raise
+        except OSError as e:
+            result.errors.append((path, str(e)))
+            continue
+        result.linked += 1
+        result.bytes_reclaimed -= entry["size"]
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def format_dedupe(result):
+    if result.method == "undo":
+        lines = [f"Restored {result.linked} files from {result.journal_path} in {result.seconds:.1f}s, "
+                 f"using {format_size(-result.bytes_reclaimed)} again."]
+    else:
+        verb = "Would replace" if result.dry_run else "Replaced"
+        how = "hard links" if result.method == "hardlink" else "reflinks"
+        lines = [f"{verb} {result.linked} verified duplicates in {result.groups} groups with {how} "
+                 f"in {result.seconds:.1f}s.",
+                 f"{'Reclaimable' if result.dry_run else 'Reclaimed'}: {format_size(result.bytes_reclaimed)}"]
+        if result.still_linked:
+            lines.append(f"{result.still_linked} of those files have other hard links outside their group; "
+                         "their space is only freed once those are gone too.")
+        if result.journal_path:
+            lines.append(f"Undo journal: {result.journal_path}")
+    for path, reason in result.skipped:
+        lines.append(f"  skipped {path}: {reason}")
+    for path, error in result.errors:
+        lines.append(f"  error {path}: {error}")
+    return "\n".join(lines)
@@ -0,0 +1,208 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+
+from .formatting import format_size
+
+DEFAULT_DRIVE = "C:/" if os.name == "nt" else "/"
+DEFAULT_THRESHOLD = 20
+# Seconds a single mount may take to answer before it is reported as hung
+DEFAULT_MOUNT_TIMEOUT = 2.0
+DEFAULT_SCAN_WORKERS = 16
+# Kernel and virtual filesystems that have no space worth reporting
+PSEUDO_FSTYPES = frozenset((
+    "autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs", "debugfs", "devpts", "devtmpfs",
+    "efivarfs", "fusectl", "hugetlbfs", "mqueue", "nsfs", "proc", "pstore", "rpc_pipefs", "securityfs",
+    "selinuxfs", "squashfs", "sysfs", "tracefs",
+))
+
+
+@dataclass
+class DiskStatus:
+    drive: str
+    total: int
+    used: int
+    free: int
+    threshold: float
+    device: str = None
+    fstype: str = None
+    inodes_total: int = None
+    inodes_free: int = None
+    inode_threshold: float = DEFAULT_THRESHOLD
+    # Set instead of the sizes when the mount could not be read or timed out
+    error: str = None
+
+    @property
+    def free_percent(self):
+        return (self.free / self.total) * 100 if self.total else 0.0
+
+    @property
+    def inode_free_percent(self):
+        # None where the filesystem has no fixed inode table (btrfs, vfat, ...)
+        return (self.inodes_free / self.inodes_total) * 100 if self.inodes_total else None
+
+    @property
+    def below_threshold(self):
+        return bool(self.total) and self.free_percent < self.threshold
+
+    @property
+    def inodes_below_threshold(self):
+        percent = self.inode_free_percent
+        return percent is not None and percent < self.inode_threshold
+
+
+def read_usage(path):
+    # Returns (total, used, free, inodes total, inodes free); Windows has no
+    # inode counts
+    if not hasattr(os, "statvfs"):
+        total, used, free = shutil.disk_usage(path)
+        return total, used, free, None, None
+    st = os.statvfs(path)
+    return (st.f_blocks * st.f_frsize, (st.f_blocks - st.f_bfree) * st.f_frsize, st.f_bavail * st.f_frsize,
+            st.f_files, st.f_favail)
+
+
+def check_disk_space(drive=DEFAULT_DRIVE, threshold=DEFAULT_THRESHOLD):
+    total, used, free, inodes_total, inodes_free = read_usage(drive)
+    return DiskStatus(drive, total, used, free, threshold, inodes_total=inodes_total, inodes_free=inodes_free)
+
+
+def list_mounts(include_pseudo=False):
+    # all=True so network filesystems such as NFS and CIFS are included
+    import psutil
+    partitions = psutil.disk_partitions(all=True)
+    if include_pseudo:
+        return partitions
+    return [part for part in partitions if part.fstype not in PSEUDO_FSTYPES]
+
+
+# {mount key: [start time of every read that has not returned yet]}, across
+# all scans: a read abandoned on timeout keeps its thread blocked until the
+# mount answers, so later scans must not queue that mount again
+_reads_in_flight = {}
+_reads_lock = threading.Lock()
+
+
+def _usage_worker(jobs, results):
+    while True:
+        try:
+            key, path = jobs.get_nowait()
+        except queue.Empty:
+            return
+        started = time.monotonic()
+        with _reads_lock:
+            _reads_in_flight.setdefault(key, []).append(started)
+        results.put(("start", key, started))
+        try:
+            results.put(("done", key, read_usage(path)))
+        except OSError as e:
+            results.put(("done", key, e))
+        finally:
+            with _reads_lock:
+                starts = _reads_in_flight[key]
+                starts.remove(started)
+                if not starts:
+                    del _reads_in_flight[key]
+
+
+def _stuck_mounts(timeout):
+    # {mount key: seconds} for mounts with a read older than timeout
+    now = time.monotonic()
+    with _reads_lock:
+        return {key: now - min(starts) for key, starts in _reads_in_flight.items() if now - min(starts) >= timeout}
+
+
+def scan_mounts(threshold=DEFAULT_THRESHOLD, inode_threshold=DEFAULT_THRESHOLD, timeout=DEFAULT_MOUNT_TIMEOUT,
+                workers=DEFAULT_SCAN_WORKERS, include_pseudo=False):
+    # Reads every mounted filesystem at once on daemon threads. A mount that
+    # does not answer within timeout seconds (a hung NFS server, say) is
+    # reported with an error and its thread is abandoned and replaced, so it
+    # can neither stall the other mounts nor keep the process alive at exit.
+    # Until that thread returns, later scans report the mount as timed out
+    # straight away instead of stranding another thread on it.
+    # Bind mounts of the same block device are only read once.
+    mounts = list_mounts(include_pseudo)
+    # A mountpoint mounted over more than once is listed once per mount;
+    # only the last one is visible
+    mounts = list({part.mountpoint: part for part in mounts}.values())
+    groups = {}
+    for part in mounts:
+        key = part.device if part.device.startswith("/") else part.mountpoint
+        groups.setdefault(key, []).append(part)
+
+    jobs = queue.SimpleQueue()
+    results = queue.SimpleQueue()
+    outcomes = {}
+    stuck = _stuck_mounts(timeout)
+    for key, parts in groups.items():
+        if key in stuck:
+            outcomes[key] = TimeoutError(f"no answer for {stuck[key]:.1f}s")
+        else:
+            jobs.put((key, parts[0].mountpoint))
+
+    def spawn():
+        threading.Thread(target=_usage_worker, args=(jobs, results), name="it-support-disk", daemon=True).start()
+
+    for _ in range(min(workers, len(groups) - len(outcomes))):
+        spawn()
+
+    started = {}
+    while len(outcomes) < len(groups):
+        now = time.monotonic()
+        for key, at in list(started.items()):
+            if now - at >= timeout:
+                del started[key]
+                outcomes[key] = TimeoutError(f"no answer within {timeout:g}s")
+                spawn()
+        if len(outcomes) == len(groups):
+            break
+        next_deadline = min(started.values(), default=now) + timeout
+        try:
+            kind, key, payload = results.get(timeout=max(0.001, next_deadline - now))
+        except queue.Empty:
+            continue
+        if key in outcomes:
+            # Late answer from a mount that already timed out
+            continue
+        if kind == "start":
+            started[key] = payload
+        else:
+            started.pop(key, None)
+            outcomes[key] = payload
+
+    statuses = []
+    for key, parts in groups.items():
+        outcome = outcomes[key]
+        for part in parts:
+            if isinstance(outcome, Exception):
+                status = DiskStatus(part.mountpoint, 0, 0, 0, threshold, part.device, part.fstype,
+                                    inode_threshold=inode_threshold, error=str(outcome) or type(outcome).__name__)
+            else:
+                total, used, free, inodes_total, inodes_free = outcome
+                status = DiskStatus(part.mountpoint, total, used, free, threshold, part.device, part.fstype,
+                                    inodes_total, inodes_free, inode_threshold)
+            statuses.append(status)
+    statuses.sort(key=lambda status: status.drive)
+    return statuses
+
+
+def format_mount_table(statuses):
+    lines = [f"{'Mount':<30} {'Type':<10} {'Size':>10} {'Free %':>7} {'Inodes free %':>14}  Status"]
+    for status in statuses:
+        if status.error:
+            lines.append(f"{status.drive:<30} {status.fstype or '-':<10} {'-':>10} {'-':>7} {'-':>14}  "
+                         f"ERROR: {status.error}")
+            continue
+        inodes = status.inode_free_percent
+        flags = []
+        if status.below_threshold:
+            flags.append(f"LOW SPACE (<{status.threshold:g}%)")
+        if status.inodes_below_threshold:
+            flags.append(f"LOW INODES (<{status.inode_threshold:g}%)")
+        lines.append(f"{status.drive:<30} {status.fstype or '-':<10} {format_size(status.total):>10} "
+                     f"{status.free_percent:>6.1f}% {'-' if inodes is None else f'{inodes:.1f}%':>14}  "
+                     f"{', '.join(flags) or 'OK'}")
+    return "\n".join(lines)
@@ -0,0 +1,232 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from .formatting import format_size
+from .hash_cache import stat_identity
+from .hashing import DEFAULT_ALGORITHM, DEFAULT_WORKERS, EDGE_SIZE, HashPool, hash_edges, hash_full
+from .walk import iter_files
+
+PROGRESS_EVERY = 500
+
+
+@dataclass
+class DuplicateGroup:
+    size: int
+    digest: str
+    paths: list
+
+    @property
+    def wasted_bytes(self):
+        return self.size * (len(self.paths) - 1)
+
+
+@dataclass
+class StageStats:
+    name: str
+    files_in: int = 0
+    files_out: int = 0
+    cached: int = 0
+    bytes_read: int = 0
+    bytes_skipped: int = 0
+
+
+@dataclass
+class DuplicateReport:
+    groups: list = field(default_factory=list)
+    stages: list = field(default_factory=list)
+    files_scanned: int = 0
+    bytes_scanned: int = 0
+    group_count: int = 0
+    wasted_bytes: int = 0
+    errors: list = field(default_factory=list)
+
+
+def find_duplicate_groups(directory, algorithm=DEFAULT_ALGORITHM, min_size=1, edge_size=EDGE_SIZE,
+                          workers=DEFAULT_WORKERS, pool_kind="thread", cache=None, progress=None):
+    report = DuplicateReport()
+    report.groups = list(iter_duplicate_groups(directory, algorithm, min_size, edge_size,
+                                               workers, pool_kind, cache, report, progress))
+    report.groups.sort(key=lambda group: group.wasted_bytes, reverse=True)
+    return report
+
+
+def iter_duplicate_groups(directory, algorithm=DEFAULT_ALGORITHM, min_size=1, edge_size=EDGE_SIZE,
+                          workers=DEFAULT_WORKERS, pool_kind="thread", cache=None, report=None, progress=None):
+    # Yields each DuplicateGroup as soon as all of its candidates are hashed.
+    # Counters and stage statistics are filled into report as the scan runs;
+    # groups are not kept there, so memory does not grow with the results.
+    # cache is an optional HashCache; files whose stat identity matches a
+    # cached entry are not read again. progress(stage, done, total) is called
+    # every PROGRESS_EVERY files; total is None while the tree is walked.
+    if report is None:
+        report = DuplicateReport()
+    edge_kind = f"{algorithm}:edges{edge_size}"
+    full_kind = f"{algorithm}:full"
+
+    def on_error(path, error):
+        report.errors.append((path, str(error)))
+
+    # Stage 1: bucket by size. Extra hard links to an inode already seen are
+    # dropped here since they do not take any extra space.
+    by_size = defaultdict(list)
+    seen_inodes = set()
+    for path, st in iter_files(directory, on_error=on_error):
+        report.files_scanned += 1
+        report.bytes_scanned += st.st_size
+        if progress and report.files_scanned % PROGRESS_EVERY == 0:
+            progress("walk", report.files_scanned, None)
+        if st.st_size < min_size:
+            continue
+        inode = (st.st_dev, st.st_ino)
+        if st.st_ino and inode in seen_inodes:
+            continue
+        seen_inodes.add(inode)
+        by_size[st.st_size].append((path, stat_identity(st)))
+    seen_inodes.clear()
+
+    size_stage = StageStats("size")
+    candidates = []
+    for size, paths in by_size.items():
+        size_stage.files_in += len(paths)
+        if len(paths) < 2:
+            size_stage.bytes_skipped += size
+            continue
+        size_stage.files_out += len(paths)
+        candidates.extend(paths)
+    by_size.clear()
+    report.stages.append(size_stage)
+
+    with HashPool(workers, pool_kind) as pool:
+        # Stage 2: hash the first and last few KB of each same-size candidate
+        edge_stage = StageStats("edges")
+        by_edges = defaultdict(list)
+        identities = {}
+        for path, identity in candidates:
+            edge_stage.files_in += 1
+            digest = cache.lookup(path, identity, edge_kind) if cache else None
+            if digest is None:
+                identities[path] = identity
+            else:
+                edge_stage.cached += 1
+                by_edges[(identity[0], digest)].append((path, identity))
+        candidates.clear()
+        jobs = ((path, identity[0], algorithm, edge_size) for path, identity in identities.items())
+        for done, ((path, size, _, _), result, error) in enumerate(pool.imap_unordered(hash_edges, jobs), 1):
+            if progress and done % PROGRESS_EVERY == 0:
+                progress("edges", done, len(identities))
+            if error is not None:
+                on_error(path, error)
+                continue
+            digest, read = result
+            edge_stage.bytes_read += read
+            by_edges[(size, digest)].append((path, identities[path]))
+            if cache:
+                cache.store(path, identities[path], edge_kind, digest)
+        identities.clear()
+
+        buckets = []
+        for (size, digest), paths in by_edges.items():
+            if len(paths) < 2:
+                edge_stage.bytes_skipped += size - min(size, 2 * edge_size)
+                continue
+            edge_stage.files_out += len(paths)
+            # Edge hashes of small files already cover the whole content
+            buckets.append((size, paths, digest if size <= 2 * edge_size else None))
+        by_edges.clear()
+        report.stages.append(edge_stage)
+
+        # Stage 3: full content hash, reusing edge digests that covered the
+        # file. Each edge bucket is released as soon as its last member is
+        # hashed, so groups stream out while the pool is still busy.
+        full_stage = StageStats("full")
+        report.stages.append(full_stage)
+        by_digest = {}
+        remaining = {}
+        owners = {}
+        ready = []
+        for bucket_id, (size, paths, edge_digest) in enumerate(buckets):
+            digests = by_digest[bucket_id] = defaultdict(list)
+            remaining[bucket_id] = 0
+            for path, identity in paths:
+                full_stage.files_in += 1
+                digest = edge_digest
+                if digest is None and cache:
+                    digest = cache.lookup(path, identity, full_kind)
+                    if digest is not None:
+                        full_stage.cached += 1
+                if digest is None:
+                    identities[path] = identity
+                    owners[path] = bucket_id
+                    remaining[bucket_id] += 1
+                else:
+                    full_stage.bytes_skipped += size
+                    digests[digest].append(path)
+            if not remaining[bucket_id]:
+                ready.append(bucket_id)
+        sizes = [size for size, _, _ in buckets]
+        buckets.clear()
+
+        for bucket_id in ready:
+            yield from _release_bucket(bucket_id, sizes, by_digest, remaining, full_stage, report)
+        total = len(identities)
+        jobs = ((path, algorithm) for path in list(identities))
+        for done, ((path, _), result, error) in enumerate(pool.imap_unordered(hash_full, jobs), 1):
+            if progress and done % PROGRESS_EVERY == 0:
+                progress("full", done, total)
+            bucket_id = owners.pop(path)
+            identity = identities.pop(path)
+            if error is not None:
+                on_error(path, error)
+            else:
+                digest, read = result
+                full_stage.bytes_read += read
+                by_digest[bucket_id][digest].append(path)
+                if cache:
+                    cache.store(path, identity, full_kind, digest)
+            remaining[bucket_id] -= 1
+            if not remaining[bucket_id]:
+                yield from _release_bucket(bucket_id, sizes, by_digest, remaining, full_stage, report)
+
+
+def _release_bucket(bucket_id, sizes, by_digest, remaining, full_stage, report):
+    del remaining[bucket_id]
+    for digest, same in by_digest.pop(bucket_id).items():
+        if len(same) < 2:
+            continue
+        group = DuplicateGroup(sizes[bucket_id], digest, sorted(same))
+        full_stage.files_out += len(same)
+        report.group_count += 1
+        report.wasted_bytes += group.wasted_bytes
+        yield group
+
+
+def format_stage_summary(report):
+    lines = [f"Scanned {report.files_scanned} files ({format_size(report.bytes_scanned)})"]
+    for stage in report.stages:
+        lines.append(
+            f"  {stage.name:<6} {stage.files_in} in, {stage.files_out} kept, {stage.cached} cached, "
+            f"read {format_size(stage.bytes_read)}, skipped {format_size(stage.bytes_skipped)}"
+        )
+    return "\n".join(lines)
+
+
+def format_progress(stage, done, total):
+    if total is None:
+        return f"walked {done} files"
+    return f"{stage} hashing {done}/{total}"
+
+
+def duplicate_columns():
+    # results.Column definitions for showing duplicate groups in a results
+    # table, one row per file
+    from .results import Column
+    return [
+        Column("group", "Group", width=70, anchor="e"),
+        Column("size", "Size", width=100, anchor="e", format=format_size),
+        Column("copies", "Copies", width=70, anchor="e"),
+        Column("path", "Path", width=520),
+    ]
+
+
+def duplicate_rows(number, group):
+    return [(number, group.size, len(group.paths), path) for path in group.paths]
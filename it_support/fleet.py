@@ -0,0 +1,267 @@
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from .inventory import Inventory
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_HOST_TIMEOUT = 30.0
+DEFAULT_CONNECT_TIMEOUT = 10
+# Master connections stay up this long after their last use, so a second
+# pass over the fleet (or another tool run against the same hosts) skips
+# the SSH handshake entirely
+DEFAULT_CONTROL_PERSIST = "10m"
+DEFAULT_CONTROL_DIR = os.path.join(os.path.expanduser("~"), ".it_support", "ssh")
+REMOTE_PYTHON = "python3"
+
+# Sent to the remote interpreter on stdin; it needs nothing beyond the
+# standard library, so hosts do not need psutil installed. It fills in the
+# Inventory fields the standard library and /proc can give; the rest (CPU
+# frequency, physical cores, NICs, mounts) stay unset and are left out of
+# the host's JSON line.
+REMOTE_SCRIPT = """\
+import json, os, platform, shutil, socket, sys, time
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("model name", "Hardware", "cpu model")):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+def meminfo():
+    values = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                values[name] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+def boot_time():
+    try:
+        with open("/proc/uptime") as f:
+            return time.time() - float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+try:
+    ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+except (AttributeError, ValueError, OSError):
+    ram = None
+memory = meminfo()
+swap_total = memory.get("SwapTotal")
+print(json.dumps({
+    "os_name": platform.system(),
+    "os_release": platform.release(),
+    "processor": cpu_model(),
+    "ram_total": ram,
+    "disk_total": shutil.disk_usage("/").total,
+    "hostname": socket.gethostname(),
+    "architecture": platform.machine(),
+    "cpu_logical": os.cpu_count(),
+    "boot_time": boot_time(),
+    "python_version": platform.python_version(),
+    "python_implementation": platform.python_implementation(),
+    "python_executable": sys.executable,
+    "virtualenv": sys.prefix != sys.base_prefix,
+    "ram_available": memory.get("MemAvailable"),
+    "swap_total": swap_total,
+    "swap_used": swap_total - memory["SwapFree"] if swap_total is not None and "SwapFree" in memory else None,
+}))
+"""
+
+
+@dataclass
+class HostInventory:
+    host: str
+    inventory: Inventory = None
+    error: str = None
+    seconds: float = 0.0
+
+    def to_json(self):
+        record = {"host": self.host, "ok": self.error is None, "seconds": round(self.seconds, 3)}
+        if self.inventory is not None:
+            record.update((name, value) for name, value in asdict(self.inventory).items() if value is not None)
+        if self.error is not None:
+            record["error"] = self.error
+        return json.dumps(record)
+
+
+async def _communicate(process, data, timeout):
+    import asyncio
+    try:
+        return await asyncio.wait_for(process.communicate(data), timeout)
+    except BaseException:
+        # Timed out or cancelled: do not leave the child behind
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+
+class SSHTransport:
+    # Runs commands with the system ssh client. Connections are multiplexed
+    # through ControlMaster sockets, one per host, so every command after the
+    # first to a host reuses the open connection. BatchMode means a host that
+    # would prompt for a password fails instead of hanging. Windows' OpenSSH
+    # has no ControlMaster support, so each command connects afresh there.
+    def __init__(self, user=None, port=None, identity=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 control_dir=DEFAULT_CONTROL_DIR, control_persist=DEFAULT_CONTROL_PERSIST, options=()):
+        self.user = user
+        self.port = port
+        self.identity = identity
+        self.connect_timeout = connect_timeout
+        self.control_dir = control_dir if os.name != "nt" else None
+        self.control_persist = control_persist
+        self.options = tuple(options)
+
+    def _options(self):
+        argv = ["-o", "BatchMode=yes", "-o", f"ConnectTimeout={self.connect_timeout}"]
+        if self.control_dir:
+            # %C is a hash of the connection details, which keeps the socket
+            # path under the Unix socket length limit
+            argv += ["-o", "ControlMaster=auto", "-o", f"ControlPath={os.path.join(self.control_dir, '%C')}",
+                     "-o", f"ControlPersist={self.control_persist}"]
+        if self.user:
+            argv += ["-l", self.user]
+        if self.port:
+            argv += ["-p", str(self.port)]
+        if self.identity:
+            argv += ["-i", self.identity]
+        for option in self.options:
+            argv += ["-o", option]
+        return argv
+
+    def argv(self, host, command):
+        return ["ssh", *self._options(), host, "--", command]
+
+    async def run(self, host, command, data=None, timeout=DEFAULT_HOST_TIMEOUT):
+        # Returns (exit status, stdout bytes, stderr bytes)
+        import asyncio
+        if self.control_dir:
+            os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        process = await asyncio.create_subprocess_exec(
+            *self.argv(host, command), stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        out, err = await _communicate(process, data, timeout)
+        return process.returncode, out, err
+
+    async def close(self, host):
+        # Stops the master connection to host, if one is running
+        import asyncio
+        if not self.control_dir:
+            return
+        process = await asyncio.create_subprocess_exec(
+            "ssh", *self._options(), "-O", "exit", host,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        await process.wait()
+
+
+class LocalTransport:
+    # Stand-in for SSHTransport that runs every "remote" command on this
+    # machine, optionally after a simulated network delay. Lets the fleet
+    # code be exercised end to end without any SSH servers.
+    def __init__(self, delay=0.0, failing=()):
+        self.delay = delay
+        self.failing = set(failing)
+
+    async def run(self, host, command, data=None, timeout=DEFAULT_HOST_TIMEOUT):
+        import asyncio
+
+        async def run_locally():
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if host in self.failing:
+                return 255, b"", f"ssh: connect to host {host} port 22: Connection refused\n".encode()
+            process = await asyncio.create_subprocess_shell(
+                command, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            out, err = await _communicate(process, data, None)
+            return process.returncode, out, err
+
+        return await asyncio.wait_for(run_locally(), timeout)
+
+    async def close(self, host):
+        pass
+
+
+def read_hosts(path):
+    # One host per line; blank lines and # comments are skipped. "-" reads
+    # standard input.
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        hosts = []
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                hosts.append(line)
+        return hosts
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+async def collect_host_inventory(transport, host, timeout=DEFAULT_HOST_TIMEOUT, python=REMOTE_PYTHON):
+    import asyncio
+    started = time.perf_counter()
+    try:
+        status, out, err = await transport.run(host, f"{python} -", REMOTE_SCRIPT.encode(), timeout)
+    except asyncio.TimeoutError:
+        return HostInventory(host, error=f"timed out after {timeout:g}s", seconds=time.perf_counter() - started)
+    except OSError as e:
+        return HostInventory(host, error=str(e), seconds=time.perf_counter() - started)
+    seconds = time.perf_counter() - started
+    if status != 0:
+        lines = err.decode(errors="replace").strip().splitlines()
+        return HostInventory(host, error=lines[-1] if lines else f"exit status {status}", seconds=seconds)
+    try:
+        return HostInventory(host, Inventory(**json.loads(out)), seconds=seconds)
+    except (ValueError, TypeError) as e:
+        return HostInventory(host, error=f"unreadable inventory: {e}", seconds=seconds)
+
+
+async def iter_fleet_inventory(hosts, transport=None, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_HOST_TIMEOUT):
+    # Async generator yielding a HostInventory per host as each one finishes,
+    # with at most concurrency hosts being queried at a time. A host that
+    # fails or times out is reported with an error, never raised.
+    import asyncio
+    transport = transport or SSHTransport()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(host):
+        async with semaphore:
+            return await collect_host_inventory(transport, host, timeout)
+
+    tasks = [asyncio.ensure_future(one(host)) for host in dict.fromkeys(hosts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def run_fleet_inventory(hosts, out=None, transport=None, concurrency=DEFAULT_CONCURRENCY,
+                        timeout=DEFAULT_HOST_TIMEOUT):
+    # Blocking entry point for the CLI: writes one JSON line per host to out
+    # as results arrive. Returns (succeeded, failed).
+    import asyncio
+    out = out or sys.stdout
+    counts = [0, 0]
+
+    async def main():
+        async for result in iter_fleet_inventory(hosts, transport, concurrency, timeout):
+            counts[result.error is not None] += 1
+            out.write(result.to_json() + "\n")
+            out.flush()
+
+    asyncio.run(main())
+    return tuple(counts)
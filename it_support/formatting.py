@@ -0,0 +1,44 @@
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.2f} {unit}" if unit != "B" else f"{num_bytes:.0f} B"
+        num_bytes /= 1024
+    return f"{num_bytes:.2f} TB"
+
+
+def to_mb(num_bytes):
+    return num_bytes / (1024 ** 2)
+
+
+def to_gb(num_bytes):
+    return num_bytes / (1024 ** 3)
+
+
+def format_duration(seconds):
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 172800:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} days"
+
+
+def format_rate(bytes_per_second):
+    return f"{format_size(bytes_per_second)}/s"
+
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values, width=None):
+    values = list(values)
+    if width:
+        values = values[-width:]
+    if not values:
+        return ""
+    top = max(values)
+    if top <= 0:
+        return SPARK_CHARS[0] * len(values)
+    scale = len(SPARK_CHARS) - 1
+    return "".join(SPARK_CHARS[int(value / top * scale)] for value in values)
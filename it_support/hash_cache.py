@@ -0,0 +1,109 @@
+import os
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".it_support", "hash_cache.sqlite")
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (path, kind)
+) WITHOUT ROWID
+"""
+
+
+def stat_identity(st):
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class HashCache:
+    # Stores digests keyed by path and digest kind (algorithm plus stage).
+    # A cached digest is only returned while the file's size, mtime and inode
+    # still match, so changed or replaced files are rehashed.
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        # Imported here so the CLI can read DEFAULT_CACHE_PATH without
+        # loading sqlite3
+        import sqlite3
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(SCHEMA)
+        self._pending = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, path, identity, kind):
+        row = self._db.execute(
+            "SELECT size, mtime_ns, inode, digest FROM digests WHERE path = ? AND kind = ?",
+            (path, kind),
+        ).fetchone()
+        if row and row[:3] == identity:
+            self.hits += 1
+            return row[3]
+        self.misses += 1
+        return None
+
+    def store(self, path, identity, kind, digest):
+        self._db.execute(
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+            (path, kind) + tuple(identity) + (digest,),
+        )
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self._db.commit()
+        self._pending = 0
+
+    def prune(self, prefix=None):
+        # Drop entries whose file is gone or no longer matches its stat
+        # identity. Returns the number of paths removed.
+        self.flush()
+        query = "SELECT DISTINCT path, size, mtime_ns, inode FROM digests"
+        params = ()
+        if prefix:
+            query += " WHERE path >= ? AND path < ?"
+            params = (prefix, prefix + "\uffff")
+        # A path cached under several kinds can have a row per identity, so
+        # stale paths are collected in a set to be counted once
+        stale = set()
+        for path, size, mtime_ns, inode in self._db.execute(query, params):
+            if path in stale:
+                continue
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                stale.add(path)
+                continue
+            if stat_identity(st) != (size, mtime_ns, inode):
+                stale.add(path)
+        self._db.executemany("DELETE FROM digests WHERE path = ?", ((path,) for path in stale))
+        self._db.commit()
+        return len(stale)
+
+    def compact(self):
+        self.flush()
+        self._db.execute("VACUUM")
+
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
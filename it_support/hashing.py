@@ -0,0 +1,133 @@
+import hashlib
+import os
+
+DEFAULT_ALGORITHM = "md5"
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# Bytes hashed from each end of a file by hash_edges
+EDGE_SIZE = 4096
+
+# xxhash is an optional extra; everything else ships with hashlib
+XXHASH_ALGORITHMS = ("xxh64", "xxh3_64", "xxh3_128")
+ALGORITHMS = ("md5", "sha1", "sha256", "blake2b", "blake2s") + XXHASH_ALGORITHMS
+
+
+def new_hasher(algorithm=DEFAULT_ALGORITHM):
+    if algorithm in XXHASH_ALGORITHMS:
+        try:
+            import xxhash
+        except ImportError:
+            raise ValueError(f"{algorithm} needs the 'xxhash' package (pip install xxhash)") from None
+        return getattr(xxhash, algorithm)()
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown hash algorithm '{algorithm}', choose from: {', '.join(ALGORITHMS)}")
+    return hashlib.new(algorithm)
+
+
+def read_size_for(size):
+    # Small buffers waste syscalls on big files, big buffers waste memory on
+    # small ones, so scale the read size with the file.
+    if size < 1024 * 1024:
+        return 64 * 1024
+    if size < 64 * 1024 * 1024:
+        return 1024 * 1024
+    return 4 * 1024 * 1024
+
+
+def hash_full(path, algorithm=DEFAULT_ALGORITHM, read_size=None):
+    # Returns (hex digest, bytes read)
+    hasher = new_hasher(algorithm)
+    read = 0
+    with open(path, "rb", buffering=0) as f:
+        if read_size is None:
+            read_size = read_size_for(os.fstat(f.fileno()).st_size)
+        buffer = bytearray(read_size)
+        view = memoryview(buffer)
+        while n := f.readinto(buffer):
+            hasher.update(view[:n])
+            read += n
+    return hasher.hexdigest(), read
+
+
+def hash_edges(path, size, algorithm=DEFAULT_ALGORITHM, edge_size=EDGE_SIZE):
+    # Hash the first and last edge_size bytes. Returns (hex digest, bytes read);
+    # when the file is small enough to be read whole the digest is the full
+    # content hash.
+    hasher = new_hasher(algorithm)
+    with open(path, "rb") as f:
+        if size <= 2 * edge_size:
+            data = f.read()
+            hasher.update(data)
+            return hasher.hexdigest(), len(data)
+        head = f.read(edge_size)
+        f.seek(size - edge_size)
+        tail = f.read(edge_size)
+    hasher.update(head)
+    hasher.update(tail)
+    return hasher.hexdigest(), len(head) + len(tail)
+
+
+def hash_file(file_path, algorithm=DEFAULT_ALGORITHM, read_size=None):
+    return hash_full(file_path, algorithm, read_size)[0]
+
+
+class HashPool:
+    # Runs hash jobs on a thread or process pool while keeping at most
+    # max_in_flight jobs queued, so walking millions of files does not build
+    # millions of futures. workers=1 hashes inline without any pool.
+    def __init__(self, workers=DEFAULT_WORKERS, kind="thread", max_in_flight=None):
+        if kind not in ("thread", "process"):
+            raise ValueError("kind must be 'thread' or 'process'")
+        self.workers = max(1, int(workers))
+        self.kind = kind
+        self.max_in_flight = max_in_flight or self.workers * 4
+        self._executor = None
+        self._futures = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # Imported on first use: concurrent.futures pulls in logging, and
+            # process pools multiprocessing, which the CLI should not pay for
+            # at start-up
+            from concurrent import futures
+            executor_class = futures.ThreadPoolExecutor if self.kind == "thread" else futures.ProcessPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+            self._futures = futures
+        return self
+
+    def __exit__(self, *exc):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def imap_unordered(self, func, jobs):
+        # Yields (args, result, error) for every args tuple in jobs. Only
+        # OSError is reported through error, anything else propagates.
+        if self._executor is None:
+            for args in jobs:
+                try:
+                    yield args, func(*args), None
+                except OSError as e:
+                    yield args, None, e
+            return
+
+        wait, first_completed = self._futures.wait, self._futures.FIRST_COMPLETED
+        pending = {}
+        for args in jobs:
+            pending[self._executor.submit(func, *args)] = args
+            if len(pending) >= self.max_in_flight:
+                done, _ = wait(pending, return_when=first_completed)
+                yield from self._collect(done, pending)
+        while pending:
+            done, _ = wait(pending, return_when=first_completed)
+            yield from self._collect(done, pending)
+
+    def _collect(self, done, pending):
+        for future in done:
+            args = pending.pop(future)
+            error = future.exception()
+            if error is None:
+                yield args, future.result(), None
+            elif isinstance(error, OSError):
+                yield args, None, error
+            else:
+                raise error
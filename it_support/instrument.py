@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+
+from .formatting import format_size, sparkline
+from .walk import files_visited
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".it_support", "timings.jsonl")
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".it_support", "profiles")
+PROFILE_MODES = ("cprofile", "tracemalloc")
+# Runs kept in the history file; it is trimmed back to this many once it
+# holds twice as many
+HISTORY_LIMIT = 500
+# Seconds between RSS samples while an operation runs
+RSS_SAMPLE_INTERVAL = 0.05
+# Frames kept per allocation in tracemalloc captures
+TRACEMALLOC_FRAMES = 10
+
+
+@dataclass
+class RunStats:
+    operation: str
+    started: float
+    wall_seconds: float = 0.0
+    cpu_seconds: float = None
+    # Bytes read by any means (files, pipes, sockets), including reads
+    # served from the page cache; None where the OS does not report it
+    bytes_read: int = None
+    files_visited: int = 0
+    peak_rss: int = None
+    error: str = None
+    profile_path: str = None
+    # CPU time, bytes read and files visited are process-wide, so they also
+    # count the work of anything that ran at the same time
+    overlapped: bool = False
+
+
+def _process():
+    try:
+        import psutil
+        return psutil.Process()
+    except ImportError:
+        return None
+
+
+def _bytes_read(process):
+    if process is None:
+        return None
+    try:
+        counters = process.io_counters()
+    except (AttributeError, OSError):
+        return None
+    return getattr(counters, "read_chars", counters.read_bytes)
+
+
+def _rss(process):
+    try:
+        return process.memory_info().rss
+    except OSError:
+        return None
+
+
+def _slug(operation):
+    return re.sub(r"[^a-z0-9]+", "-", operation.lower()).strip("-") or "operation"
+
+
+class _RSSSampler:
+    # Samples resident memory on a background thread while an operation
+    # runs. The process-wide peak (ru_maxrss) never goes down, so it cannot
+    # tell one run's peak from an earlier one's.
+    def __init__(self, process, interval):
+        self.process = process
+        self.interval = interval
+        self.peak = _rss(process)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="it-support-rss", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _rss(self.process)
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+class Instrument:
+    # Measures operations run through measure(): wall and CPU time, bytes
+    # read, files visited and peak RSS. Every run is appended to a rolling
+    # JSON-lines history so slow runs can be compared with earlier ones.
+    #
+    # profile="cprofile" writes a .prof file per run (open it with pstats or
+    # snakeviz). cProfile only sees the thread that called measure(), so
+    # work handed to a worker pool is missing; run with one worker for a
+    # complete profile. profile="tracemalloc" writes a snapshot of the
+    # allocations still live at the end of the run, from every thread, that
+    # tracemalloc.Snapshot.load() reads back.
+    def __init__(self, history_path=DEFAULT_HISTORY_PATH, profile=None, profile_dir=DEFAULT_PROFILE_DIR,
+                 history_limit=HISTORY_LIMIT, sample_interval=RSS_SAMPLE_INTERVAL):
+        if profile is not None and profile not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{profile}', choose from: {', '.join(PROFILE_MODES)}")
+        self.history_path = history_path
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.history_limit = history_limit
+        self.sample_interval = sample_interval
+        self._process = _process()
+        self._lock = threading.Lock()
+        # {token: overlapped} for the runs in progress
+        self._running = {}
+        self._history_lines = None
+        self._tracing = 0
+        self._started_tracing = False
+
+    @contextmanager
+    def measure(self, operation):
+        # Yields a RunStats that is filled in when the block exits, whether
+        # it finished, failed or was cancelled
+        stats = RunStats(operation, time.time())
+        token = object()
+        with self._lock:
+            for other in self._running:
+                self._running[other] = True
+            self._running[token] = bool(self._running)
+        profiler = self._start_profile()
+        sampler = _RSSSampler(self._process, self.sample_interval) if self._process is not None else None
+        bytes_before = _bytes_read(self._process)
+        files_before = files_visited.value
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        try:
+            yield stats
+        except BaseException as e:
+            stats.error = type(e).__name__
+            raise
+        finally:
+            stats.wall_seconds = time.perf_counter() - wall_before
+            stats.cpu_seconds = time.process_time() - cpu_before
+            stats.files_visited = files_visited.value - files_before
+            bytes_after = _bytes_read(self._process)
+            if bytes_before is not None and bytes_after is not None:
+                stats.bytes_read = bytes_after - bytes_before
+            if sampler is not None:
+                stats.peak_rss = sampler.stop()
+            stats.profile_path = self._stop_profile(profiler, operation)
+            with self._lock:
+                stats.overlapped = self._running.pop(token)
+            self.record(stats)
+
+    def _start_profile(self):
+        if self.profile == "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        if self.profile == "tracemalloc":
+            import tracemalloc
+            # Tracing is global, so overlapping runs share one session that
+            # stops when the last of them finishes
+            with self._lock:
+                if not self._tracing and not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    self._started_tracing = True
+                self._tracing += 1
+            return tracemalloc
+        return None
+
+    def _stop_profile(self, profiler, operation):
+        if profiler is None:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stem = os.path.join(self.profile_dir, f"{_slug(operation)}-{time.strftime('%Y%m%d_%H%M%S')}")
+        if self.profile == "cprofile":
+            profiler.disable()
+            path = f"{stem}.prof"
+            profiler.dump_stats(path)
+            return path
+        path = f"{stem}.tracemalloc"
+        profiler.take_snapshot().dump(path)
+        with self._lock:
+            self._tracing -= 1
+            if not self._tracing and self._started_tracing:
+                profiler.stop()
+                self._started_tracing = False
+        return path
+
+    def record(self, stats):
+        if not self.history_path:
+            return
+        line = json.dumps(asdict(stats)) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+                if self._history_lines is None:
+                    self._history_lines = len(self._read_lines())
+                with open(self.history_path, "a") as f:
+                    f.write(line)
+                self._history_lines += 1
+                if self._history_lines >= 2 * self.history_limit:
+                    self._trim()
+            except OSError:
+                # Losing a history entry must never fail the operation itself
+                pass
+
+    def _read_lines(self):
+        try:
+            with open(self.history_path) as f:
+                return f.readlines()
+        except FileNotFoundError:
+            return []
+
+    def _trim(self):
+        lines = self._read_lines()[-self.history_limit:]
+        temp_path = f"{self.history_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.writelines(lines)
+        os.replace(temp_path, self.history_path)
+        self._history_lines = len(lines)
+
+    def history(self, operation=None):
+        # Recorded runs, oldest first, optionally only those of operation
+        if not self.history_path:
+            return []
+        with self._lock:
+            lines = self._read_lines()
+        names = {f.name for f in fields(RunStats)}
+        runs = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if operation is None or record.get("operation") == operation:
+                runs.append(RunStats(**{k: v for k, v in record.items() if k in names}))
+        return runs
+
+    def summary(self, stats):
+        # format_stats compared with the earlier runs of the same operation
+        earlier = [run for run in self.history(stats.operation) if run.started < stats.started]
+        return format_stats(stats, earlier)
+
+
+def _median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def format_seconds(seconds):
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def format_stats(stats, earlier=()):
+    parts = [f"{format_seconds(stats.wall_seconds)} wall"]
+    if stats.cpu_seconds is not None:
+        parts.append(f"{format_seconds(stats.cpu_seconds)} CPU")
+    if stats.bytes_read is not None:
+        parts.append(f"{format_size(stats.bytes_read)} read")
+    if stats.files_visited:
+        parts.append(f"{stats.files_visited:,} files")
+    if stats.peak_rss is not None:
+        parts.append(f"peak RSS {format_size(stats.peak_rss)}")
+    line = f"⏱ {stats.operation}: {', '.join(parts)}"
+    if stats.error:
+        line += f" ({stats.error})"
+    if stats.overlapped:
+        line += " [overlapped other tasks]"
+    completed = [run.wall_seconds for run in earlier if not run.error]
+    if completed:
+        median = _median(completed)
+        line += f"; median of {len(completed)} earlier runs {format_seconds(median)}"
+        if median > 0:
+            line += f" ({stats.wall_seconds / median:.1f}x)"
+    if stats.profile_path:
+        line += f"\nProfile written to {stats.profile_path}"
+    return line
+
+
+def format_history(runs, width=20):
+    # One line per operation: run count, last and median wall time and a
+    # sparkline of the most recent runs, oldest on the left
+    by_operation = {}
+    for run in runs:
+        if not run.error:
+            by_operation.setdefault(run.operation, []).append(run)
+    if not by_operation:
+        return "No timings recorded yet."
+    lines = [f"{'Operation':<24} {'Runs':>5} {'Last':>9} {'Median':>9} {'Slowest':>9}  Recent"]
+    for operation, op_runs in sorted(by_operation.items()):
+        walls = [run.wall_seconds for run in op_runs]
+        lines.append(f"{operation:<24} {len(walls):>5} {format_seconds(walls[-1]):>9} "
+                     f"{format_seconds(_median(walls)):>9} {format_seconds(max(walls)):>9}  "
+                     f"{sparkline(walls, width)}")
+    return "\n".join(lines)
@@ -0,0 +1,218 @@
+import platform
+import socket
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+
+import psutil
+
+from .formatting import format_size
+
+# Seconds the static facts (CPU model, OS release, boot time, ...) are
+# reused before they are probed again
+DEFAULT_STATIC_TTL = 3600.0
+
+
+@dataclass
+class Inventory:
+    os_name: str
+    os_release: str
+    processor: str
+    ram_total: int
+    disk_total: int
+    hostname: str = None
+    architecture: str = None
+    cpu_physical: int = None
+    cpu_logical: int = None
+    cpu_freq_max_mhz: float = None
+    boot_time: float = None
+    python_version: str = None
+    python_implementation: str = None
+    python_executable: str = None
+    virtualenv: bool = None
+    # Everything below is volatile and read again on every collection
+    cpu_freq_mhz: float = None
+    ram_available: int = None
+    swap_total: int = None
+    swap_used: int = None
+    # {nic: {"up", "speed", "mtu", "addresses"}}
+    nics: dict = None
+    # {mountpoint: {"device", "fstype"}}
+    mounts: dict = None
+
+
+VOLATILE_FIELDS = ("disk_total", "cpu_freq_mhz", "ram_available", "swap_total", "swap_used", "nics", "mounts")
+STATIC_FIELDS = tuple(f.name for f in fields(Inventory) if f.name not in VOLATILE_FIELDS)
+
+
+def _cpu_model():
+    # platform.processor() shells out to uname on Linux and usually only says
+    # "x86_64" there; /proc/cpuinfo has the actual model name
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("model name", "Hardware", "cpu model")):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def read_static_facts():
+    freq = _cpu_freq()
+    return {
+        "os_name": platform.system(),
+        "os_release": platform.release(),
+        "processor": _cpu_model(),
+        "ram_total": psutil.virtual_memory().total,
+        "hostname": socket.gethostname(),
+        "architecture": platform.machine(),
+        "cpu_physical": psutil.cpu_count(logical=False),
+        "cpu_logical": psutil.cpu_count(logical=True),
+        "cpu_freq_max_mhz": freq.max if freq and freq.max else None,
+        "boot_time": psutil.boot_time(),
+        "python_version": platform.python_version(),
+        "python_implementation": platform.python_implementation(),
+        "python_executable": sys.executable,
+        "virtualenv": sys.prefix != sys.base_prefix,
+    }
+
+
+def _cpu_freq():
+    try:
+        return psutil.cpu_freq()
+    except (OSError, NotImplementedError):
+        return None
+
+
+def _read_nics():
+    stats = psutil.net_if_stats()
+    nics = {}
+    for nic, addresses in psutil.net_if_addrs().items():
+        stat = stats.get(nic)
+        nics[nic] = {
+            "up": stat.isup if stat else None,
+            "speed": stat.speed if stat else None,
+            "mtu": stat.mtu if stat else None,
+            "addresses": sorted(address.address for address in addresses),
+        }
+    return nics
+
+
+def read_volatile_facts():
+    from .disk import DEFAULT_DRIVE, list_mounts
+    freq = _cpu_freq()
+    memory = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+    return {
+        "disk_total": psutil.disk_usage(DEFAULT_DRIVE).total,
+        "cpu_freq_mhz": freq.current if freq else None,
+        "ram_available": memory.available,
+        "swap_total": swap.total,
+        "swap_used": swap.used,
+        "nics": _read_nics(),
+        "mounts": {part.mountpoint: {"device": part.device, "fstype": part.fstype} for part in list_mounts()},
+    }
+
+
+def _flatten(value, prefix, out):
+    # Nested dicts become dotted keys so a diff can point at "nics.eth0.up"
+    # rather than the whole nics table
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(item, f"{prefix}.{key}", out)
+    else:
+        out[prefix] = value
+    return out
+
+
+def diff_inventory(old, new):
+    # {field: (old value, new value)} for everything that differs between two
+    # Inventory snapshots; old may be None for "everything is new"
+    before = {} if old is None else _flatten(asdict(old), "", {})
+    after = _flatten(asdict(new), "", {})
+    return {key[1:]: (before.get(key), after.get(key))
+            for key in sorted(before.keys() | after.keys()) if before.get(key) != after.get(key)}
+
+
+class InventoryCollector:
+    # Collects Inventory snapshots cheaply: static facts are probed once and
+    # reused for static_ttl seconds, volatile ones are read every time, and
+    # the last snapshot is kept so each collection can report what changed.
+    def __init__(self, static_ttl=DEFAULT_STATIC_TTL, clock=time.monotonic):
+        self.static_ttl = static_ttl
+        self.clock = clock
+        self.previous = None
+        self._static = None
+        self._static_time = None
+        self._lock = threading.Lock()
+
+    def collect(self):
+        return self.collect_changes()[0]
+
+    def collect_changes(self):
+        # Returns (Inventory, {field: (old, new)}); the changes are None on
+        # the first collection, when there is nothing to compare against
+        with self._lock:
+            now = self.clock()
+            if self._static is None or now - self._static_time >= self.static_ttl:
+                self._static = read_static_facts()
+                self._static_time = now
+            inventory = Inventory(**self._static, **read_volatile_facts())
+            changes = None if self.previous is None else diff_inventory(self.previous, inventory)
+            self.previous = inventory
+            return inventory, changes
+
+    def invalidate(self):
+        with self._lock:
+            self._static = None
+
+
+_collector = InventoryCollector()
+
+
+def collect_inventory():
+    # Shared collector, so repeated calls from the menu or the GUIs reuse
+    # the cached static facts
+    return _collector.collect()
+
+
+def collect_inventory_changes():
+    return _collector.collect_changes()
+
+
+def format_inventory(inventory):
+    lines = [
+        f"Host: {inventory.hostname}",
+        f"OS: {inventory.os_name} {inventory.os_release} ({inventory.architecture})",
+        f"Processor: {inventory.processor}",
+        f"CPUs: {inventory.cpu_physical} physical, {inventory.cpu_logical} logical"
+        + (f", {inventory.cpu_freq_mhz:.0f} MHz" if inventory.cpu_freq_mhz else ""),
+        f"RAM: {format_size(inventory.ram_total)} ({format_size(inventory.ram_available)} available)",
+        f"Swap: {format_size(inventory.swap_used)} used of {format_size(inventory.swap_total)}",
+        f"Disk Space: {format_size(inventory.disk_total)}",
+        f"Booted: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(inventory.boot_time))}",
+        f"Python: {inventory.python_implementation} {inventory.python_version} ({inventory.python_executable})"
+        + (" in a virtualenv" if inventory.virtualenv else ""),
+        "Network interfaces:",
+    ]
+    for nic, info in sorted(inventory.nics.items()):
+        state = "up" if info["up"] else "down"
+        speed = f", {info['speed']} Mb/s" if info["speed"] else ""
+        lines.append(f"  {nic} ({state}{speed}): {', '.join(info['addresses']) or '-'}")
+    lines.append("Mounts:")
+    for mountpoint, info in sorted(inventory.mounts.items()):
+        lines.append(f"  {mountpoint} ({info['fstype']}, {info['device']})")
+    return "\n".join(lines)
+
+
+def format_changes(changes):
+    if changes is None:
+        return ""
+    if not changes:
+        return "No changes since the last inventory."
+    lines = ["Changed since the last inventory:"]
+    for key, (old, new) in changes.items():
+        lines.append(f"  {key}: {old!r} -> {new!r}")
+    return "\n".join(lines)
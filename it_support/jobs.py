@@ -0,0 +1,186 @@
+import json
+import time
+from dataclasses import asdict, dataclass, is_dataclass
+
+FORMATS = ("json", "ndjson")
+# Jobs run by run-all; dupes and rotate need a directory, so they only run
+# when one is given
+DEFAULT_JOBS = ("disk", "procs", "inventory", "sessions")
+DEFAULT_TOP_PROCESSES = 20
+# Seconds between the two process refreshes that give cpu_percent a value
+DEFAULT_CPU_SAMPLE = 0.5
+
+
+@dataclass
+class JobResult:
+    job: str
+    result: object = None
+    error: str = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        record = {"job": self.job, "ok": self.ok, "seconds": round(self.seconds, 3)}
+        if self.error is not None:
+            record["error"] = self.error
+        else:
+            record["result"] = self.result
+        return record
+
+    def to_json(self, indent=None):
+        return to_json(self.to_dict(), indent)
+
+
+def _json_default(value):
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def to_json(value, indent=None):
+    return json.dumps(value, default=_json_default, indent=indent)
+
+
+# Every job takes keyword options only and returns plain JSON-ready values.
+# The modules behind them are imported on first use, so a run only pays for
+# the jobs it runs.
+
+def disk_job(threshold=20, drive=None):
+    from .disk import check_disk_space, scan_mounts
+    statuses = [check_disk_space(drive, threshold)] if drive else scan_mounts(threshold, threshold)
+    filesystems = []
+    for status in statuses:
+        record = asdict(status)
+        record.update(free_percent=round(status.free_percent, 2), below_threshold=status.below_threshold,
+                      inode_free_percent=status.inode_free_percent,
+                      inodes_below_threshold=status.inodes_below_threshold)
+        filesystems.append(record)
+    return {
+        "filesystems": filesystems,
+        "below_threshold": sum(1 for s in statuses if s.below_threshold or s.inodes_below_threshold),
+        "unreadable": sum(1 for s in statuses if s.error),
+    }
+
+
+def procs_job(top=DEFAULT_TOP_PROCESSES, sort_by="rss", columns=None, cpu_sample=DEFAULT_CPU_SAMPLE):
+    from .processes import DEFAULT_PROCESS_COLUMNS, ProcessSnapshot
+    columns = tuple(columns or DEFAULT_PROCESS_COLUMNS)
+    if sort_by not in columns:
+        columns += (sort_by,)
+    snapshot = ProcessSnapshot(columns)
+    # A single refresh reports 0.0 CPU for every process
+    if "cpu_percent" in columns and cpu_sample > 0:
+        snapshot.refresh()
+        time.sleep(cpu_sample)
+    rows = snapshot.refresh()
+    return {
+        "count": len(rows),
+        "processes": [{column: getattr(proc, column) for column in columns}
+                      for proc in snapshot.top(top, sort_by)],
+    }
+
+
+def dupes_job(directory, algorithm=None, workers=None, cache_path=None):
+    from .duplicates import find_duplicate_groups
+    from .hash_cache import HashCache
+    from .hashing import DEFAULT_ALGORITHM, DEFAULT_WORKERS
+    cache = HashCache(cache_path) if cache_path else None
+    try:
+        report = find_duplicate_groups(directory, algorithm or DEFAULT_ALGORITHM, workers=workers or DEFAULT_WORKERS,
+                                       cache=cache)
+    finally:
+        if cache:
+            cache.close()
+    return asdict(report)
+
+
+def rotate_job(log_dir, codec=None, workers=None):
+    from .hashing import DEFAULT_WORKERS
+    from .logs import DEFAULT_CODEC, rotate_logs
+    rotation = rotate_logs(log_dir, codec or DEFAULT_CODEC, workers=workers or DEFAULT_WORKERS)
+    record = asdict(rotation)
+    record.update(mb_per_second=round(rotation.mb_per_second, 2), ratio=round(rotation.ratio, 4))
+    return record
+
+
+def inventory_job():
+    from .inventory import collect_inventory_changes
+    inventory, changes = collect_inventory_changes()
+    return {"inventory": asdict(inventory), "changes": changes}
+
+
+def sessions_job(record=True, days=None, store_path=None):
+    # record also saves this look at the sessions in the session history,
+    # as the menu does; days adds a summary of that history
+    from .sessions import DEFAULT_STORE_PATH, SessionRecorder, SessionStore, iter_sessions
+    if not record and not days:
+        return {"sessions": [asdict(session) for session in iter_sessions()]}
+    with SessionStore(store_path or DEFAULT_STORE_PATH) as store:
+        sessions = SessionRecorder(store).poll() if record else list(iter_sessions())
+        result = {"sessions": [asdict(session) for session in sessions]}
+        if days:
+            end = time.time()
+            start = end - days * 86400
+            result["history"] = {
+                "start": start,
+                "end": end,
+                "users": [asdict(user) for user in store.logins_per_user(start, end, end)],
+                "longest": [asdict(record) for record in store.longest_sessions(start, end, 10, end)],
+            }
+    return result
+
+
+JOBS = {
+    "disk": disk_job,
+    "procs": procs_job,
+    "dupes": dupes_job,
+    "rotate": rotate_job,
+    "inventory": inventory_job,
+    "sessions": sessions_job,
+}
+
+
+def run_job(name, options=None):
+    # Never raises: a failing job is reported with its error
+    started = time.perf_counter()
+    try:
+        result = JOBS[name](**(options or {}))
+    except Exception as e:
+        return JobResult(name, error=str(e) or type(e).__name__, seconds=time.perf_counter() - started)
+    return JobResult(name, result, seconds=time.perf_counter() - started)
+
+
+def run_jobs(jobs, on_result=None):
+    # Runs [(name, options)] at the same time, one thread each: the jobs
+    # spend most of their time in system calls and I/O, and the heavy ones
+    # have worker pools of their own. on_result(JobResult) is called on the
+    # calling thread as each job finishes. Returns the JobResults in the
+    # order given and the wall time of the whole run.
+    # Imported on first use: concurrent.futures pulls in logging, and the
+    # CLI imports this module at startup for its option defaults
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    started = time.perf_counter()
+    results = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs)), thread_name_prefix="job") as pool:
+        futures = {pool.submit(run_job, name, options): number for number, (name, options) in enumerate(jobs)}
+        for future in as_completed(futures):
+            result = results[futures[future]] = future.result()
+            if on_result:
+                on_result(result)
+    return results, time.perf_counter() - started
+
+
+def run_summary(results, seconds):
+    return {
+        "job": "run-all",
+        "ok": all(result.ok for result in results),
+        "seconds": round(seconds, 3),
+        # Sum of the jobs' own times; more than seconds when they overlapped
+        "job_seconds": round(sum(result.seconds for result in results), 3),
+        "failed": [result.job for result in results if not result.ok],
+    }
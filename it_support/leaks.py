@@ -0,0 +1,223 @@
+import math
+import time
+from dataclasses import dataclass, field
+
+from .formatting import format_duration, format_size, sparkline
+from .processes import ProcessSnapshot
+from .ringbuffer import RingBuffer
+
+DEFAULT_INTERVAL = 10.0
+# Samples of recent history kept per process, and how many processes are
+# tracked at most; together they bound the memory the detector uses
+DEFAULT_HISTORY = 120
+DEFAULT_MAX_PROCESSES = 4096
+# A process is a leak suspect once it has been watched for at least
+# MIN_SPAN seconds and MIN_SAMPLES samples, its memory has grown by at least
+# MIN_SLOPE bytes an hour along a fairly straight line (MIN_R_SQUARED), and
+# it rose on most of the samples where it changed (MIN_RISING)
+MIN_SAMPLES = 10
+MIN_SPAN = 300.0
+MIN_SLOPE = 4 * 1024 * 1024
+MIN_R_SQUARED = 0.8
+MIN_RISING = 0.6
+SNAPSHOT_COLUMNS = ("pid", "name", "rss", "cpu_percent", "num_fds", "num_threads", "create_time")
+# Bytes per sample in a process's ring buffers: rss, cpu, fds and threads
+SAMPLE_BYTES = 8 + 4 + 4 + 4
+
+
+class StreamingRegression:
+    # Least-squares line through points added one at a time, in constant
+    # memory. Means and co-moments are updated Welford-style, which stays
+    # accurate over long runs where raw sums of squares lose precision.
+    def __init__(self):
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x = 0.0
+        self.m2_y = 0.0
+        self.c_xy = 0.0
+
+    def add(self, x, y):
+        self.count += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.count
+        dy = y - self.mean_y
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+
+    @property
+    def slope(self):
+        return self.c_xy / self.m2_x if self.m2_x else 0.0
+
+    @property
+    def r_squared(self):
+        # Share of the variation in y the line explains: near 1 for steady
+        # growth, near 0 for noise
+        if not self.m2_x or not self.m2_y:
+            return 0.0
+        return self.c_xy * self.c_xy / (self.m2_x * self.m2_y)
+
+
+class ProcessTrack:
+    # History of one process. Tracks are keyed by (pid, create_time), so a
+    # reused PID starts a new track instead of continuing the old one. The
+    # ring buffers hold the last `history` samples for display; the memory
+    # trend is fitted over every sample since the process was first seen,
+    # without keeping them.
+    def __init__(self, pid, create_time, name, history, now):
+        self.pid = pid
+        self.create_time = create_time
+        self.name = name
+        self.first_seen = now
+        self.last_seen = now
+        self.rss = RingBuffer(history, "q")
+        self.cpu_percent = RingBuffer(history, "f")
+        self.num_fds = RingBuffer(history, "i")
+        self.num_threads = RingBuffer(history, "i")
+        self.trend = StreamingRegression()
+        self.rises = 0
+        self.falls = 0
+
+    def add(self, proc, now):
+        if len(self.rss):
+            previous = self.rss.latest()
+            if proc.rss > previous:
+                self.rises += 1
+            elif proc.rss < previous:
+                self.falls += 1
+        # Values we may not read are kept as -1 (or NaN for CPU)
+        self.rss.append(proc.rss)
+        self.cpu_percent.append(math.nan if proc.cpu_percent is None else proc.cpu_percent)
+        self.num_fds.append(-1 if proc.num_fds is None else proc.num_fds)
+        self.num_threads.append(-1 if proc.num_threads is None else proc.num_threads)
+        self.trend.add(now - self.first_seen, proc.rss)
+        self.last_seen = now
+
+    @property
+    def span(self):
+        return self.last_seen - self.first_seen
+
+    @property
+    def rising(self):
+        # Share of the changes in memory that were increases
+        changes = self.rises + self.falls
+        return self.rises / changes if changes else 0.0
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in (self.rss, self.cpu_percent, self.num_fds, self.num_threads))
+
+
+@dataclass
+class LeakSuspect:
+    pid: int
+    name: str
+    create_time: float
+    rss: int
+    # Bytes per hour, from the regression over the whole time watched
+    growth_per_hour: float
+    r_squared: float
+    rising: float
+    span: float
+    samples: int
+    history: list = field(default_factory=list)
+
+
+class LeakDetector:
+    # Samples every process's memory, CPU, file descriptors and threads and
+    # flags those whose memory keeps growing. Memory use is bounded by
+    # max_processes * history * SAMPLE_BYTES (about 10 MB by default): the
+    # processes beyond max_processes are counted but not tracked until
+    # others exit, and the history of a process is dropped when it exits.
+    def __init__(self, history=DEFAULT_HISTORY, max_processes=DEFAULT_MAX_PROCESSES, min_samples=MIN_SAMPLES,
+                 min_span=MIN_SPAN, min_slope=MIN_SLOPE, min_r_squared=MIN_R_SQUARED, min_rising=MIN_RISING,
+                 snapshot=None, clock=time.monotonic):
+        self.history = history
+        self.max_processes = max_processes
+        self.min_samples = min_samples
+        self.min_span = min_span
+        self.min_slope = min_slope
+        self.min_r_squared = min_r_squared
+        self.min_rising = min_rising
+        self.snapshot = snapshot or ProcessSnapshot(SNAPSHOT_COLUMNS)
+        self.clock = clock
+        self.tracks = {}
+        self.untracked = 0
+        self.samples = 0
+
+    def sample(self):
+        now = self.clock()
+        # Processes we may not inspect have no create_time or memory to
+        # track, and neither do kernel threads
+        rows = {(proc.pid, proc.create_time): proc for proc in self.snapshot.refresh()
+                if proc.create_time is not None and proc.rss}
+        for key in [key for key in self.tracks if key not in rows]:
+            del self.tracks[key]
+        self.untracked = 0
+        for key, proc in rows.items():
+            track = self.tracks.get(key)
+            if track is None:
+                if len(self.tracks) >= self.max_processes:
+                    self.untracked += 1
+                    continue
+                track = self.tracks[key] = ProcessTrack(proc.pid, proc.create_time, proc.name, self.history, now)
+            track.add(proc, now)
+        self.samples += 1
+
+    def suspects(self):
+        suspects = []
+        for track in self.tracks.values():
+            trend = track.trend
+            if trend.count < self.min_samples or track.span < self.min_span:
+                continue
+            growth = trend.slope * 3600
+            if growth < self.min_slope or trend.r_squared < self.min_r_squared or track.rising < self.min_rising:
+                continue
+            suspects.append(LeakSuspect(track.pid, track.name, track.create_time, track.rss.latest(), growth,
+                                        trend.r_squared, track.rising, track.span, trend.count, list(track.rss)))
+        suspects.sort(key=lambda suspect: suspect.growth_per_hour, reverse=True)
+        return suspects
+
+    def watch(self, interval=DEFAULT_INTERVAL, count=None, wait=None):
+        # Samples every interval seconds and yields the current suspects
+        # after each sample. wait(seconds) replaces time.sleep and may return
+        # True to stop.
+        wait = wait or time.sleep
+        deadline = self.clock()
+        while count is None or self.samples < count:
+            self.sample()
+            yield self.suspects()
+            deadline = max(deadline + interval, self.clock())
+            if wait(max(0, deadline - self.clock())):
+                return
+
+    @property
+    def nbytes(self):
+        return sum(track.nbytes for track in self.tracks.values())
+
+    @property
+    def max_nbytes(self):
+        return self.max_processes * self.history * SAMPLE_BYTES
+
+
+def format_leaks(detector, suspects):
+    lines = [
+        f"Sample {detector.samples}: tracking {len(detector.tracks)} processes in "
+        f"{format_size(detector.nbytes)} of history (at most {format_size(detector.max_nbytes)})"
+        + (f", {detector.untracked} more not tracked" if detector.untracked else "")
+    ]
+    if not suspects:
+        lines.append(f"No process memory is growing steadily (processes are judged after "
+                     f"{format_duration(detector.min_span)} and {detector.min_samples} samples).")
+    for suspect in suspects:
+        lines.append(
+            f"PID {suspect.pid} {suspect.name}: {format_size(suspect.rss)}, growing "
+            f"{format_size(suspect.growth_per_hour)}/h over {format_duration(suspect.span)} "
+            f"(fit {suspect.r_squared:.2f}, rising on {suspect.rising:.0%} of changes)"
+        )
+        # Drawn above the lowest value, so growth shows however large the base
+        low = min(suspect.history)
+        lines.append(f"  {sparkline([value - low for value in suspect.history], 60)}")
+    return "\n".join(lines)
@@ -0,0 +1,259 @@
+import fnmatch
+import os
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from .formatting import format_size
+from .hashing import DEFAULT_WORKERS, HashPool
+from .walk import files_visited
+
+DEFAULT_PATTERN = "*.log"
+DEFAULT_CODEC = "gzip"
+# zip writes one archive file and runs serially; the others compress each
+# log into its own file inside an archive directory, in parallel. zstd is an
+# optional extra.
+CODECS = ("gzip", "xz", "zstd", "zip")
+EXTENSIONS = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+ARCHIVE_PREFIX = "archive_"
+COPY_SIZE = 1024 * 1024
+
+
+@dataclass
+class LogRotation:
+    archive_path: str
+    codec: str = DEFAULT_CODEC
+    archived: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+    # Archived but left in place: changed while being compressed, or the
+    # archive copy did not read back identical
+    kept: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    seconds: float = 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_in / (1024 ** 2) / self.seconds if self.seconds else 0.0
+
+    @property
+    def ratio(self):
+        return self.bytes_out / self.bytes_in if self.bytes_in else 0.0
+
+
+def _open_codec(codec, path, mode):
+    # Codec modules are imported on first use so the CLI does not load lzma
+    # and friends at start-up
+    if codec == "gzip":
+        import gzip
+        return gzip.open(path, mode, compresslevel=6) if "w" in mode else gzip.open(path, mode)
+    if codec == "xz":
+        import lzma
+        return lzma.open(path, mode)
+    return _zstandard().open(path, mode)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd needs the 'zstandard' package (pip install zstandard)") from None
+    return zstandard
+
+
+def _check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"Unknown log codec '{codec}', choose from: {', '.join(CODECS)}")
+    if codec == "zstd":
+        _zstandard()
+
+
+def iter_log_files(log_dir, pattern=DEFAULT_PATTERN):
+    # Yields (path, stat_result) for regular files directly in log_dir that
+    # match pattern. Earlier archives are never picked up again.
+    seen = 0
+    try:
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(ARCHIVE_PREFIX) or not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                if entry.is_file(follow_symlinks=False):
+                    seen += 1
+                    yield entry.path, entry.stat(follow_symlinks=False)
+    finally:
+        files_visited.add(seen)
+
+
+def _copy(source, write):
+    # Streams source into write(); returns (bytes read, crc32)
+    read = 0
+    crc = 0
+    buffer = bytearray(COPY_SIZE)
+    view = memoryview(buffer)
+    with open(source, "rb", buffering=0) as f:
+        while n := f.readinto(buffer):
+            chunk = view[:n]
+            write(chunk)
+            crc = zlib.crc32(chunk, crc)
+            read += n
+    return read, crc
+
+
+def _read_back(f):
+    # Returns (bytes, crc32) of a stream opened for reading
+    read = 0
+    crc = 0
+    while chunk := f.read(COPY_SIZE):
+        crc = zlib.crc32(chunk, crc)
+        read += len(chunk)
+    return read, crc
+
+
+def _fsync(path):
+    with open(path, "ab") as f:
+        os.fsync(f.fileno())
+
+
+def _decoder_errors(codec):
+    # What a corrupt or truncated archive raises while it is read back; none
+    # of these are OSError
+    if codec == "xz":
+        import lzma
+        return EOFError, lzma.LZMAError
+    if codec == "zstd":
+        return EOFError, _zstandard().ZstdError
+    return EOFError, zlib.error
+
+
+def compress_file(source, target, codec=DEFAULT_CODEC):
+    # Compresses source into target, flushes it to disk and decompresses it
+    # again to check every byte made it. Returns (bytes in, bytes out,
+    # verified); an archive that does not decode is not verified, so its log
+    # is kept. Runs on the worker pool.
+    try:
+        with _open_codec(codec, target, "wb") as out:
+            read, crc = _copy(source, out.write)
+        _fsync(target)
+        try:
+            with _open_codec(codec, target, "rb") as check:
+                verified = _read_back(check) == (read, crc)
+        except _decoder_errors(codec):
+            verified = False
+    except BaseException:
+        if os.path.exists(target):
+            os.remove(target)
+        raise
+    return read, os.path.getsize(target), verified
+
+
+def _archive_separately(sources, archive_path, codec, workers):
+    os.makedirs(archive_path)
+    extension = EXTENSIONS[codec]
+    jobs = ((path, os.path.join(archive_path, os.path.basename(path) + extension), codec) for path in sources)
+    with HashPool(workers) as pool:
+        for (path, target, _), result, error in pool.imap_unordered(compress_file, jobs):
+            yield path, result, error
+
+
+def _archive_zip(sources, archive_path):
+    import zipfile
+    written = {}
+    errors = {}
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path in sources:
+            try:
+                with archive.open(os.path.basename(path), "w", force_zip64=True) as member:
+                    written[path] = _copy(path, member.write)
+            except OSError as e:
+                errors[path] = e
+    _fsync(archive_path)
+    with zipfile.ZipFile(archive_path) as archive:
+        for path in sources:
+            if path in errors:
+                yield path, None, errors[path]
+                continue
+            try:
+                with archive.open(os.path.basename(path)) as member:
+                    verified = _read_back(member) == written[path]
+            except (OSError, EOFError, zlib.error, zipfile.BadZipFile):
+                verified = False
+            info = archive.getinfo(os.path.basename(path))
+            yield path, (written[path][0], info.compress_size, verified), None
+
+
+def _new_archive_path(log_dir, suffix):
+    # Two rotations within the same second get numbered archives
+    stem = os.path.join(log_dir, f"{ARCHIVE_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    path, n = stem + suffix, 1
+    while os.path.exists(path):
+        path, n = f"{stem}_{n}{suffix}", n + 1
+    return path
+
+
+def rotate_logs(log_dir, codec=DEFAULT_CODEC, pattern=DEFAULT_PATTERN, workers=DEFAULT_WORKERS,
+                check_cancelled=None):
+    # Archives the logs in log_dir matching pattern and deletes each one once
+    # its archived copy has been read back intact. A log that changed while
+    # it was being compressed is archived but kept, so nothing written in the
+    # meantime is lost. check_cancelled is called before each deletion and
+    # may raise to stop. archive_path is None when no log matched.
+    _check_codec(codec)
+    started = time.perf_counter()
+    stats = dict(iter_log_files(log_dir, pattern))
+    rotation = LogRotation(None, codec)
+    if not stats:
+        return rotation
+    archive_path = _new_archive_path(log_dir, ".zip" if codec == "zip" else "")
+    if codec == "zip":
+        results = _archive_zip(sorted(stats), archive_path)
+    else:
+        results = _archive_separately(sorted(stats), archive_path, codec, workers)
+    rotation.archive_path = archive_path
+
+    for path, result, error in results:
+        if error is not None:
+            rotation.errors.append((path, error))
+            continue
+        read, written, verified = result
+        rotation.archived.append(path)
+        rotation.bytes_in += read
+        rotation.bytes_out += written
+        if check_cancelled:
+            check_cancelled()
+        before = stats[path]
+        try:
+            after = os.stat(path)
+        except OSError as e:
+            rotation.errors.append((path, e))
+            continue
+        unchanged = after.st_size == before.st_size == read and after.st_mtime_ns == before.st_mtime_ns
+        if not (verified and unchanged):
+            rotation.kept.append(path)
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            rotation.errors.append((path, e))
+        else:
+            rotation.deleted.append(path)
+    rotation.seconds = time.perf_counter() - started
+    return rotation
+
+
+def format_rotation(rotation):
+    if rotation.archive_path is None:
+        return "No log files matched, nothing to rotate."
+    lines = [
+        f"Logs archived to {rotation.archive_path} ({rotation.codec})",
+        f"Archived {len(rotation.archived)} files, {format_size(rotation.bytes_in)} -> "
+        f"{format_size(rotation.bytes_out)} ({rotation.ratio:.0%}) at {rotation.mb_per_second:.1f} MB/s",
+        f"Old logs deleted ({len(rotation.deleted)} files).",
+    ]
+    if rotation.kept:
+        lines.append(f"Kept {len(rotation.kept)} files that changed during rotation or failed verification:")
+        lines.extend(f"  {path}" for path in rotation.kept)
+    for path, error in rotation.errors:
+        lines.append(f"  Error: {path}: {error}")
+    return "\n".join(lines)
@@ -0,0 +1,135 @@
+import time
+from dataclasses import dataclass
+
+import psutil
+
+from .ringbuffer import RingBuffer
+
+DEFAULT_HISTORY = 300
+COUNTER_32BIT = 2 ** 32
+
+
+@dataclass
+class NetworkTotals:
+    bytes_sent: int
+    bytes_recv: int
+
+
+@dataclass
+class InterfaceRate:
+    nic: str
+    bytes_sent: float
+    bytes_recv: float
+    packets_sent: float
+    packets_recv: float
+
+
+@dataclass
+class RateSample:
+    timestamp: float
+    elapsed: float
+    total: InterfaceRate
+    interfaces: dict
+
+
+def read_network_totals():
+    counters = psutil.net_io_counters()
+    return NetworkTotals(counters.bytes_sent, counters.bytes_recv)
+
+
+def counter_delta(previous, current):
+    # Counters only go down when a 32-bit counter wraps or the interface is
+    # reset. A wrap shows up as a small forward step across 2**32; anything
+    # else is taken as a reset that restarted counting from zero.
+    if current >= previous:
+        return current - previous
+    if previous < COUNTER_32BIT:
+        wrapped = current + COUNTER_32BIT - previous
+        if wrapped < COUNTER_32BIT // 2:
+            return wrapped
+    return current
+
+
+def read_interface_counters():
+    # nowrap=False so counter_delta sees the raw values
+    return psutil.net_io_counters(pernic=True, nowrap=False)
+
+
+class BandwidthSampler:
+    # Turns cumulative per-NIC counters into bytes/s and packets/s. The
+    # recent receive/send rates of every interface (and of the "total") are
+    # kept in fixed-size ring buffers; interfaces that disappear drop their
+    # history.
+    def __init__(self, interval=1.0, history=DEFAULT_HISTORY, read_counters=read_interface_counters,
+                 clock=time.monotonic):
+        self.interval = interval
+        self.history_size = history
+        self.read_counters = read_counters
+        self.clock = clock
+        self.timestamps = RingBuffer(history)
+        self.history = {}
+        self._previous = None
+        self._previous_time = None
+
+    def sample(self):
+        # Returns a RateSample, or None on the first call which only primes
+        # the counters
+        now = self.clock()
+        counters = self.read_counters()
+        previous, previous_time = self._previous, self._previous_time
+        self._previous, self._previous_time = counters, now
+        if previous is None or now <= previous_time:
+            return None
+
+        elapsed = now - previous_time
+        interfaces = {}
+        totals = [0.0, 0.0, 0.0, 0.0]
+        for nic, current in counters.items():
+            before = previous.get(nic)
+            if before is None:
+                continue
+            rates = (
+                counter_delta(before.bytes_sent, current.bytes_sent) / elapsed,
+                counter_delta(before.bytes_recv, current.bytes_recv) / elapsed,
+                counter_delta(before.packets_sent, current.packets_sent) / elapsed,
+                counter_delta(before.packets_recv, current.packets_recv) / elapsed,
+            )
+            interfaces[nic] = InterfaceRate(nic, *rates)
+            totals = [a + b for a, b in zip(totals, rates)]
+        total = InterfaceRate("total", *totals)
+
+        self.timestamps.append(now)
+        for rate in list(interfaces.values()) + [total]:
+            recv, sent = self.history.get(rate.nic) or self._new_history(rate.nic)
+            recv.append(rate.bytes_recv)
+            sent.append(rate.bytes_sent)
+        for nic in [nic for nic in self.history if nic != "total" and nic not in counters]:
+            del self.history[nic]
+        return RateSample(now, elapsed, total, interfaces)
+
+    def _new_history(self, nic):
+        buffers = self.history[nic] = (RingBuffer(self.history_size), RingBuffer(self.history_size))
+        return buffers
+
+    def run(self, count=None, wait=None):
+        # Yields a RateSample every interval until count samples have been
+        # produced. Ticks are scheduled against absolute deadlines, so the
+        # time spent sampling does not add drift; ticks missed while the
+        # consumer was busy are skipped rather than bunched up. wait(seconds)
+        # replaces time.sleep and may return True to stop early.
+        wait = wait or time.sleep
+        self.sample()
+        deadline = self.clock()
+        produced = 0
+        while count is None or produced < count:
+            deadline += self.interval
+            now = self.clock()
+            if deadline < now:
+                missed = (now - deadline) // self.interval + 1
+                deadline += missed * self.interval
+            if wait(deadline - now):
+                return
+            sample = self.sample()
+            if sample is not None:
+                produced += 1
+                yield sample
@@ -0,0 +1,210 @@
+import heapq
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import partial
+
+import psutil
+
+DEFAULT_PROCESS_COLUMNS = ("pid", "name", "cpu_percent", "rss", "num_threads")
+FD_ATTRIBUTE = "num_handles" if os.name == "nt" else "num_fds"
+# psutil attribute needed for each column
+COLUMN_ATTRIBUTES = {
+    "pid": "pid",
+    "name": "name",
+    "cpu_percent": "cpu_percent",
+    "rss": "memory_info",
+    "vms": "memory_info",
+    "num_threads": "num_threads",
+    "num_fds": FD_ATTRIBUTE,
+    "open_files": "open_files",
+    "cmdline": "cmdline",
+    "username": "username",
+    "status": "status",
+    "create_time": "create_time",
+}
+PROCESS_COLUMNS = tuple(COLUMN_ATTRIBUTES)
+
+
+@dataclass
+class ProcessInfo:
+    pid: int
+    name: str
+    rss: int
+    cpu_percent: float = None
+    vms: int = None
+    num_threads: int = None
+    num_fds: int = None
+    open_files: int = None
+    cmdline: str = None
+    username: str = None
+    status: str = None
+    create_time: float = None
+
+
+@dataclass
+class RefreshCost:
+    wall_seconds: float
+    cpu_seconds: float
+    processes: int
+    new_processes: int
+
+
+def iter_processes():
+    # Processes we may not inspect report memory_info as None instead of
+    # raising, so they are listed with 0 bytes.
+    for proc in psutil.process_iter(attrs=["pid", "name", "memory_info"]):
+        info = proc.info
+        memory = info["memory_info"]
+        yield ProcessInfo(info["pid"], info["name"], memory.rss if memory else 0)
+
+
+def _to_process_info(values):
+    memory = values.get("memory_info")
+    open_files = values.get("open_files")
+    cmdline = values.get("cmdline")
+    return ProcessInfo(
+        pid=values["pid"],
+        name=values.get("name"),
+        rss=memory.rss if memory else 0,
+        cpu_percent=values.get("cpu_percent"),
+        vms=memory.vms if memory else None,
+        num_threads=values.get("num_threads"),
+        num_fds=values.get(FD_ATTRIBUTE),
+        open_files=len(open_files) if open_files is not None else None,
+        cmdline=" ".join(cmdline) if cmdline else None,
+        username=values.get("username"),
+        status=values.get("status"),
+        create_time=values.get("create_time"),
+    )
+
+
+def sort_key(column):
+    # Missing values (access denied, or a column that was not collected)
+    # sort below every real value
+    def key(row):
+        value = getattr(row, column)
+        return (value is not None, value if value is not None else 0)
+    return key
+
+
+class ProcessSnapshot:
+    # Collects the requested columns for every process in one pass. Process
+    # objects are kept between refreshes, which is what makes cpu_percent a
+    # cheap delta instead of a blocking interval measurement; a process seen
+    # for the first time reports 0.0 CPU until the next refresh. Reused PIDs
+    # are detected through create_time.
+    def __init__(self, columns=DEFAULT_PROCESS_COLUMNS):
+        unknown = [column for column in columns if column not in COLUMN_ATTRIBUTES]
+        if unknown:
+            raise ValueError(f"Unknown process columns: {', '.join(unknown)}")
+        self.columns = tuple(columns)
+        self.attributes = sorted({COLUMN_ATTRIBUTES[column] for column in columns} | {"pid", "create_time"})
+        self.rows = []
+        self.last_cost = None
+        self._processes = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            started = time.perf_counter()
+            cpu_started = time.thread_time()
+            rows = []
+            cached = {}
+            new_processes = 0
+            for pid in psutil.pids():
+                proc = self._processes.get(pid)
+                try:
+                    # is_running() compares against a fresh Process(pid), so
+                    # the reuse check costs one more read of /proc/<pid>/stat;
+                    # the create_time of a cached Process is itself cached
+                    # and cannot show a reused PID
+                    if proc is None or not proc.is_running():
+                        proc = psutil.Process(pid)
+                        new_processes += 1
+                    # Checked before oneshot() so a replacement Process has
+                    # its attributes read through the cache too
+                    with proc.oneshot():
+                        values = proc.as_dict(attrs=self.attributes, ad_value=None)
+                except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                    continue
+                except psutil.AccessDenied:
+                    values = {"pid": pid}
+                cached[pid] = proc
+                rows.append(_to_process_info(values))
+            self._processes = cached
+            self.rows = rows
+            self.last_cost = RefreshCost(time.perf_counter() - started, time.thread_time() - cpu_started,
+                                         len(rows), new_processes)
+            return rows
+
+    def top(self, n=None, column="rss", smallest=False):
+        # Heap selection is O(len * log n); only a request for every row
+        # falls back to a full sort
+        if column not in COLUMN_ATTRIBUTES:
+            raise ValueError(f"Unknown process column '{column}'")
+        key = sort_key(column)
+        if n is None or n >= len(self.rows):
+            return sorted(self.rows, key=key, reverse=not smallest)
+        select = heapq.nsmallest if smallest else heapq.nlargest
+        return select(n, self.rows, key=key)
+
+    def watch(self, interval=2.0, count=None, wait=None):
+        # Refreshes every interval seconds and yields (rows, cost) each tick
+        wait = wait or time.sleep
+        produced = 0
+        deadline = time.monotonic()
+        while count is None or produced < count:
+            rows = self.refresh()
+            produced += 1
+            yield rows, self.last_cost
+            deadline = max(deadline + interval, time.monotonic())
+            if (count is None or produced < count) and wait(max(0, deadline - time.monotonic())):
+                return
+
+
+COLUMN_TITLES = {
+    "pid": "PID",
+    "name": "Name",
+    "cpu_percent": "CPU %",
+    "rss": "Memory (MB)",
+    "vms": "Virtual (MB)",
+    "num_threads": "Threads",
+    "num_fds": "Handles" if os.name == "nt" else "FDs",
+    "open_files": "Open files",
+    "cmdline": "Command line",
+    "username": "User",
+    "status": "Status",
+    "create_time": "Started",
+}
+
+
+def format_column(column, value):
+    if value is None:
+        return "-"
+    if column in ("rss", "vms"):
+        return f"{value / (1024 ** 2):.2f}"
+    if column == "cpu_percent":
+        return f"{value:.1f}"
+    if column == "create_time":
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+    return str(value)
+
+
+def process_columns(columns=DEFAULT_PROCESS_COLUMNS):
+    # results.Column definitions for showing processes in a results table
+    from .results import Column
+    return [Column(column, COLUMN_TITLES[column], width=260 if column in ("name", "cmdline") else 100,
+                   anchor="w" if column in ("name", "cmdline", "username", "status") else "e",
+                   format=partial(format_column, column))
+            for column in columns]
+
+
+def process_rows(processes, columns=DEFAULT_PROCESS_COLUMNS):
+    return [tuple(getattr(proc, column) for column in columns) for proc in processes]
+
+
+def format_cost(cost):
+    return (f"Refreshed {cost.processes} processes ({cost.new_processes} new) in "
+            f"{cost.wall_seconds * 1000:.1f} ms wall, {cost.cpu_seconds * 1000:.1f} ms CPU")
@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class Column:
+    name: str
+    title: str
+    width: int = 120
+    anchor: str = "w"
+    # Turns a raw value into cell text. Only rows on screen are formatted,
+    # so this may be as slow as it likes.
+    format: object = str
+
+
+class ResultSet:
+    # Rows of raw values, one tuple per row and one value per column, plus
+    # the current view: the indices of the rows that pass the filter, in
+    # sort order. Nothing is formatted here; the table view formats only
+    # the window of rows it shows, which is what keeps a million rows cheap.
+    def __init__(self, columns, rows=()):
+        self.columns = list(columns)
+        self.rows = []
+        self.view = []
+        self.sort_column = None
+        self.descending = False
+        self.filter_text = ""
+        # Lower-cased text of each row for filtering and the values of each
+        # sorted-by column, built on first use and extended as rows arrive
+        self._search = []
+        self._keys = {}
+        self._unsorted = False
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self.view)
+
+    def column_index(self, name):
+        for index, column in enumerate(self.columns):
+            if column.name == name:
+                return index
+        raise ValueError(f"Unknown column '{name}'")
+
+    def extend(self, rows):
+        start = len(self.rows)
+        self.rows.extend(rows)
+        added = range(start, len(self.rows))
+        if self.filter_text:
+            self._build_search()
+            added = [i for i in added if self.filter_text in self._search[i]]
+        self.view.extend(added)
+        # Re-sorting is left to the next window() so a stream of small
+        # batches costs one sort per redraw rather than one per batch
+        if self.sort_column is not None and added:
+            self._unsorted = True
+
+    def clear(self):
+        self.rows.clear()
+        self.view.clear()
+        self._search.clear()
+        self._keys.clear()
+        self._unsorted = False
+
+    def sort(self, column, descending=False):
+        self.sort_column = column
+        self.descending = descending
+        self._unsorted = True
+
+    def filter(self, text):
+        # Keeps the rows where any column contains text, ignoring case. A
+        # filter that narrows the current one only rescans the current view.
+        text = text.strip().lower()
+        if text == self.filter_text:
+            return
+        if not text:
+            candidates = range(len(self.rows))
+        else:
+            self._build_search()
+            search = self._search
+            previous = self.view if self.filter_text and self.filter_text in text else range(len(self.rows))
+            candidates = [i for i in previous if text in search[i]]
+        self.filter_text = text
+        self.view = list(candidates)
+        if self.sort_column is not None:
+            self._unsorted = True
+
+    def _build_search(self):
+        rows = self.rows
+        self._search.extend("\t".join(map(str, rows[i])).lower() for i in range(len(self._search), len(rows)))
+
+    def _ensure_sorted(self):
+        if not self._unsorted:
+            return
+        self._unsorted = False
+        if self.sort_column is None:
+            self.view.sort()
+            return
+        # Sorting by a plain list lookup is several times faster than a key
+        # function per row. Python's sort is stable, also reversed, so rows
+        # with equal keys keep their original order (a duplicate group stays
+        # together, for example). Missing values go last either way.
+        keys = self._column_values(self.column_index(self.sort_column))
+        view = self.view
+        missing = []
+        if None in keys:
+            missing = [i for i in view if keys[i] is None]
+            view = [i for i in view if keys[i] is not None]
+        view.sort(key=keys.__getitem__, reverse=self.descending)
+        self.view = view + missing if missing else view
+
+    def _column_values(self, index):
+        values = self._keys.setdefault(index, [])
+        if len(values) < len(self.rows):
+            values.extend(row[index] for row in self.rows[len(values):])
+        return values
+
+    def window(self, offset, count):
+        # [(row index, row)] for count rows of the view starting at offset
+        self._ensure_sorted()
+        return [(i, self.rows[i]) for i in self.view[offset:offset + count]]
+
+    def format_row(self, row):
+        return tuple("" if value is None else column.format(value) for column, value in zip(self.columns, row))
@@ -0,0 +1,161 @@
+import time
+from tkinter import ttk
+
+# Milliseconds between redraws while rows are streaming in, and how long
+# the filter waits after the last keystroke before rescanning the rows
+REDRAW_MS = 100
+# Redraws that got slow (re-sorting a huge view as rows stream in) are
+# spaced out to keep their share of the Tk thread's time below 1/N
+REDRAW_BACKOFF = 5
+FILTER_DELAY_MS = 250
+SORT_ARROWS = {False: " ▲", True: " ▼"}
+
+
+class ResultsTable:
+    # Virtualized table over a ResultSet. The Treeview only ever holds
+    # `height` items, refilled from the result set as the view scrolls, so
+    # a million rows take no longer to show than twenty: no widget per row,
+    # and only the visible rows are formatted. Click a heading to sort by
+    # it (again to reverse); type in the filter box to narrow the rows.
+    def __init__(self, parent, height=20, style=None):
+        self.height = height
+        self.results = None
+        self.offset = 0
+        self._redraw_pending = None
+        self._redraw_seconds = 0.0
+        self._filter_pending = None
+        self.frame = ttk.Frame(parent, style=style) if style else ttk.Frame(parent)
+
+        bar = ttk.Frame(self.frame)
+        bar.pack(fill="x", pady=(0, 4))
+        ttk.Label(bar, text="Filter:").pack(side="left")
+        self.filter_entry = ttk.Entry(bar, width=30)
+        self.filter_entry.pack(side="left", padx=5)
+        self.filter_entry.bind("<KeyRelease>", self._on_filter_key)
+        self.position_label = ttk.Label(bar, anchor="e")
+        self.position_label.pack(side="right")
+
+        body = ttk.Frame(self.frame)
+        body.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(body, show="headings", height=height, selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.summary_label = ttk.Label(self.frame, anchor="w", justify="left")
+        self.summary_label.pack(fill="x", pady=(4, 0))
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._on_wheel)
+        for key, rows in (("<Prior>", -height), ("<Next>", height), ("<Up>", -1), ("<Down>", 1)):
+            self.tree.bind(key, lambda event, rows=rows: self._scroll_key(rows))
+        self.tree.bind("<Home>", lambda event: self._scroll_to(0) or "break")
+        self.tree.bind("<End>", lambda event: self._scroll_to(len(self.results or ())) or "break")
+
+    def show(self, results):
+        # Displays results (a ResultSet) from the top, replacing whatever was
+        # shown before. Call refresh() after adding rows to it.
+        self.results = results
+        self.offset = 0
+        names = [column.name for column in results.columns]
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=names, displaycolumns=names)
+        for column in results.columns:
+            self.tree.heading(column.name, text=column.title,
+                              command=lambda name=column.name: self.sort_by(name))
+            self.tree.column(column.name, width=column.width, anchor=column.anchor, stretch=True)
+        self.filter_entry.delete(0, "end")
+        if results.filter_text:
+            self.filter_entry.insert(0, results.filter_text)
+        self.set_summary("")
+        self._update_headings()
+        self._redraw()
+
+    def refresh(self):
+        # Schedules a redraw; calls made before it runs are folded into one
+        if self._redraw_pending is None:
+            delay = max(REDRAW_MS, int(self._redraw_seconds * 1000 * REDRAW_BACKOFF))
+            self._redraw_pending = self.tree.after(delay, self._redraw)
+
+    def set_summary(self, text):
+        self.summary_label.configure(text=text)
+
+    def append_summary(self, text):
+        current = self.summary_label.cget("text")
+        self.set_summary(f"{current}\n{text}" if current else text)
+
+    def sort_by(self, name):
+        if self.results is None:
+            return
+        descending = not self.results.descending if self.results.sort_column == name else False
+        self.results.sort(name, descending)
+        self._update_headings()
+        self._scroll_to(0)
+
+    def _update_headings(self):
+        for column in self.results.columns:
+            arrow = SORT_ARROWS[self.results.descending] if column.name == self.results.sort_column else ""
+            self.tree.heading(column.name, text=column.title + arrow)
+
+    def _on_filter_key(self, event):
+        if self._filter_pending is not None:
+            self.tree.after_cancel(self._filter_pending)
+        self._filter_pending = self.tree.after(FILTER_DELAY_MS, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_pending = None
+        if self.results is not None:
+            self.results.filter(self.filter_entry.get())
+            self._scroll_to(0)
+
+    def _scroll_to(self, offset):
+        total = len(self.results) if self.results is not None else 0
+        self.offset = max(0, min(offset, total - self.height))
+        self._redraw()
+
+    def _scroll_key(self, rows):
+        self._scroll_to(self.offset + rows)
+        return "break"
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self._scroll_to(self.offset - 3)
+        else:
+            self._scroll_to(self.offset + 3)
+        return "break"
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        total = len(self.results) if self.results is not None else 0
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * total))
+        elif action == "scroll":
+            step = self.height if unit == "pages" else 1
+            self._scroll_to(self.offset + int(amount) * step)
+
+    def _redraw(self):
+        self._redraw_pending = None
+        results = self.results
+        if results is None:
+            return
+        started = time.perf_counter()
+        total = len(results)
+        # A new filter may have shrunk the view since the last redraw
+        self.offset = max(0, min(self.offset, total - self.height))
+        window = results.window(self.offset, self.height)
+        items = self.tree.get_children()
+        for slot, (_, row) in enumerate(window):
+            values = results.format_row(row)
+            if slot < len(items):
+                self.tree.item(items[slot], values=values)
+            else:
+                self.tree.insert("", "end", values=values)
+        if len(items) > len(window):
+            self.tree.delete(*items[len(window):])
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(window)) / total))
+            self.position_label.configure(
+                text=f"Rows {self.offset + 1:,}-{self.offset + len(window):,} of {total:,}"
+                     + (f" ({len(results.rows):,} before filtering)" if total != len(results.rows) else ""))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+            self.position_label.configure(text="No rows" if not results.rows else "No rows match the filter")
+        self._redraw_seconds = time.perf_counter() - started
@@ -0,0 +1,45 @@
+from array import array
+
+
+class RingBuffer:
+    # Fixed-capacity history backed by a typed array, so memory is allocated
+    # once up front and never grows. Iterates from oldest to newest.
+    def __init__(self, capacity, typecode="d"):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._data = array(typecode, [0]) * capacity
+        self._next = 0
+        self._count = 0
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        if self._count < self.capacity:
+            return iter(self._data[:self._count])
+        return iter(self._data[self._next:] + self._data[:self._next])
+
+    def latest(self):
+        if not self._count:
+            raise IndexError("ring buffer is empty")
+        return self._data[self._next - 1]
+
+    def tail(self, n):
+        # The newest n values, oldest first
+        values = list(self)
+        return values[-n:] if n else []
+
+    @property
+    def nbytes(self):
+        return self._data.itemsize * self.capacity
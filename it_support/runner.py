@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 50
+# Messages handled per poll, so a chatty task cannot starve the mainloop
+MAX_MESSAGES_PER_POLL = 500
+
+
+class Cancelled(Exception):
+    pass
+
+
+def iter_batches(chunks, batch_size, flush_seconds, check=None, clock=time.monotonic, join="".join):
+    # Joins text chunks into batches of up to batch_size chunks, cutting a
+    # batch short once flush_seconds have passed since the last one so slow
+    # producers still show progress. check() is called for every chunk.
+    # join=list batches other items, such as table rows, as lists.
+    batch = []
+    flushed = clock()
+    for chunk in chunks:
+        if check:
+            check()
+        batch.append(chunk)
+        if len(batch) >= batch_size or clock() - flushed > flush_seconds:
+            yield join(batch)
+            batch = []
+            flushed = clock()
+    if batch:
+        yield join(batch)
+
+
+class TaskHandle:
+    # Passed to the task function as its first argument. Everything here is
+    # safe to call from the worker thread; callbacks run on the Tk thread.
+    def __init__(self, runner, name, on_done, on_error, on_progress, on_item):
+        self.name = name
+        self.status = ""
+        self._runner = runner
+        self._cancel = threading.Event()
+        self._callbacks = {
+            "done": on_done,
+            "error": on_error,
+            "progress": on_progress,
+            "item": on_item,
+        }
+        self.future = None
+        self.stats = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        # A task cancelled before it started never reaches _run, so report
+        # it here instead
+        if self.future is not None and self.future.cancel():
+            self._runner._post("cancelled", self, None)
+
+    def wait(self, timeout):
+        # Sleeps up to timeout seconds; returns True as soon as the task is
+        # cancelled
+        return self._cancel.wait(timeout)
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled(self.name)
+
+    def progress(self, message):
+        self.check()
+        self._runner._post("progress", self, message)
+
+    def emit(self, item):
+        self.check()
+        self._runner._post("item", self, item)
+
+
+class TaskRunner:
+    # Runs blocking work on a thread pool and hands results back to the Tk
+    # mainloop through a queue polled with root.after(). on_change is called
+    # on the Tk thread whenever the set of running tasks or their status
+    # changes, which is what drives the GUIs' running-task indicator. With
+    # an Instrument every task is measured under its name, and on_stats gets
+    # the handle and its RunStats on the Tk thread after the task finished.
+    def __init__(self, root, workers=4, on_change=None, poll_ms=POLL_MS, instrument=None, on_stats=None):
+        self.root = root
+        self.on_change = on_change
+        self.instrument = instrument
+        self.on_stats = on_stats
+        self.poll_ms = poll_ms
+        self.tasks = []
+        self._queue = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="it-support")
+        self._closed = False
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, name, func, *args, on_done=None, on_error=None, on_progress=None, on_item=None):
+        handle = TaskHandle(self, name, on_done, on_error, on_progress, on_item)
+        self.tasks.append(handle)
+        handle.future = self._executor.submit(self._run, handle, func, args)
+        self._changed()
+        return handle
+
+    def cancel_all(self):
+        for handle in list(self.tasks):
+            handle.cancel()
+
+    def shutdown(self):
+        self._closed = True
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, handle, func, args):
+        if self.instrument is None:
+            kind, payload = self._call(handle, func, args)
+            self._post(kind, handle, payload)
+            return
+        with self.instrument.measure(handle.name) as stats:
+            kind, payload = self._call(handle, func, args)
+            if kind == "error":
+                stats.error = type(payload).__name__
+            elif kind == "cancelled":
+                stats.error = Cancelled.__name__
+        self._post(kind, handle, payload)
+        self._post("stats", handle, stats)
+
+    def _call(self, handle, func, args):
+        # Returns the message kind and payload the task finished with
+        try:
+            handle.check()
+            return "done", func(handle, *args)
+        except Cancelled:
+            return "cancelled", None
+        except Exception as e:
+            return "error", e
+
+    def _post(self, kind, handle, payload):
+        self._queue.put((kind, handle, payload))
+
+    def _poll(self):
+        if self._closed:
+            return
+        for _ in range(MAX_MESSAGES_PER_POLL):
+            try:
+                kind, handle, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(kind, handle, payload)
+        self.root.after(self.poll_ms, self._poll)
+
+    def _dispatch(self, kind, handle, payload):
+        if kind == "stats":
+            handle.stats = payload
+            if self.on_stats is not None:
+                self.on_stats(handle, payload)
+            return
+        finished = kind in ("done", "error", "cancelled")
+        if finished and handle in self.tasks:
+            self.tasks.remove(handle)
+        if kind == "progress":
+            handle.status = payload
+        # Late items and progress from a cancelled task are dropped
+        if handle.cancelled and kind in ("item", "progress"):
+            return
+        callback = handle._callbacks.get(kind)
+        if callback is not None:
+            callback(payload)
+        elif kind == "error":
+            raise payload
+        if finished or kind == "progress":
+            self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self.tasks)
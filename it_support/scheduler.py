@@ -0,0 +1,8 @@
+import subprocess
+
+
+def create_scheduled_task(task_name, script_path, time="12:00"):
+    # Raises subprocess.CalledProcessError when schtasks rejects the task
+    command = f"schtasks /create /tn {task_name} /tr {script_path} /sc once /st {time}"
+    subprocess.run(command, shell=True, check=True)
+    return command
@@ -0,0 +1,350 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from .formatting import format_duration, sparkline
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser("~"), ".it_support", "sessions.sqlite")
+DEFAULT_POLL_INTERVAL = 60.0
+# A session that disappeared after the recorder was not running for longer
+# than this is closed at the last poll that saw it, rather than at the
+# current one, so downtime does not add hours to its length
+MAX_POLL_GAP = 900.0
+HOUR = 3600
+DAY = 86400
+# Over ranges longer than this, the longest sessions are found by walking
+# the duration index down from the top until enough fall in the range,
+# rather than sorting every session started in it
+LONGEST_SCAN_DAYS = 31
+
+# events is the append-only log of every session start and end. sessions
+# holds one row per session for lookups and is only ever updated to close
+# it. hourly and daily_users are rollups kept up to date as events arrive,
+# so reports over a year read a few thousand rows instead of every session.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    session INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    terminal TEXT NOT NULL,
+    host TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+CREATE INDEX IF NOT EXISTS sessions_duration ON sessions (duration) WHERE duration IS NOT NULL;
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (ended) WHERE ended IS NULL;
+CREATE TABLE IF NOT EXISTS hourly (
+    hour INTEGER PRIMARY KEY,
+    logins INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    peak INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS daily_users (
+    day INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    logins INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+
+@dataclass
+class SessionInfo:
+    name: str
+    terminal: str
+    host: str
+    started: float
+
+
+@dataclass
+class SessionRecord:
+    name: str
+    terminal: str
+    host: str
+    started: float
+    ended: float = None
+    # Up to now for a session that is still open
+    duration: float = 0.0
+
+
+@dataclass
+class HourActivity:
+    hour: float
+    logins: int
+    # Average number of sessions open during the hour (session time / 1 h)
+    average: float
+    # Most sessions seen open at once by a poll during the hour
+    peak: int
+
+
+@dataclass
+class UserActivity:
+    name: str
+    logins: int
+    seconds: float
+
+
+def iter_sessions():
+    import psutil
+    for session in psutil.users():
+        yield SessionInfo(session.name, session.terminal, session.host, session.started)
+
+
+def session_key(name, terminal, host, started):
+    return name, terminal or "", host or "", float(started)
+
+
+class SessionStore:
+    # SQLite store of session history. Safe to share between threads: every
+    # call holds the store's lock.
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        # Imported here so the CLI can read DEFAULT_STORE_PATH without
+        # loading sqlite3
+        import sqlite3
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def open_sessions(self):
+        # {session key: row id} of the sessions without an end
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, terminal, host, started FROM sessions WHERE ended IS NULL").fetchall()
+        return {session_key(*row[1:]): row[0] for row in rows}
+
+    def last_poll(self):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'last_poll'").fetchone()
+        return row[0] if row else None
+
+    def record(self, now, started=(), ended=(), ended_at=None, open_count=None):
+        # One poll's worth of changes in a single transaction: starts of the
+        # SessionInfo in started, ends of the session ids in ended (at
+        # ended_at, default now), and the number of sessions open now for
+        # the hour's peak
+        ended_at = now if ended_at is None else ended_at
+        with self._lock, self._db:
+            db = self._db
+            for session in started:
+                cursor = db.execute(
+                    "INSERT INTO sessions (name, terminal, host, started) VALUES (?, ?, ?, ?)",
+                    (session.name, session.terminal or "", session.host or "", session.started))
+                db.execute("INSERT INTO events (time, kind, session) VALUES (?, 'start', ?)",
+                           (session.started, cursor.lastrowid))
+                db.execute("INSERT INTO hourly (hour, logins) VALUES (?, 1) "
+                           "ON CONFLICT (hour) DO UPDATE SET logins = logins + 1",
+                           (int(session.started // HOUR),))
+                db.execute("INSERT INTO daily_users (day, name, logins) VALUES (?, ?, 1) "
+                           "ON CONFLICT (day, name) DO UPDATE SET logins = logins + 1",
+                           (int(session.started // DAY), session.name))
+            for session_id in ended:
+                name, begun = db.execute("SELECT name, started FROM sessions WHERE id = ?",
+                                         (session_id,)).fetchone()
+                end = max(ended_at, begun)
+                db.execute("UPDATE sessions SET ended = ?, duration = ? WHERE id = ?",
+                           (end, end - begun, session_id))
+                db.execute("INSERT INTO events (time, kind, session) VALUES (?, 'end', ?)", (end, session_id))
+                db.executemany("INSERT INTO hourly (hour, seconds) VALUES (?, ?) "
+                               "ON CONFLICT (hour) DO UPDATE SET seconds = seconds + excluded.seconds",
+                               _hour_overlaps(begun, end))
+                db.execute("INSERT INTO daily_users (day, name, seconds) VALUES (?, ?, ?) "
+                           "ON CONFLICT (day, name) DO UPDATE SET seconds = seconds + excluded.seconds",
+                           (int(begun // DAY), name, end - begun))
+            if open_count is not None:
+                db.execute("INSERT INTO hourly (hour, peak) VALUES (?, ?) "
+                           "ON CONFLICT (hour) DO UPDATE SET peak = max(peak, excluded.peak)",
+                           (int(now // HOUR), open_count))
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_poll', ?)", (now,))
+
+    def _open_records(self, now):
+        rows = self._db.execute(
+            "SELECT name, terminal, host, started FROM sessions WHERE ended IS NULL").fetchall()
+        return [SessionRecord(*row, None, max(0.0, now - row[3])) for row in rows]
+
+    def concurrent_by_hour(self, start, end, now=None):
+        # One HourActivity per hour from start to end, including quiet hours
+        now = time.time() if now is None else now
+        first, last = int(start // HOUR), int(-(-end // HOUR))
+        activity = {hour: HourActivity(hour * HOUR, 0, 0.0, 0) for hour in range(first, last)}
+        with self._lock:
+            rows = self._db.execute("SELECT hour, logins, seconds, peak FROM hourly WHERE hour >= ? AND hour < ?",
+                                    (first, last)).fetchall()
+            open_records = self._open_records(now)
+        for hour, logins, seconds, peak in rows:
+            activity[hour] = HourActivity(hour * HOUR, logins, seconds / HOUR, peak)
+        # Open sessions are only added to the rollup once they end
+        for record in open_records:
+            for hour, seconds in _hour_overlaps(max(record.started, first * HOUR), min(now, last * HOUR)):
+                activity[hour].average += seconds / HOUR
+        return [activity[hour] for hour in range(first, last)]
+
+    def logins_per_user(self, start, end, now=None):
+        # UserActivity of the sessions started between start and end, most
+        # logins first. Whole days come from the daily rollup; only the
+        # partial days at either end are counted from the sessions.
+        now = time.time() if now is None else now
+        first_day, last_day = int(-(-start // DAY)), int(end // DAY)
+        users = {}
+
+        def add(rows):
+            for name, logins, seconds in rows:
+                user = users.setdefault(name, UserActivity(name, 0, 0.0))
+                user.logins += logins
+                user.seconds += seconds or 0.0
+
+        edge_query = ("SELECT name, COUNT(*), SUM(duration) FROM sessions WHERE started >= ? AND started < ? "
+                      "GROUP BY name")
+        with self._lock:
+            if first_day < last_day:
+                add(self._db.execute("SELECT name, SUM(logins), SUM(seconds) FROM daily_users "
+                                     "WHERE day >= ? AND day < ? GROUP BY name", (first_day, last_day)))
+                add(self._db.execute(edge_query, (start, first_day * DAY)))
+                add(self._db.execute(edge_query, (last_day * DAY, end)))
+            else:
+                add(self._db.execute(edge_query, (start, end)))
+            open_records = self._open_records(now)
+        for record in open_records:
+            if start <= record.started < end:
+                add([(record.name, 0, record.duration)])
+        return sorted(users.values(), key=lambda user: (-user.logins, user.name))
+
+    def longest_sessions(self, start, end, limit=10, now=None):
+        # The longest sessions started between start and end, open ones
+        # counted up to now
+        now = time.time() if now is None else now
+        # The unary + keeps SQLite from using the started index for a long
+        # range
+        started = "started" if end - start <= LONGEST_SCAN_DAYS * DAY else "+started"
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, terminal, host, started, ended, duration FROM sessions "
+                f"WHERE duration IS NOT NULL AND {started} >= ? AND {started} < ? ORDER BY duration DESC LIMIT ?",
+                (start, end, limit)).fetchall()
+            open_records = self._open_records(now)
+        records = [SessionRecord(*row) for row in rows]
+        records += [record for record in open_records if start <= record.started < end]
+        records.sort(key=lambda record: record.duration, reverse=True)
+        return records[:limit]
+
+    def iter_events(self, start, end):
+        # Yields (time, "start" or "end", SessionRecord) in time order
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT e.time, e.kind, s.name, s.terminal, s.host, s.started, s.ended, s.duration "
+                "FROM events e JOIN sessions s ON s.id = e.session WHERE e.time >= ? AND e.time < ? "
+                "ORDER BY e.time", (start, end)).fetchall()
+        for row in rows:
+            yield row[0], row[1], SessionRecord(*row[2:])
+
+
+def _hour_overlaps(start, end):
+    # [(hour, seconds of start..end within that hour)]
+    overlaps = []
+    hour = int(start // HOUR)
+    while hour * HOUR < end:
+        seconds = min(end, (hour + 1) * HOUR) - max(start, hour * HOUR)
+        if seconds > 0:
+            overlaps.append((hour, seconds))
+        hour += 1
+    return overlaps
+
+
+class SessionRecorder:
+    # Turns repeated snapshots of the logged-in sessions into start and end
+    # events in a SessionStore. A session is one (user, terminal, host,
+    # login time); one that is gone by the next poll has ended, somewhere
+    # between the two polls, and sessions shorter than the poll interval
+    # may be missed entirely.
+    def __init__(self, store, list_sessions=iter_sessions, clock=time.time):
+        self.store = store
+        self.list_sessions = list_sessions
+        self.clock = clock
+        self._open = None
+        self._last_poll = None
+
+    def poll(self):
+        # Records what changed since the last poll and returns the current
+        # sessions
+        now = self.clock()
+        if self._open is None:
+            self._open = self.store.open_sessions()
+            self._last_poll = self.store.last_poll()
+        current = {session_key(s.name, s.terminal, s.host, s.started): s for s in self.list_sessions()}
+        started = [session for key, session in current.items() if key not in self._open]
+        ended = [key for key in self._open if key not in current]
+        ended_at = now
+        if self._last_poll is not None and now - self._last_poll > MAX_POLL_GAP:
+            ended_at = self._last_poll
+        self.store.record(now, started, [self._open.pop(key) for key in ended], ended_at, len(current))
+        if started:
+            # Row ids of the new sessions are needed to end them later
+            self._open = self.store.open_sessions()
+        self._last_poll = now
+        return list(current.values())
+
+    def run(self, interval=DEFAULT_POLL_INTERVAL, wait=None):
+        # Polls every interval seconds and yields the current sessions.
+        # wait(seconds) replaces time.sleep and may return True to stop.
+        wait = wait or time.sleep
+        while True:
+            yield self.poll()
+            if wait(interval):
+                return
+
+
+def format_session_report(store, start, end, now=None, top=10):
+    now = time.time() if now is None else now
+    lines = [f"Sessions from {time.strftime('%Y-%m-%d %H:%M', time.localtime(start))} "
+             f"to {time.strftime('%Y-%m-%d %H:%M', time.localtime(end))}"]
+    users = store.logins_per_user(start, end, now)
+    if not users:
+        lines.append("No sessions recorded in this period.")
+        return "\n".join(lines)
+    lines.append(f"\nLogins per user ({sum(user.logins for user in users)} in total):")
+    for user in users[:top]:
+        lines.append(f"  {user.name:<20} {user.logins:>6} logins, {format_duration(user.seconds)} logged in")
+    if len(users) > top:
+        lines.append(f"  ... and {len(users) - top} more users")
+    lines.append("\nLongest sessions:")
+    for record in store.longest_sessions(start, end, top, now):
+        where = f" from {record.host}" if record.host else ""
+        state = "still open" if record.ended is None else "ended"
+        lines.append(f"  {record.name:<20} {format_duration(record.duration):>10} on {record.terminal}{where}, "
+                     f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(record.started))}, {state}")
+    hours = store.concurrent_by_hour(start, end, now)
+    busiest = max(hours, key=lambda hour: (hour.peak, hour.average))
+    lines.append(f"\nConcurrent sessions per hour (average), busiest hour "
+                 f"{time.strftime('%Y-%m-%d %H:00', time.localtime(busiest.hour))} with up to {busiest.peak}:")
+    lines.append(f"  {sparkline([hour.average for hour in hours], 72)}  (last {min(len(hours), 72)} hours)")
+    return "\n".join(lines)
@@ -0,0 +1,300 @@
+import hashlib
+import heapq
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .formatting import format_size
+from .hash_cache import stat_identity
+from .hashing import DEFAULT_WORKERS, HashPool
+from .walk import iter_files
+
+# Chunk boundaries depend only on the bytes around them, so an insertion or
+# deletion moves the boundaries next to it and leaves every other chunk, and
+# its fingerprint, as it was. Chunks are MIN_CHUNK to MAX_CHUNK bytes long
+# and 5 to 10 KB on average.
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 64 * 1024
+# Files are streamed READ_SIZE bytes at a time, so memory per worker stays
+# around a few times READ_SIZE whatever the file size
+READ_SIZE = 1024 * 1024
+# Each file is summarized by the SKETCH_SIZE smallest of its distinct chunk
+# fingerprints (a bottom-k sketch): 1 KB per file however large it is
+SKETCH_SIZE = 128
+DEFAULT_MIN_SIZE = 1024 * 1024
+DEFAULT_THRESHOLD = 0.5
+# Fingerprints found in more files than this (runs of zeros in disk images,
+# say) are not used to pick candidate pairs, which would otherwise grow with
+# the square of the number of files that contain them
+MAX_POSTINGS = 64
+PROGRESS_EVERY = 50
+
+# The boundary hash of each byte position is an 8-bit mix of the 8 bytes
+# starting there, built in MIX_LEVELS rounds of table lookup and XOR with
+# the value 1, 2 and 4 bytes further on. Each round works on the whole
+# buffer at once (bytes.translate and big-integer XOR run in C), which is
+# what makes this usable on multi-GB files. The tables are derived from a
+# fixed string so fingerprints stay comparable across runs and machines.
+MIX_LEVELS = 3
+MIX_WINDOW = (1 << MIX_LEVELS) - 1
+MIX_TABLES = [hashlib.shake_128(f"it-support-cdc-{level}".encode()).digest(256) for level in range(MIX_LEVELS)]
+# A chunk ends where two consecutive positions hash to 0 and then 0-7
+BOUNDARY = re.compile(rb"\x00[\x00-\x07]", re.DOTALL)
+SKETCH_KIND = f"cdc{MIN_CHUNK}-{MAX_CHUNK}:sketch{SKETCH_SIZE}"
+
+
+@dataclass
+class Sketch:
+    path: str
+    size: int
+    chunks: int
+    fingerprints: list
+
+
+@dataclass
+class SimilarPair:
+    path_a: str
+    path_b: str
+    size_a: int
+    size_b: int
+    # Estimated share of distinct chunks the two files have in common
+    similarity: float
+    shared_bytes: int
+
+    @property
+    def overlap(self):
+        # Estimated fraction of the smaller file that is also in the larger
+        smaller = min(self.size_a, self.size_b)
+        return min(1.0, self.shared_bytes / smaller) if smaller else 0.0
+
+
+@dataclass
+class SimilarityReport:
+    pairs: list = field(default_factory=list)
+    files_scanned: int = 0
+    bytes_scanned: int = 0
+    files_sketched: int = 0
+    cached: int = 0
+    bytes_read: int = 0
+    candidates: int = 0
+    errors: list = field(default_factory=list)
+
+
+def _mix(data):
+    n = len(data)
+    mixed = data
+    for level, table in enumerate(MIX_TABLES):
+        value = int.from_bytes(mixed.translate(table), "little")
+        mixed = (value ^ (value >> (8 << level))).to_bytes(n, "little")
+    return mixed
+
+
+def iter_chunks(f, read_size=READ_SIZE):
+    # Yields (fingerprint, length) for each content-defined chunk of the open
+    # binary file f. Only the unfinished last chunk is carried from one read
+    # to the next, so memory does not grow with the file.
+    buffer = b""
+    eof = False
+    while not eof:
+        block = f.read(read_size)
+        eof = not block
+        buffer = buffer + block if buffer else block
+        # The last MIX_WINDOW positions cannot be hashed before the bytes
+        # after them are read
+        limit = len(buffer) if eof else len(buffer) - MIX_WINDOW
+        mixed = _mix(buffer)
+        pos = 0
+        while pos < len(buffer):
+            match = BOUNDARY.search(mixed, pos + MIN_CHUNK, min(pos + MAX_CHUNK, limit))
+            if match is not None:
+                cut = match.end()
+            elif pos + MAX_CHUNK <= limit:
+                cut = pos + MAX_CHUNK
+            elif eof:
+                cut = len(buffer)
+            else:
+                break
+            digest = hashlib.blake2b(buffer[pos:cut], digest_size=8).digest()
+            yield int.from_bytes(digest, "big"), cut - pos
+            pos = cut
+        buffer = buffer[pos:]
+
+
+def sketch_file(path, sketch_size=SKETCH_SIZE, read_size=READ_SIZE):
+    # Returns (chunk count, sorted bottom-k fingerprints, bytes read). The
+    # sketch is kept in a max-heap (of negated values) of the sketch_size
+    # smallest fingerprints seen so far, so most chunks cost one comparison.
+    heap = []
+    kept = set()
+    chunks = 0
+    read = 0
+    with open(path, "rb", buffering=0) as f:
+        for fingerprint, length in iter_chunks(f, read_size):
+            chunks += 1
+            read += length
+            if fingerprint in kept:
+                continue
+            if len(heap) < sketch_size:
+                heapq.heappush(heap, -fingerprint)
+                kept.add(fingerprint)
+            elif fingerprint < -heap[0]:
+                kept.discard(-heapq.heappushpop(heap, -fingerprint))
+                kept.add(fingerprint)
+    return chunks, sorted(kept), read
+
+
+def encode_sketch(chunks, fingerprints):
+    return f"{chunks}:" + b"".join(value.to_bytes(8, "big") for value in fingerprints).hex()
+
+
+def decode_sketch(text):
+    chunks, packed = text.split(":", 1)
+    raw = bytes.fromhex(packed)
+    return int(chunks), [int.from_bytes(raw[i:i + 8], "big") for i in range(0, len(raw), 8)]
+
+
+def estimate_similarity(a, b, sketch_size=SKETCH_SIZE):
+    # Jaccard similarity of the two files' chunk sets, estimated from the
+    # sketch_size smallest fingerprints of their union: the share of those
+    # that both files contain
+    union = heapq.nsmallest(sketch_size, set(a) | set(b))
+    if not union:
+        return 0.0
+    both = set(a) & set(b)
+    return sum(1 for value in union if value in both) / len(union)
+
+
+def find_similar_files(directory, min_size=DEFAULT_MIN_SIZE, threshold=DEFAULT_THRESHOLD, workers=DEFAULT_WORKERS,
+                       pool_kind="thread", cache=None, progress=None, check_cancelled=None, report=None):
+    # Reports pairs of files of at least min_size bytes whose estimated
+    # overlap (the share of the smaller file also found in the larger one) is
+    # at least threshold: a log and its appended-to copy, two snapshots of a
+    # VM image, a video and its re-tagged copy. cache is an optional
+    # HashCache for sketches; progress(stage, done, total) is called as in
+    # iter_duplicate_groups, and check_cancelled() between files. The
+    # counters are filled into report, if given, as the scan runs.
+    if report is None:
+        report = SimilarityReport()
+
+    def on_error(path, error):
+        report.errors.append((path, str(error)))
+
+    files = {}
+    seen_inodes = set()
+    for path, st in iter_files(directory, on_error=on_error):
+        report.files_scanned += 1
+        report.bytes_scanned += st.st_size
+        if check_cancelled:
+            check_cancelled()
+        if progress and report.files_scanned % PROGRESS_EVERY == 0:
+            progress("walk", report.files_scanned, None)
+        inode = (st.st_dev, st.st_ino)
+        if st.st_size < min_size or (st.st_ino and inode in seen_inodes):
+            continue
+        seen_inodes.add(inode)
+        files[path] = stat_identity(st)
+    seen_inodes.clear()
+
+    sketches = []
+    pending = {}
+    for path, identity in files.items():
+        cached = cache.lookup(path, identity, SKETCH_KIND) if cache else None
+        if cached is None:
+            pending[path] = identity
+        else:
+            report.cached += 1
+            sketches.append(Sketch(path, identity[0], *decode_sketch(cached)))
+    files.clear()
+
+    with HashPool(workers, pool_kind) as pool:
+        jobs = ((path,) for path in list(pending))
+        for done, ((path,), result, error) in enumerate(pool.imap_unordered(sketch_file, jobs), 1):
+            if check_cancelled:
+                check_cancelled()
+            if progress and done % PROGRESS_EVERY == 0:
+                progress("sketch", done, len(pending))
+            if error is not None:
+                on_error(path, error)
+                continue
+            chunks, fingerprints, read = result
+            report.bytes_read += read
+            identity = pending[path]
+            sketches.append(Sketch(path, identity[0], chunks, fingerprints))
+            if cache:
+                cache.store(path, identity, SKETCH_KIND, encode_sketch(chunks, fingerprints))
+    report.files_sketched = len(sketches)
+
+    report.pairs = _similar_pairs(sketches, threshold, report)
+    report.pairs.sort(key=lambda pair: pair.shared_bytes, reverse=True)
+    return report
+
+
+def _similar_pairs(sketches, threshold, report):
+    # Candidate pairs share at least one indexed fingerprint; only those are
+    # compared, instead of every file with every other
+    postings = {}
+    for number, sketch in enumerate(sketches):
+        for value in sketch.fingerprints:
+            postings.setdefault(value, []).append(number)
+    shared = Counter()
+    for numbers in postings.values():
+        if 1 < len(numbers) <= MAX_POSTINGS:
+            for i, a in enumerate(numbers):
+                for b in numbers[i + 1:]:
+                    shared[a, b] += 1
+    postings.clear()
+    report.candidates = len(shared)
+
+    pairs = []
+    for a, b in shared:
+        first, second = sketches[a], sketches[b]
+        similarity = estimate_similarity(first.fingerprints, second.fingerprints)
+        # With chunk sets in proportion to file sizes, J = S / (A + B - S)
+        # gives the shared bytes S = J / (1 + J) * (A + B)
+        shared_bytes = int(similarity / (1 + similarity) * (first.size + second.size))
+        pair = SimilarPair(first.path, second.path, first.size, second.size, similarity, shared_bytes)
+        if similarity and pair.overlap >= threshold:
+            pairs.append(pair)
+    return pairs
+
+
+def format_similarity(report):
+    lines = []
+    for pair in report.pairs:
+        lines.append(f"{pair.overlap:.0%} overlap, ~{format_size(pair.shared_bytes)} shared "
+                     f"({pair.similarity:.0%} of distinct chunks):")
+        lines.append(f"  {pair.path_a} ({format_size(pair.size_a)})")
+        lines.append(f"  {pair.path_b} ({format_size(pair.size_b)})")
+    if not report.pairs:
+        lines.append("No similar files found.")
+    lines.append(format_similarity_summary(report))
+    return "\n".join(lines)
+
+
+def format_similarity_summary(report):
+    lines = [
+        f"Scanned {report.files_scanned} files ({format_size(report.bytes_scanned)}), sketched "
+        f"{report.files_sketched} ({report.cached} cached, read {format_size(report.bytes_read)}), "
+        f"compared {report.candidates} candidate pairs"
+    ]
+    if report.errors:
+        lines.append(f"{len(report.errors)} files could not be read")
+    return "\n".join(lines)
+
+
+def similarity_columns():
+    # results.Column definitions for showing similar pairs in a results
+    # table, one row per pair
+    from .results import Column
+    return [
+        Column("overlap", "Overlap", width=80, anchor="e", format=lambda value: f"{value:.0%}"),
+        Column("shared", "Shared", width=100, anchor="e", format=format_size),
+        Column("path_a", "File", width=330),
+        Column("size_a", "Size", width=90, anchor="e", format=format_size),
+        Column("path_b", "Similar to", width=330),
+        Column("size_b", "Size", width=90, anchor="e", format=format_size),
+    ]
+
+
+def similarity_rows(pairs):
+    return [(pair.overlap, pair.shared_bytes, pair.path_a, pair.size_a, pair.path_b, pair.size_b) for pair in pairs]
@@ -0,0 +1,397 @@
+import os
+import re
+import select
+import struct
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from .formatting import format_size
+from .logs import DEFAULT_PATTERN, iter_log_files
+
+BACKENDS = ("auto", "inotify", "poll")
+POLL_INTERVAL = 0.5
+READ_SIZE = 1024 * 1024
+# A file is read at most this much per wake-up before the others get their
+# turn; the rest is picked up straight after
+MAX_READ_PER_CHECK = 16 * 1024 * 1024
+# A line longer than this is cut, so a file without newlines cannot make
+# the carried-over partial line grow without bound
+MAX_LINE = 64 * 1024
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+INOTIFY_EVENT = struct.Struct("iIII")
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+@dataclass
+class Rule:
+    name: str
+    pattern: str
+    severity: str = "warning"
+
+
+# Spelled-out case variants rather than (?i): a pattern that starts with a
+# few known characters is searched for with a fast scan, while ignoring
+# case checks every position and runs several times slower
+DEFAULT_RULES = (
+    Rule("error", r"(?:error|ERROR|Error)\b"),
+    Rule("critical", r"(?:critical|CRITICAL|Critical|fatal|FATAL|Fatal|panic)\b", "critical"),
+    Rule("oom", r"Out of memory|oom-kill", "critical"),
+    Rule("segfault", r"segfault|Segmentation fault", "critical"),
+    Rule("auth failure", r"authentication failure|Failed password|Invalid user"),
+)
+
+
+@dataclass
+class Alert:
+    rule: str
+    severity: str
+    path: str
+    line: str
+    time: float
+
+
+class RuleSet:
+    # Matches batches of log lines against a set of rules and counts the
+    # hits of each rule. Each rule's pattern is run over the whole batch at
+    # once rather than line by line, and only the lines it stops at are
+    # looked at in Python, so a batch without alerts costs one C-level scan
+    # per rule. ^ and $ match at line boundaries.
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = list(rules)
+        if not self.rules:
+            raise ValueError("At least one rule is needed")
+        self._patterns = []
+        for rule in self.rules:
+            try:
+                self._patterns.append(re.compile(rule.pattern, re.MULTILINE))
+            except re.error as e:
+                raise ValueError(f"Rule '{rule.name}' is not a valid regular expression: {e}") from None
+        self.counts = Counter()
+        self.lines = 0
+        self.bytes = 0
+
+    def scan(self, text, path, now=None):
+        # text holds whole lines, each ending in a newline. Returns an Alert
+        # for every rule that matches a line, in the order of the lines.
+        now = time.time() if now is None else now
+        self.lines += text.count("\n")
+        hits = []
+        for number, pattern in enumerate(self._patterns):
+            search = pattern.search
+            pos = 0
+            while (match := search(text, pos)) is not None:
+                start = text.rfind("\n", 0, match.start()) + 1
+                end = text.find("\n", match.start())
+                if end < 0:
+                    end = len(text)
+                hits.append((start, number, end))
+                # One hit per rule and line, however often it matches
+                pos = end + 1
+        hits.sort()
+        alerts = []
+        for start, number, end in hits:
+            rule = self.rules[number]
+            self.counts[rule.name] += 1
+            alerts.append(Alert(rule.name, rule.severity, path, text[start:end], now))
+        return alerts
+
+
+def read_rules(path):
+    # One rule per line as "name = regex" or "name:severity = regex"; blank
+    # lines and lines starting with # are skipped
+    rules = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, sep, pattern = line.partition("=")
+            if not sep or not name.strip() or not pattern.strip():
+                raise ValueError(f"{path}:{number}: expected 'name = regex', got '{line}'")
+            name, _, severity = name.strip().partition(":")
+            rules.append(Rule(name.strip(), pattern.strip(), severity.strip() or "warning"))
+    return rules
+
+
+class _Inotify:
+    # Linux inotify through ctypes. One watch per directory reports writes,
+    # creations, renames and deletions of the files in it by name, which
+    # covers files that do not exist yet and files that get rotated.
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._ctypes = ctypes
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self._raise("inotify_init1")
+        self.watches = {}
+
+    def _raise(self, what):
+        error = self._ctypes.get_errno()
+        raise OSError(error, f"{what}: {os.strerror(error)}")
+
+    def add(self, directory):
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            self._raise(f"inotify_add_watch {directory}")
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        # Returns (directory, name, mask) for each event that arrived within
+        # timeout seconds. directory is None after a queue overflow, when
+        # any file may have changed.
+        events = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return events
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                directory = None if mask & IN_Q_OVERFLOW else self.watches.get(wd)
+                events.append((directory, os.fsdecode(name) if name else None, mask))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Followed:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.identity = None
+        self.offset = 0
+        self.partial = b""
+
+
+class LogTailer:
+    # Follows many log files at once, like tail -F, and matches every new
+    # line against a RuleSet. sources are files, or directories whose files
+    # matching pattern are followed, including ones created later. Files are
+    # read from their current end (from_start reads them whole first).
+    #
+    # A file that is renamed or deleted, as rotate_logs does, is read to its
+    # end before it is let go, and the new file created in its place is read
+    # from the start; a truncated file is read again from the start. On
+    # Linux inotify wakes the tailer as soon as a file is written; elsewhere,
+    # or with backend="poll", every file is checked every poll_interval
+    # seconds. inotify does not see writes made by other hosts on network
+    # filesystems, so use polling there.
+    def __init__(self, sources, rules=None, pattern=DEFAULT_PATTERN, from_start=False, backend="auto",
+                 poll_interval=POLL_INTERVAL):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown tail backend '{backend}', choose from: {', '.join(BACKENDS)}")
+        self.rules = rules if isinstance(rules, RuleSet) else RuleSet(rules or DEFAULT_RULES)
+        self.pattern = pattern
+        self.from_start = from_start
+        self.poll_interval = poll_interval
+        self.directories = []
+        self.files = {}
+        for source in sources:
+            source = os.path.abspath(source)
+            if os.path.isdir(source):
+                self.directories.append(source)
+            else:
+                self.files[source] = _Followed(source)
+        self.rotations = 0
+        self.truncations = 0
+        self.errors = []
+        self.started = None
+        self._backlog = set()
+        self._inotify = None
+        self.backend = backend
+        if backend != "poll":
+            try:
+                if not sys.platform.startswith("linux"):
+                    raise OSError("inotify is only available on Linux")
+                self._inotify = _Inotify()
+                self.backend = "inotify"
+            except (OSError, AttributeError):
+                if backend == "inotify":
+                    raise
+                self.backend = "poll"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for followed in self.files.values():
+            self._close(followed)
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def follow(self, wait=None):
+        # Yields a list of new Alerts each time the files were checked, at
+        # least every poll_interval seconds, so an empty list means nothing
+        # matched. wait(seconds) replaces time.sleep and may return True to
+        # stop.
+        wait = wait or time.sleep
+        self.started = time.monotonic()
+        self._discover()
+        if self._inotify is not None:
+            for directory in sorted(set(self.directories) | {os.path.dirname(path) for path in self.files}):
+                self._inotify.add(directory)
+        initial = list(self.files.values())
+        yield self._check_all(initial, first=True)
+        while True:
+            if self._backlog:
+                if wait(0):
+                    return
+                due = list(self._backlog)
+            elif self._inotify is not None:
+                due = self._wait_events()
+                if wait(0):
+                    return
+            else:
+                if wait(self.poll_interval):
+                    return
+                self._discover()
+                due = list(self.files.values())
+            yield self._check_all(due)
+
+    def _wait_events(self):
+        due = {}
+        for directory, name, mask in self._inotify.read(self.poll_interval):
+            if directory is None:
+                self._discover()
+                return list(self.files.values())
+            if name is None:
+                continue
+            path = os.path.join(directory, name)
+            followed = self.files.get(path)
+            if followed is None and mask & (IN_CREATE | IN_MOVED_TO) and directory in self.directories:
+                self._discover()
+                followed = self.files.get(path)
+            if followed is not None:
+                due[path] = followed
+        return list(due.values()) + [f for f in self._backlog if f.path not in due]
+
+    def _discover(self):
+        # Picks up new files matching pattern in the followed directories
+        for directory in self.directories:
+            for path, _ in iter_log_files(directory, self.pattern):
+                if path not in self.files:
+                    self.files[path] = _Followed(path)
+
+    def _check_all(self, due, first=False):
+        self._backlog.clear()
+        alerts = []
+        for followed in due:
+            try:
+                alerts += self._check(followed, first)
+            except OSError as e:
+                self.errors.append((followed.path, str(e)))
+                self._close(followed)
+        return alerts
+
+    def _check(self, followed, first=False):
+        alerts = []
+        try:
+            st = os.stat(followed.path)
+        except FileNotFoundError:
+            st = None
+        if followed.fd is not None:
+            if st is None or (st.st_dev, st.st_ino) != followed.identity:
+                # Rotated away: lines written just before the rename count too
+                alerts += self._read(followed, limit=None)
+                self._flush_partial(followed, alerts)
+                self._close(followed)
+                self.rotations += 1
+            elif st.st_size < followed.offset:
+                os.lseek(followed.fd, 0, os.SEEK_SET)
+                followed.offset = 0
+                followed.partial = b""
+                self.truncations += 1
+        if followed.fd is None and st is not None:
+            followed.fd = os.open(followed.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            stat = os.fstat(followed.fd)
+            followed.identity = (stat.st_dev, stat.st_ino)
+            followed.offset = stat.st_size if first and not self.from_start else 0
+            os.lseek(followed.fd, followed.offset, os.SEEK_SET)
+        if followed.fd is not None:
+            alerts += self._read(followed)
+        return alerts
+
+    def _read(self, followed, limit=MAX_READ_PER_CHECK):
+        alerts = []
+        read = 0
+        while limit is None or read < limit:
+            data = os.read(followed.fd, READ_SIZE)
+            if not data:
+                return alerts
+            read += len(data)
+            followed.offset += len(data)
+            self.rules.bytes += len(data)
+            data = followed.partial + data if followed.partial else data
+            end = data.rfind(b"\n") + 1
+            followed.partial = data[end:]
+            if len(followed.partial) > MAX_LINE:
+                end = len(data)
+                followed.partial = b""
+            if end:
+                text = data[:end].decode("utf-8", "replace")
+                alerts += self.rules.scan(text if text.endswith("\n") else text + "\n", followed.path)
+        self._backlog.add(followed)
+        return alerts
+
+    def _flush_partial(self, followed, alerts):
+        # The last line of a file that is gone will not get its newline
+        if followed.partial:
+            text = followed.partial.decode("utf-8", "replace") + "\n"
+            followed.partial = b""
+            alerts += self.rules.scan(text, followed.path)
+
+    def _close(self, followed):
+        if followed.fd is not None:
+            os.close(followed.fd)
+            followed.fd = None
+            followed.identity = None
+            followed.partial = b""
+
+
+def format_alert(alert):
+    stamp = time.strftime("%H:%M:%S", time.localtime(alert.time))
+    return f"{stamp} [{alert.severity}] {alert.rule}: {os.path.basename(alert.path)}: {alert.line}"
+
+
+def format_rule_counts(rules):
+    return ", ".join(f"{rule.name}: {rules.counts[rule.name]:,}" for rule in rules.rules)
+
+
+def format_tail_status(tailer):
+    rules = tailer.rules
+    seconds = time.monotonic() - tailer.started if tailer.started else 0.0
+    rate = f", {rules.lines / seconds:,.0f} lines/s" if seconds else ""
+    following = sum(1 for followed in tailer.files.values() if followed.fd is not None)
+    lines = [
+        f"{rules.lines:,} lines ({format_size(rules.bytes)}) from {following} files{rate}, "
+        f"{tailer.rotations} rotations, {tailer.truncations} truncations ({tailer.backend})",
+        f"  {format_rule_counts(rules)}",
+    ]
+    for path, error in tailer.errors[-5:]:
+        lines.append(f"  Error: {path}: {error}")
+    return "\n".join(lines)
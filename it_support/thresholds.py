@@ -0,0 +1,410 @@
+import operator
+import re
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+
+from .formatting import format_duration, format_rate, format_size
+
+# Metric names in rules may leave out this prefix of the agent's metrics
+METRIC_PREFIX = "it_support_"
+# A firing alert is announced again after this many seconds, unless its
+# rule sets its own repeat
+DEFAULT_REPEAT = 3600.0
+# At most this many notifications are sent per window of seconds; the rest
+# are counted and reported with the next one that goes out
+DEFAULT_MAX_NOTIFICATIONS = 20
+DEFAULT_NOTIFY_WINDOW = 60.0
+SEVERITIES = ("info", "warning", "critical")
+
+# One rule per line as "name[:severity] = [rate(]metric[)][{label="value", ...}] op value" followed by
+# any of "clear value", "for duration" and "repeat duration"
+DEFAULT_THRESHOLD_RULES = """\
+disk_low:critical = disk_free_percent < 10 clear 12 for 1m
+disk_filling = rate(disk_free_bytes) < -2GB/h for 10m
+bandwidth_high = network_receive_bytes_per_second{nic="total"} > 100MB clear 80MB for 2m
+upload_high = network_transmit_bytes_per_second{nic="total"} > 100MB clear 80MB for 2m
+process_memory = process_rss_bytes > 4GB clear 3.5GB for 5m
+process_memory_growing = rate(process_rss_bytes) > 1GB/h for 15m
+sessions_many = sessions_open > 50 clear 45
+"""
+
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+SIZE_UNITS = {"": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+TIME_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+RULE_PATTERN = re.compile(
+    r"(?P<name>[\w.-]+)(?::(?P<severity>\w+))?\s*=\s*"
+    r"(?P<rate>rate\(\s*)?(?P<metric>[A-Za-z_]\w*)\s*(?P<labels>\{[^}]*\})?\s*(?(rate)\))\s*"
+    r"(?P<op><=|>=|<|>)\s*(?P<threshold>\S+)(?P<options>.*)$")
+LABEL_PATTERN = re.compile(r'\s*(\w+)\s*=\s*"([^"]*)"\s*(?:,|$)')
+VALUE_PATTERN = re.compile(r"([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)([KMGT]B)?(?:/([smhd]))?$")
+DURATION_PATTERN = re.compile(r"(\d+\.?\d*)([smhd]?)$")
+
+
+@dataclass
+class ThresholdRule:
+    name: str
+    metric: str
+    op: str
+    threshold: float
+    severity: str = "warning"
+    # Only series with all of these labels are checked; {} checks every
+    # series of the metric
+    labels: dict = field(default_factory=dict)
+    # Compare the change per second between samples instead of the value
+    rate: bool = False
+    # Hysteresis: once firing, the alert holds until the value is past this
+    # (on the other side of the threshold) rather than the threshold itself
+    clear: float = None
+    # Seconds the condition must hold before the alert fires
+    for_seconds: float = 0.0
+    repeat: float = DEFAULT_REPEAT
+
+    def __post_init__(self):
+        if self.op not in OPERATORS:
+            raise ValueError(f"Rule {self.name}: unknown operator '{self.op}'")
+        if not self.metric.startswith(METRIC_PREFIX):
+            self.metric = METRIC_PREFIX + self.metric
+        if self.clear is None:
+            self.clear = self.threshold
+        # "value < 10 clear 12" is sensible; "clear 8" would resolve alerts
+        # while the condition still holds
+        if (self.clear < self.threshold) if self.op in ("<", "<=") else (self.clear > self.threshold):
+            raise ValueError(f"Rule {self.name}: clear value {self.clear:g} is on the wrong side of "
+                             f"{self.op} {self.threshold:g}")
+
+
+@dataclass
+class ThresholdAlert:
+    rule: str
+    severity: str
+    # "firing" or "resolved"
+    state: str
+    metric: str
+    labels: dict
+    # None when an alert resolves because its series stopped being reported
+    value: float
+    threshold: float
+    rate: bool
+    time: float
+    # When the condition started to hold
+    since: float
+    # True for the reminders of an alert that is still firing
+    repeat: bool = False
+    # Notifications dropped by the rate limit since the previous one sent
+    suppressed: int = 0
+
+
+class _SeriesState:
+    __slots__ = ("since", "firing", "notified", "value", "held")
+
+    def __init__(self, since):
+        self.since = since
+        self.firing = False
+        self.notified = None
+        self.value = None
+        # Held back by the rate limit, and already counted as such
+        self.held = False
+
+
+def parse_value(text):
+    # "90", "1.5GB", "-2GB/h" (per hour, turned into per second)
+    match = VALUE_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError(f"expected a number such as 90, 1.5GB or -2GB/h, got '{text}'")
+    number, unit, per = match.groups()
+    return float(number) * SIZE_UNITS[unit or ""] / TIME_UNITS[per or ""]
+
+
+def parse_duration(text):
+    match = DURATION_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError(f"expected a duration such as 30s, 5m or 1h, got '{text}'")
+    return float(match.group(1)) * TIME_UNITS[match.group(2)]
+
+
+def parse_threshold_rule(line):
+    match = RULE_PATTERN.match(line.strip())
+    if match is None:
+        raise ValueError(f"expected 'name[:severity] = metric op value [clear value] [for time] [repeat time]', "
+                         f"got '{line.strip()}'")
+    labels = {}
+    if match.group("labels"):
+        body = match.group("labels")[1:-1]
+        position = 0
+        for label in LABEL_PATTERN.finditer(body):
+            if label.start() != position:
+                break
+            labels[label.group(1)] = label.group(2)
+            position = label.end()
+        if body[position:].strip():
+            raise ValueError(f"expected labels such as {{mount=\"/\"}}, got '{match.group('labels')}'")
+    options = {}
+    words = match.group("options").split()
+    if len(words) % 2:
+        raise ValueError(f"expected 'clear', 'for' or 'repeat' followed by a value, got '{' '.join(words)}'")
+    for key, value in zip(words[::2], words[1::2]):
+        if key == "clear":
+            options["clear"] = parse_value(value)
+        elif key == "for":
+            options["for_seconds"] = parse_duration(value)
+        elif key == "repeat":
+            options["repeat"] = parse_duration(value)
+        else:
+            raise ValueError(f"unknown rule option '{key}'")
+    severity = match.group("severity") or "warning"
+    if severity not in SEVERITIES:
+        raise ValueError(f"severity must be one of {', '.join(SEVERITIES)}, got '{severity}'")
+    return ThresholdRule(match.group("name"), match.group("metric"), match.group("op"),
+                         parse_value(match.group("threshold")), severity, labels, bool(match.group("rate")),
+                         **options)
+
+
+def parse_threshold_rules(text, source="<rules>"):
+    # Blank lines and lines starting with # are skipped
+    rules = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            rules.append(parse_threshold_rule(line))
+        except ValueError as e:
+            raise ValueError(f"{source}:{number}: {e}") from None
+    return rules
+
+
+def read_threshold_rules(path):
+    with open(path, encoding="utf-8") as f:
+        return parse_threshold_rules(f.read(), path)
+
+
+class _Series:
+    # One series of a metric, with the rules that apply to it worked out the
+    # first time it is seen. They are grouped by operator and kept sorted by
+    # threshold, so the rules a value breaks are found by bisection. states
+    # holds the rules pending or firing on the series, by rule number.
+    __slots__ = ("labels", "groups", "rates", "states", "time", "value")
+
+    def __init__(self, labels, rules):
+        self.labels = dict(labels)
+        by_kind = {}
+        for number, rule in rules:
+            by_kind.setdefault((rule.op, rule.rate), []).append((rule.threshold, number, rule))
+        self.groups = []
+        for (op, rate), matches in by_kind.items():
+            matches.sort(key=lambda match: match[:2])
+            self.groups.append((op, rate, [match[0] for match in matches], [match[1:] for match in matches]))
+        self.rates = any(group[1] for group in self.groups)
+        self.states = {}
+        # Previous sample, for rate rules
+        self.time = None
+        self.value = None
+
+
+def _breaking(op, thresholds, matches, value):
+    # The (number, rule) of matches whose condition value meets
+    if op == "<":
+        return matches[bisect_right(thresholds, value):]
+    if op == "<=":
+        return matches[bisect_left(thresholds, value):]
+    if op == ">":
+        return matches[:bisect_left(thresholds, value)]
+    return matches[:bisect_right(thresholds, value)]
+
+
+class AlertEngine:
+    # Checks threshold rules against samples as they arrive, in the agent's
+    # (metric name, labels, value) form. Rules are indexed by metric and by
+    # one of their labels, and the rules that apply to a series are looked
+    # up once, when it first appears. After that, a sample costs a bisection
+    # per operator plus a check of the rules it breaks or that are already
+    # pending or firing, however many rules there are: thousands of rules
+    # take a few milliseconds a tick. Each rule keeps a state per matching
+    # series (a mount, a process, a NIC): an alert is only sent when the
+    # state changes or repeat seconds pass, and sends are rate limited
+    # overall.
+    def __init__(self, rules=None, notify=None, max_notifications=DEFAULT_MAX_NOTIFICATIONS,
+                 window=DEFAULT_NOTIFY_WINDOW, clock=time.time):
+        self.rules = list(parse_threshold_rules(DEFAULT_THRESHOLD_RULES) if rules is None else rules)
+        self.notify = notify
+        self.max_notifications = max_notifications
+        self.window = window
+        self.clock = clock
+        self.suppressed = 0
+        self.sent = 0
+        self._unreported = 0
+        self._sent_times = deque()
+        # (metric, label, value) -> rules; label None for rules without labels
+        self._index = {}
+        for number, rule in enumerate(self.rules):
+            label = min(rule.labels.items()) if rule.labels else (None, None)
+            self._index.setdefault((rule.metric, *label), []).append((number, rule))
+        # metric -> {series: _Series}, series being the sorted label items
+        self._series = {rule.metric: {} for rule in self.rules}
+
+    def _match(self, metric, labels, series):
+        candidates = list(self._index.get((metric, None, None), ()))
+        for item in series:
+            candidates += self._index.get((metric, *item), ())
+        return _Series(labels, [(number, rule) for number, rule in candidates
+                                if all(labels.get(key) == wanted for key, wanted in rule.labels.items())])
+
+    def evaluate(self, samples, now=None):
+        # Returns the alerts sent for this batch. A series that has an
+        # alert pending or firing and is missing from a batch that reports
+        # its metric is treated as gone and resolved.
+        now = self.clock() if now is None else now
+        sent = []
+        seen = {}
+        # Samples come grouped by metric, so the per-metric lookups are only
+        # done when it changes
+        last_metric = known = None
+        for metric, labels, value in samples:
+            if metric != last_metric:
+                last_metric = metric
+                known = self._series.get(metric)
+                if known is not None:
+                    series_seen = seen.setdefault(metric, set())
+            if known is None:
+                continue
+            series = tuple(sorted(labels.items()))
+            entry = known.get(series)
+            if entry is None:
+                entry = known[series] = self._match(metric, labels, series)
+            series_seen.add(series)
+            rate = None
+            if entry.rates:
+                if entry.time is not None and now > entry.time:
+                    rate = (value - entry.value) / (now - entry.time)
+                entry.time = now
+                entry.value = value
+            states = entry.states
+            if states:
+                for number, state in list(states.items()):
+                    rule = self.rules[number]
+                    observed = rate if rule.rate else value
+                    if observed is not None:
+                        self._check(number, rule, state, entry, observed, now, sent)
+            for op, uses_rate, thresholds, matches in entry.groups:
+                observed = rate if uses_rate else value
+                if observed is None:
+                    continue
+                for number, rule in _breaking(op, thresholds, matches, observed):
+                    # Rules with a state were checked above
+                    if number not in states:
+                        self._check(number, rule, None, entry, observed, now, sent)
+        for metric, series_seen in seen.items():
+            known = self._series[metric]
+            if len(known) == len(series_seen):
+                continue
+            for series, entry in known.items():
+                if series not in series_seen:
+                    for number, state in entry.states.items():
+                        if state.firing and state.notified is not None:
+                            self._send(self._alert(self.rules[number], "resolved", entry.labels, None, state, now),
+                                       sent)
+            # Forget series that went away (exited processes), so the cache
+            # does not grow with every PID ever seen
+            self._series[metric] = {series: known[series] for series in series_seen}
+        return sent
+
+    def _check(self, number, rule, state, entry, value, now, sent):
+        compare = OPERATORS[rule.op]
+        if state is None:
+            state = entry.states[number] = _SeriesState(now)
+        state.value = value
+        if not compare(value, rule.clear if state.firing else rule.threshold):
+            del entry.states[number]
+            # A firing alert nobody was told about resolves silently
+            if state.firing and state.notified is not None:
+                self._send(self._alert(rule, "resolved", entry.labels, value, state, now), sent)
+            return
+        if not state.firing and now - state.since >= rule.for_seconds:
+            state.firing = True
+        if not state.firing:
+            return
+        if state.notified is None:
+            alert = self._alert(rule, "firing", entry.labels, value, state, now)
+        elif rule.repeat and now - state.notified >= rule.repeat:
+            alert = self._alert(rule, "firing", entry.labels, value, state, now, repeat=True)
+        else:
+            return
+        if self._send(alert, sent, count=not state.held):
+            state.notified = now
+            state.held = False
+        else:
+            state.held = True
+
+    def _alert(self, rule, state_name, labels, value, state, now, repeat=False):
+        return ThresholdAlert(rule.name, rule.severity, state_name, rule.metric, dict(labels), value,
+                              rule.threshold, rule.rate, now, state.since, repeat)
+
+    def _send(self, alert, sent, count=True):
+        # A firing alert held back by the rate limit is tried again with
+        # the next sample, so it goes out once the window allows; count is
+        # False for those retries
+        times = self._sent_times
+        while times and alert.time - times[0] >= self.window:
+            times.popleft()
+        if len(times) >= self.max_notifications:
+            if count:
+                self.suppressed += 1
+                self._unreported += 1
+            return False
+        times.append(alert.time)
+        alert.suppressed = self._unreported
+        self._unreported = 0
+        self.sent += 1
+        sent.append(alert)
+        if self.notify:
+            self.notify(alert)
+        return True
+
+    def firing(self):
+        # ThresholdAlerts of every series currently firing
+        alerts = []
+        for known in self._series.values():
+            for entry in known.values():
+                for number, state in entry.states.items():
+                    if state.firing:
+                        alerts.append(self._alert(self.rules[number], "firing", entry.labels, state.value, state,
+                                                  state.notified or state.since))
+        return alerts
+
+
+def format_value(metric, value, rate=False):
+    # Rates of change are shown per hour, which reads better for slow growth
+    if value is None:
+        return "gone"
+    if rate:
+        value *= 3600
+    if metric.endswith("_bytes_per_second"):
+        text = format_rate(value)
+    elif metric.endswith("_bytes"):
+        text = format_size(value)
+    else:
+        text = f"{value:g}"
+    return f"{text}/h" if rate else text
+
+
+def format_threshold_alert(alert):
+    labels = ", ".join(f"{key}={value}" for key, value in sorted(alert.labels.items()))
+    where = f" [{labels}]" if labels else ""
+    subject = alert.metric[len(METRIC_PREFIX):] if alert.metric.startswith(METRIC_PREFIX) else alert.metric
+    if alert.rate:
+        subject = f"rate({subject})"
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(alert.time))
+    if alert.state == "resolved":
+        text = (f"{stamp} RESOLVED {alert.rule}{where}: {subject} is "
+                f"{format_value(alert.metric, alert.value, alert.rate)} after "
+                f"{format_duration(alert.time - alert.since)}")
+    else:
+        text = (f"{stamp} {alert.severity.upper()} {alert.rule}{where}: {subject} is "
+                f"{format_value(alert.metric, alert.value, alert.rate)}, threshold "
+                f"{format_value(alert.metric, alert.threshold, alert.rate)}"
+                + (f", firing for {format_duration(alert.time - alert.since)}" if alert.repeat else ""))
+    if alert.suppressed:
+        text += f" ({alert.suppressed} notifications held back by the rate limit)"
+    return text
@@ -0,0 +1,239 @@
+import heapq
+import os
+import time
+from array import array
+
+from .formatting import format_size
+from .hashing import DEFAULT_WORKERS
+from .walk import iter_directory
+
+DEFAULT_TOP = 20
+PROGRESS_EVERY = 500
+
+
+def allocated_size(st):
+    # Space the file takes on disk, as du reports it; Windows has no
+    # st_blocks, so the apparent size is used there
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+class DiskUsage:
+    # Per-directory totals for a scanned tree, held in flat arrays indexed by
+    # directory number rather than one object per directory. Only directory
+    # names are kept (full paths are rebuilt from the parent chain on
+    # demand) and files are not kept at all beyond the largest few, so a tree
+    # with millions of entries costs a few dozen bytes per directory.
+    # A directory is always numbered after its parent; 0 is the root.
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.names = []
+        self.parent = array("q")
+        self.own_bytes = array("q")
+        self.total_bytes = array("q")
+        self.own_files = array("q")
+        self.total_files = array("q")
+        self.largest_files = []
+        self.errors = 0
+        self.seconds = 0.0
+        self._children = None
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def files_scanned(self):
+        return self.total_files[0] if self.total_files else 0
+
+    @property
+    def bytes_scanned(self):
+        return self.total_bytes[0] if self.total_bytes else 0
+
+    def _add(self, name, parent):
+        self.names.append(name)
+        self.parent.append(parent)
+        self.own_bytes.append(0)
+        self.own_files.append(0)
+        return len(self.names) - 1
+
+    def _finish(self):
+        # Children always have higher numbers than their parent, so one pass
+        # from the end rolls every subtree up into its ancestors
+        self.total_bytes = array("q", self.own_bytes)
+        self.total_files = array("q", self.own_files)
+        total_bytes, total_files, parent = self.total_bytes, self.total_files, self.parent
+        for index in range(len(parent) - 1, 0, -1):
+            up = parent[index]
+            total_bytes[up] += total_bytes[index]
+            total_files[up] += total_files[index]
+
+    def path(self, index):
+        parts = []
+        while index > 0:
+            parts.append(self.names[index])
+            index = self.parent[index]
+        return os.path.join(self.root, *reversed(parts))
+
+    def _child_index(self):
+        # Child lists for every directory as two flat arrays: the children of
+        # i are order[counts[i]:counts[i + 1]]. Built the first time anyone
+        # asks.
+        if self._children is None:
+            counts = array("q", bytes(8 * (len(self) + 1)))
+            for up in self.parent[1:]:
+                counts[up + 1] += 1
+            for i in range(len(self)):
+                counts[i + 1] += counts[i]
+            order = array("q", bytes(8 * max(0, len(self) - 1)))
+            fill = array("q", counts)
+            for child in range(1, len(self)):
+                up = self.parent[child]
+                order[fill[up]] = child
+                fill[up] += 1
+            self._children = (counts, order)
+        return self._children
+
+    def child_count(self, index):
+        counts, _ = self._child_index()
+        return counts[index + 1] - counts[index]
+
+    def children(self, index):
+        # Subdirectories of index, largest first
+        counts, order = self._child_index()
+        return sorted(order[counts[index]:counts[index + 1]], key=self.total_bytes.__getitem__, reverse=True)
+
+    def top_directories(self, n=DEFAULT_TOP, own=False):
+        # Largest directories by their whole subtree, or by the files
+        # directly inside them with own=True; a bounded heap, not a sort
+        sizes = self.own_bytes if own else self.total_bytes
+        return heapq.nlargest(n, range(len(self)), key=sizes.__getitem__)
+
+    def top_files(self):
+        # [(size, path)], largest first
+        return [(size, os.path.join(self.path(index), name))
+                for size, index, name in sorted(self.largest_files, reverse=True)]
+
+
+def _scan_directory(path, top, apparent, device):
+    # Runs on the worker pool: totals one directory without descending.
+    # Returns (bytes, files, subdirectory names, largest files, hard links,
+    # errors).
+    own = files = errors = 0
+    subdirs = []
+    largest = []
+    links = []
+
+    def on_error(path, error):
+        nonlocal errors
+        errors += 1
+
+    for entry, st in iter_directory(path, on_error):
+        if st is None:
+            if device is not None:
+                try:
+                    if entry.stat(follow_symlinks=False).st_dev != device:
+                        continue
+                except OSError:
+                    errors += 1
+                    continue
+            subdirs.append(entry.name)
+            continue
+        size = st.st_size if apparent else allocated_size(st)
+        if st.st_nlink > 1:
+            # Counted once, by whoever merges the results
+            links.append((st.st_dev, st.st_ino, size, entry.name))
+            continue
+        own += size
+        files += 1
+        if len(largest) < top:
+            heapq.heappush(largest, (size, entry.name))
+        elif size > largest[0][0]:
+            heapq.heapreplace(largest, (size, entry.name))
+    return own, files, subdirs, largest, links, errors
+
+
+def analyze_usage(directory, top=DEFAULT_TOP, workers=DEFAULT_WORKERS, apparent=False, one_filesystem=True,
+                  progress=None, check_cancelled=None):
+    # Totals the space used under directory, scanning directories in
+    # parallel with os.scandir. Sizes are allocated blocks unless apparent
+    # is set; hard-linked files are counted once, and with one_filesystem
+    # the scan stays on directory's filesystem like du -x. The largest top
+    # files are kept in a bounded heap as the scan goes.
+    # progress(directories, files) is called every PROGRESS_EVERY
+    # directories and check_cancelled once per directory.
+    started = time.perf_counter()
+    usage = DiskUsage(directory)
+    usage._add(os.path.basename(usage.root.rstrip(os.sep)) or usage.root, -1)
+    device = os.stat(usage.root).st_dev if one_filesystem and os.name != "nt" else None
+    seen_links = set()
+    largest = usage.largest_files
+    stack = [(0, usage.root)]
+    scanned = files_scanned = 0
+
+    def merge(index, path, result):
+        nonlocal scanned, files_scanned
+        own, files, subdirs, found, links, errors = result
+        for dev, ino, size, name in links:
+            if (dev, ino) not in seen_links:
+                seen_links.add((dev, ino))
+                own += size
+                files += 1
+                found.append((size, name))
+        usage.own_bytes[index] = own
+        usage.own_files[index] = files
+        usage.errors += errors
+        scanned += 1
+        files_scanned += files
+        for size, name in found:
+            if len(largest) < top:
+                heapq.heappush(largest, (size, index, name))
+            elif size > largest[0][0]:
+                heapq.heapreplace(largest, (size, index, name))
+        for name in subdirs:
+            stack.append((usage._add(name, index), os.path.join(path, name)))
+        if check_cancelled:
+            check_cancelled()
+        if progress and scanned % PROGRESS_EVERY == 0:
+            progress(scanned, files_scanned)
+
+    if workers <= 1:
+        while stack:
+            index, path = stack.pop()
+            merge(index, path, _scan_directory(path, top, apparent, device))
+    else:
+        from concurrent import futures
+        pending = {}
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while stack or pending:
+                    # Depth first keeps the queue of unscanned directories
+                    # short however wide the tree is
+                    while stack and len(pending) < workers * 4:
+                        index, path = stack.pop()
+                        pending[executor.submit(_scan_directory, path, top, apparent, device)] = (index, path)
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        index, path = pending.pop(future)
+                        merge(index, path, future.result())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    usage._finish()
+    usage.seconds = time.perf_counter() - started
+    return usage
+
+
+def format_usage(usage, n=DEFAULT_TOP):
+    lines = [
+        f"{usage.root}: {format_size(usage.bytes_scanned)} in {usage.files_scanned} files, "
+        f"{len(usage)} directories ({usage.seconds:.1f}s, {usage.errors} unreadable)",
+        "",
+        "Largest directories:",
+    ]
+    for index in usage.top_directories(n):
+        lines.append(f"  {format_size(usage.total_bytes[index]):>10}  {usage.path(index)}")
+    lines += ["", "Largest files:"]
+    for size, path in usage.top_files()[:n]:
+        lines.append(f"  {format_size(size):>10}  {path}")
+    return "\n".join(lines)
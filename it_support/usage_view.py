@@ -0,0 +1,60 @@
+from tkinter import ttk
+
+from .formatting import format_size
+
+PLACEHOLDER = "placeholder"
+
+
+class UsageTree:
+    # A Treeview over a DiskUsage. Rows for a directory's children are only
+    # created when it is first expanded, so opening a scan of millions of
+    # directories costs no more than the rows actually on screen.
+    def __init__(self, parent, usage, height=20):
+        self.usage = usage
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=("size", "share", "files"), height=height)
+        self.tree.heading("#0", text="Directory")
+        self.tree.heading("size", text="Size")
+        self.tree.heading("share", text="% of parent")
+        self.tree.heading("files", text="Files")
+        self.tree.column("#0", width=420)
+        for column in ("size", "share", "files"):
+            self.tree.column(column, width=100, anchor="e")
+        scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.bind("<<TreeviewOpen>>", self._on_open)
+
+        root = self._insert("", 0, usage.root)
+        self._expand(root)
+        self.tree.item(root, open=True)
+
+    def _insert(self, parent, index, text=None):
+        usage = self.usage
+        up = usage.parent[index]
+        share = usage.total_bytes[index] / usage.total_bytes[up] * 100 if up >= 0 and usage.total_bytes[up] else 100.0
+        item = self.tree.insert(parent, "end", iid=str(index), text=text or usage.names[index],
+                                values=(format_size(usage.total_bytes[index]), f"{share:.1f}%",
+                                        usage.total_files[index]))
+        if usage.child_count(index) or usage.own_files[index]:
+            self.tree.insert(item, "end", iid=f"{index}:{PLACEHOLDER}")
+        return item
+
+    def _expand(self, item):
+        placeholder = f"{item}:{PLACEHOLDER}"
+        if not self.tree.exists(placeholder):
+            return
+        self.tree.delete(placeholder)
+        index = int(item)
+        usage = self.usage
+        for child in usage.children(index):
+            self._insert(item, child)
+        if usage.own_files[index]:
+            # The files directly inside are summarised in a single row
+            share = usage.own_bytes[index] / usage.total_bytes[index] * 100 if usage.total_bytes[index] else 0.0
+            self.tree.insert(item, "end", iid=f"{index}:files", text="(files in this directory)",
+                             values=(format_size(usage.own_bytes[index]), f"{share:.1f}%", usage.own_files[index]))
+
+    def _on_open(self, event):
+        self._expand(self.tree.focus())
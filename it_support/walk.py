@@ -0,0 +1,67 @@
+import os
+import stat
+import threading
+
+
+class Tally:
+    # Thread-safe running total. Walkers add once per directory rather than
+    # once per file, so the lock stays off the hot path.
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.value += count
+
+
+# Regular files seen by every walk in this process, read by the
+# instrumentation layer to report files visited per operation
+files_visited = Tally()
+
+
+def iter_directory(directory, on_error=None):
+    # One level of the walk: yields (entry, stat_result) for regular files
+    # and (entry, None) for subdirectories. Symlinks are never followed, so a
+    # link pointing back up the tree cannot make a walk loop forever.
+    try:
+        it = os.scandir(directory)
+    except OSError as e:
+        if on_error:
+            on_error(directory, e)
+        return
+    seen = 0
+    try:
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield entry, None
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    if on_error:
+                        on_error(entry.path, e)
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    seen += 1
+                    yield entry, st
+    finally:
+        files_visited.add(seen)
+
+
+def iter_files(directory, on_error=None):
+    # Depth-first os.scandir walk yielding (path, stat_result) for regular
+    # files
+    stack = [os.fspath(directory)]
+    while stack:
+        subdirs = []
+        for entry, st in iter_directory(stack.pop(), on_error):
+            if st is None:
+                subdirs.append(entry.path)
+            else:
+                yield entry.path, st
+        # Reverse so subdirectories are visited in the order scandir gave them
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,127 @@
+import os
+
+from it_support.dedupe import Journal, dedupe_groups, undo_dedupe
+from it_support.duplicates import DuplicateGroup
+
+DATA = b"duplicate data\n" * 1000
+
+
+def make_files(tmp_path, *contents):
+    paths = []
+    for number, content in enumerate(contents):
+        path = tmp_path / f"file{number}.bin"
+        path.write_bytes(content)
+        paths.append(str(path))
+    return paths
+
+
+def group_of(paths):
+    return DuplicateGroup(os.path.getsize(paths[0]), "digest", paths)
+
+
+def test_dry_run_changes_nothing(tmp_path):
+    paths = make_files(tmp_path, DATA, DATA, DATA)
+    inodes = [os.stat(path).st_ino for path in paths]
+    result = dedupe_groups([group_of(paths)], dry_run=True, workers=1, journal_path=str(tmp_path / "journal"))
+    assert result.linked == 2
+    assert result.bytes_reclaimed > 0
+    assert result.journal_path is None
+    assert not (tmp_path / "journal").exists()
+    assert [os.stat(path).st_ino for path in paths] == inodes
+
+
+def test_hardlink_replaces_duplicates(tmp_path):
+    paths = make_files(tmp_path, DATA, DATA, DATA)
+    journal = str(tmp_path / "journal")
+    result = dedupe_groups([group_of(paths)], dry_run=False, workers=1, journal_path=journal)
+    assert result.linked == 2
+    assert not result.skipped and not result.errors
+    assert result.journal_path == journal
+    assert len({os.stat(path).st_ino for path in paths}) == 1
+    assert all(open(path, "rb").read() == DATA for path in paths)
+
+
+def test_different_content_is_skipped(tmp_path):
+    other = DATA[:-1] + b"?"
+    paths = make_files(tmp_path, DATA, other)
+    result = dedupe_groups([group_of(paths)], dry_run=False, workers=1, journal_path=str(tmp_path / "journal"))
+    assert result.linked == 0
+    assert [reason for _, reason in result.skipped] == [f"content differs from {paths[0]}"]
+    assert open(paths[1], "rb").read() == other
+
+
+def test_file_changed_since_scan_is_skipped(tmp_path):
+    paths = make_files(tmp_path, DATA, DATA)
+    group = group_of(paths)
+    with open(paths[1], "ab") as f:
+        f.write(b"more")
+    result = dedupe_groups([group], dry_run=False, workers=1, journal_path=str(tmp_path / "journal"))
+    assert result.linked == 0
+    assert result.skipped == [(paths[1], "changed since the scan")]
+
+
+def test_undo_hardlink_restores_own_copies(tmp_path):
+    paths = make_files(tmp_path, DATA, DATA, DATA)
+    os.utime(paths[2], ns=(1_000_000_000, 2_000_000_000))
+    journal = str(tmp_path / "journal")
+    dedupe_groups([group_of(paths)], dry_run=False, workers=1, journal_path=journal)
+    result = undo_dedupe(journal)
+    assert result.linked == 2
+    assert not result.skipped and not result.errors
+    assert len({os.stat(path).st_ino for path in paths}) == 3
+    assert all(open(path, "rb").read() == DATA for path in paths)
+    assert os.stat(paths[2]).st_mtime_ns == 2_000_000_000
+
+
+def test_undo_hardlink_skips_unlinked_file(tmp_path):
+    paths = make_files(tmp_path, DATA, DATA)
+    journal = str(tmp_path / "journal")
+    dedupe_groups([group_of(paths)], dry_run=False, workers=1, journal_path=journal)
+    os.unlink(paths[1])
+    (tmp_path / "file1.bin").write_bytes(b"new file")
+    result = undo_dedupe(journal)
+    assert result.linked == 0
+    assert result.skipped == [(paths[1], "no longer linked to the kept copy")]
+    assert open(paths[1], "rb").read() == b"new file"
+
+
+def reflinked(tmp_path):
+    # What a reflink dedupe leaves behind, without needing a filesystem
+    # that supports clones: a separate copy with the replaced file's times,
+    # and its journal
+    keeper, path = make_files(tmp_path, DATA, DATA)
+    os.utime(path, ns=(1_000_000_000, 2_000_000_000))
+    journal = Journal(str(tmp_path / "journal"), "reflink")
+    journal.record(path, keeper, os.stat(path))
+    journal.close()
+    return keeper, path, journal.path
+
+
+def test_undo_reflink_restores_untouched_file(tmp_path):
+    keeper, path, journal = reflinked(tmp_path)
+    result = undo_dedupe(journal)
+    assert result.linked == 1
+    assert not result.skipped and not result.errors
+    assert open(path, "rb").read() == DATA
+    assert os.stat(path).st_mtime_ns == 2_000_000_000
+
+
+def test_undo_reflink_skips_file_edited_in_place(tmp_path):
+    keeper, path, journal = reflinked(tmp_path)
+    edited = DATA[:-1] + b"!"
+    with open(path, "r+b") as f:
+        f.write(edited)
+    result = undo_dedupe(journal)
+    assert result.linked == 0
+    assert result.skipped == [(path, "changed since the dedupe")]
+    assert open(path, "rb").read() == edited
+
+
+def test_undo_reflink_skips_when_kept_copy_changed(tmp_path):
+    keeper, path, journal = reflinked(tmp_path)
+    with open(keeper, "r+b") as f:
+        f.write(b"X")
+    result = undo_dedupe(journal)
+    assert result.linked == 0
+    assert result.skipped == [(path, f"content differs from {keeper}")]
+    assert open(path, "rb").read() == DATA